@@ -13,9 +13,19 @@ Data Transfer Objects (DTO) - 標準化資料結構
 
 """
 
-from dataclasses import dataclass
+from dataclasses import dataclass, asdict, is_dataclass, field
 from typing import Dict, List, Tuple, Optional, Any, Union
 from datetime import datetime
+import sys
+
+# 大量產生的輸出 DTO 使用 __slots__（需 Python 3.10+，舊版維持一般 dataclass）
+_SLOTS = {"slots": True} if sys.version_info >= (3, 10) else {}
+
+# Caption 預覽文字長度（顯示與日誌用）
+CAPTION_PREVIEW_LENGTH = 100
+
+# 建構時由其他欄位計算的衍生欄位，序列化時不輸出
+_DERIVED_FIELDS = frozenset({"text_preview"})
 
 
 # =============================================================================
@@ -64,7 +74,7 @@ class ProcessingRequest:
 # 輸出 DTO - 子模組回傳給主專案的資料  
 # =============================================================================
 
-@dataclass
+@dataclass(**_SLOTS)
 class CaptionInfo:
     """圖表說明文字資訊"""
     text: str  # Caption 完整文字
@@ -73,9 +83,13 @@ class CaptionInfo:
     caption_type: str  # 類型: "figure", "table", "chart"
     number: str  # 編號: "1", "2.1", etc.
     confidence: float  # 識別信心度 0-1
+    text_preview: str = field(init=False, repr=False, compare=False)  # 前 CAPTION_PREVIEW_LENGTH 字，建立時計算一次
+    
+    def __post_init__(self):
+        self.text_preview = self.text[:CAPTION_PREVIEW_LENGTH]
 
 
-@dataclass 
+@dataclass(**_SLOTS)
 class ContextInfo:
     """內文引用資訊"""
     text: str  # 引用句子
@@ -230,22 +244,17 @@ def create_error_result(file_info: FileInfo, error_message: str,
 
 def dto_to_dict(dto_object) -> Dict[str, Any]:
     """將 DTO 物件轉換為字典，便於 JSON 序列化"""
-    if hasattr(dto_object, '__dict__'):
-        result = {}
-        for key, value in dto_object.__dict__.items():
-            if hasattr(value, '__dict__'):  # 嵌套的 DTO
-                result[key] = dto_to_dict(value)
-            elif isinstance(value, list):
-                result[key] = [dto_to_dict(item) if hasattr(item, '__dict__') else item 
-                              for item in value]
-            elif isinstance(value, datetime):
-                result[key] = value.isoformat()
-            else:
-                result[key] = value
-        return result
+    if is_dataclass(dto_object) and not isinstance(dto_object, type):
+        return asdict(dto_object, dict_factory=_dto_dict_factory)
     return dto_object
 
 
+def _dto_dict_factory(items: List[Tuple[str, Any]]) -> Dict[str, Any]:
+    """asdict 用的字典工廠，將 datetime 轉為 ISO 字串，並略過可由其他欄位推得的衍生欄位"""
+    return {key: value.isoformat() if isinstance(value, datetime) else value
+            for key, value in items if key not in _DERIVED_FIELDS}
+
+
 def create_default_config() -> ProcessingConfig:
     """建立預設配置的便利函式"""
     return ProcessingConfig(
@@ -7,15 +7,45 @@ Caption 和內文關鍵字檢索器 - 階段 A 實作
 3. 建立 Caption 與相關內文段落的對應關係
 """
 
+import os
 import re
-import fitz  # PyMuPDF
-from typing import List, Dict, Tuple, Optional, Any, Set
+import sys
+import hashlib
+import pickle
+import tempfile
+from typing import List, Dict, Tuple, Optional, Any, Set, Iterator, Iterable, Sequence
 from dataclasses import dataclass, field
 from pathlib import Path
 import logging
+from bisect import bisect_right
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from itertools import groupby
 
-from dto import CaptionInfo, ContextInfo, CaptionContextPair
+from dto import CaptionInfo, ContextInfo, CaptionContextPair, CacheConfig
+
+# Hyperscan 為選用套件，未安裝時退回純 re 掃描
+try:
+    import hyperscan
+    HYPERSCAN_AVAILABLE = True
+except ImportError:
+    HYPERSCAN_AVAILABLE = False
+
+# PyMuPDF 延遲載入：只使用 Caption 比對（CaptionPatterns）時不需付出匯入成本
+_fitz_mod = None
+
+
+def _fitz():
+    """延遲匯入 PyMuPDF（1.24 起的正式模組名稱為 pymupdf，舊名 fitz 已棄用）"""
+    global _fitz_mod
+    if _fitz_mod is None:
+        import pymupdf
+        _fitz_mod = pymupdf
+    return _fitz_mod
+
+# 大量建立的資料結構使用 __slots__（需 Python 3.10+，舊版維持一般 dataclass）
+_SLOTS = {"slots": True} if sys.version_info >= (3, 10) else {}
 
 
 # =============================================================================
@@ -28,23 +58,23 @@ class CaptionPatterns:
     # 中文 Caption 模式
     CHINESE_PATTERNS = [
         # 圖 X.Y、表 X.Y 格式
-        r'(?:圖|表|圖表)[\s]*(\d+)(?:\.(\d+))?[\s]*[：:：]\s*(.+?)(?=\n|$)',
-        r'(?:圖|表|圖表)[\s]*(\d+)(?:[.-](\d+))?[\s]*[：:：]\s*(.+?)(?=\n|$)',
+        r'(?:圖|表|圖表)[\s]*(\d+)(?:\.(\d+))?[\s]*[：:：]\s*([^\n]+)',
+        r'(?:圖|表|圖表)[\s]*(\d+)(?:[.-](\d+))?[\s]*[：:：]\s*([^\n]+)',
         
         # Figure X、Table X 格式
-        r'(?:Figure|Table|Fig\.|Tab\.)[\s]*(\d+)(?:\.(\d+))?[\s]*[：:：]?\s*(.+?)(?=\n|$)',
+        r'(?i:Figure|Table|Fig\.|Tab\.)[\s]*(\d+)(?:\.(\d+))?[\s]*[：:：]?\s*([^\n]+)',
         
         # 圖片 X、表格 X 格式
-        r'(?:圖片|表格|圖像)[\s]*(\d+)(?:[.-](\d+))?[\s]*[：:：]\s*(.+?)(?=\n|$)',
+        r'(?:圖片|表格|圖像)[\s]*(\d+)(?:[.-](\d+))?[\s]*[：:：]\s*([^\n]+)',
         
         # 更靈活的格式：圖/表 + 數字 (沒有冒號)
-        r'(?:圖|表)[\s]*(\d+)(?:[.-](\d+))?[\s]+(.+?)(?=(?:\n|$|圖|表|\d))',
+        # 以否定字元類別取代 .+? 與前瞻交替，避免回溯爆炸
+        r'(?:圖|表)\s*(\d+)(?:[.-](\d+))?\s+([^\n圖表\d]+)',
     ]
     
-    # 英文 Caption 模式
+    # 英文 Caption 模式（僅英文關鍵字不分大小寫，涵蓋 FIGURE / TABLE 等全大寫寫法）
     ENGLISH_PATTERNS = [
-        r'(?:Figure|Table|Fig\.|Tab\.)[\s]*(\d+)(?:\.(\d+))?[\s]*[：:：.]?\s*(.+?)(?=\n|$)',
-        r'(?:FIGURE|TABLE|FIG\.|TAB\.)[\s]*(\d+)(?:\.(\d+))?[\s]*[：:：.]?\s*(.+?)(?=\n|$)',
+        r'(?i:Figure|Table|Fig\.|Tab\.)[\s]*(\d+)(?:\.(\d+))?[\s]*[：:：.]?\s*([^\n]+)',
     ]
     
     # 內文引用模式
@@ -55,16 +85,213 @@ class CaptionPatterns:
         r'(?:上|下)[\s]*(?:圖|表)[\s]*(\d+)(?:[.-](\d+))?',
         
         # 英文引用
-        r'(?:see|refer to|as shown in|in)[\s]*(?:Figure|Table|Fig\.|Tab\.)[\s]*(\d+)(?:\.(\d+))?',
-        r'(?:Figure|Table|Fig\.|Tab\.)[\s]*(\d+)(?:\.(\d+))?[\s]*(?:shows|displays|illustrates)',
+        r'(?i:see|refer to|as shown in|in)[\s]*(?i:Figure|Table|Fig\.|Tab\.)[\s]*(\d+)(?:\.(\d+))?',
+        r'(?i:Figure|Table|Fig\.|Tab\.)[\s]*(\d+)(?:\.(\d+))?[\s]*(?i:shows|displays|illustrates)',
     ]
+    
+    # 以下編譯結果於模組載入時建立（見檔案下方），所有擷取器共用
+    COMPILED_CAPTION: Tuple[re.Pattern, ...] = ()
+    COMPILED_REFERENCE: Tuple[re.Pattern, ...] = ()
+    CAPTION_MEGAPATTERN: Optional[re.Pattern] = None
+    CAPTION_GROUP_INDEX: Dict[str, Tuple[int, ...]] = {}
+    REFERENCE_MEGAPATTERN: Optional[re.Pattern] = None
+    REFERENCE_GROUP_INDEX: Dict[str, Tuple[int, ...]] = {}
+    
+    # Hyperscan 資料庫編譯較慢，首次使用時才建立
+    _hyperscan_dbs: Optional[Tuple[Optional[Any], Optional[Any]]] = None
+    
+    @classmethod
+    def hyperscan_dbs(cls) -> Tuple[Optional[Any], Optional[Any]]:
+        """取得 (Caption, 引用) 的 Hyperscan 預篩資料庫，無法使用時為 None"""
+        if cls._hyperscan_dbs is None:
+            cls._hyperscan_dbs = (
+                _build_hyperscan_db(cls.CHINESE_PATTERNS + cls.ENGLISH_PATTERNS),
+                _build_hyperscan_db(cls.REFERENCE_PATTERNS)
+            )
+        return cls._hyperscan_dbs
+    
+    @classmethod
+    def find_caption_match(cls, text: str) -> Optional[Dict[str, str]]:
+        """以合併模式單次比對文字中的 Caption
+        
+        Returns:
+            {"type": 類型, "number": 編號, "title": 標題}，無匹配時為 None
+        """
+        match = cls._match_caption(text)
+        return dict(zip(("type", "number", "title"), match)) if match else None
+    
+    @classmethod
+    @lru_cache(maxsize=4096)
+    def _match_caption(cls, text: str) -> Optional[Tuple[str, str, str]]:
+        """find_caption_match 的比對本體，依 (類別, 文字) 快取
+        
+        同一段 Caption 常重複出現（目錄與內文），快取可省去重複的正規表示式掃描；
+        快取的是不可變的 tuple，回傳給呼叫端的 dict 每次另建，修改不會影響快取。
+        """
+        match = cls.CAPTION_MEGAPATTERN.search(text)
+        return _caption_match_fields(match) if match else None
+    
+    @classmethod
+    def find_caption_matches_in_pages(cls, page_texts: Sequence[str]) -> List[List[Dict[str, str]]]:
+        """批次比對多頁文字中的所有 Caption
+        
+        先以 Hyperscan 預篩整批頁面（共用同一個資料庫與比對回呼），
+        只有可能命中的頁面才以合併模式掃描。
+        
+        Returns:
+            與 page_texts 等長的列表，每頁為 {"type", "number", "title"} 的列表（依出現順序）
+        """
+        caption_db, _ = cls.hyperscan_dbs()
+        hit_pages = _hyperscan_hit_pages(caption_db, page_texts)
+        return [
+            [dict(zip(("type", "number", "title"), _caption_match_fields(match)))
+             for match in cls.CAPTION_MEGAPATTERN.finditer(text)]
+            if index in hit_pages else []
+            for index, text in enumerate(page_texts)
+        ]
+    
+    @classmethod
+    def find_reference_match(cls, text: str) -> Optional[Dict[str, str]]:
+        """以合併模式單次比對文字中的內文引用
+        
+        Returns:
+            {"type": 類型, "number": 編號}，無匹配時為 None
+        """
+        match = cls.REFERENCE_MEGAPATTERN.search(text)
+        if not match:
+            return None
+        
+        group_ids = cls.REFERENCE_GROUP_INDEX[match.lastgroup]
+        number1 = match.group(group_ids[0]) or ""
+        number2 = (match.group(group_ids[1]) or "") if len(group_ids) > 1 else ""
+        type_match = REFERENCE_TYPE_REGEX.search(match.group(0))
+        return {
+            "type": REFERENCE_TYPES[type_match.lastindex - 1] if type_match else "general",
+            "number": f"{number1}.{number2}" if number2 else number1
+        }
+
+
+# 大小寫不敏感以 (?i:...) 限定於英文關鍵字，中文與數字部分不需逐字元大小寫折疊
+_PATTERN_FLAGS = re.MULTILINE
+
+# 同頁文字區塊以此分隔字元串接後一次掃描（\x1e = ASCII Record Separator）
+BLOCK_SEPARATOR = "\x1e"
+
+
+def _isolate_blocks(pattern: str) -> str:
+    """改寫模式使其無法跨越 BLOCK_SEPARATOR（分隔字元屬於空白類別，需明確排除）"""
+    no_sep_space = f"[^\\S{BLOCK_SEPARATOR}]"
+    return (pattern
+            .replace("[\\s]", no_sep_space)
+            .replace("\\s", no_sep_space)
+            .replace("[^\\n", f"[^\\n{BLOCK_SEPARATOR}"))
+
+
+def _build_megapattern(prefix: str, patterns: List[str]) -> Tuple[re.Pattern, Dict[str, Tuple[int, ...]]]:
+    """將多個模式合併為具名群組交替式，並回傳 {群組名稱: 內部擷取群組索引}"""
+    megapattern = re.compile(
+        "|".join(f"(?P<{prefix}{i}>{_isolate_blocks(pattern)})" for i, pattern in enumerate(patterns)),
+        _PATTERN_FLAGS
+    )
+    
+    group_index = {}
+    offset = 1
+    for i, pattern in enumerate(patterns):
+        inner_groups = re.compile(pattern).groups
+        group_index[f"{prefix}{i}"] = tuple(range(offset + 1, offset + 1 + inner_groups))
+        offset += 1 + inner_groups
+    
+    return megapattern, group_index
+
+
+def _build_hyperscan_db(patterns: List[str]) -> Optional[Any]:
+    """建立 Hyperscan 預篩資料庫，無法使用時回傳 None"""
+    if not HYPERSCAN_AVAILABLE or not patterns:
+        return None
+    
+    # 前瞻斷言與惰性量詞不被 Hyperscan 原生支援，以 PREFILTER 模式近似（只會多報、不會漏報）
+    flags = (hyperscan.HS_FLAG_UTF8 | hyperscan.HS_FLAG_UCP |
+             hyperscan.HS_FLAG_MULTILINE | hyperscan.HS_FLAG_PREFILTER | hyperscan.HS_FLAG_SINGLEMATCH)
+    try:
+        db = hyperscan.Database()
+        db.compile(
+            expressions=[pattern.encode("utf-8") for pattern in patterns],
+            ids=list(range(len(patterns))),
+            flags=[flags] * len(patterns)
+        )
+        return db
+    except hyperscan.error as e:
+        logging.getLogger(__name__).warning(f"Hyperscan 編譯失敗，改用 re 掃描: {e}")
+        return None
+
+
+def _caption_match_fields(match: re.Match) -> Tuple[str, str, str]:
+    """由合併模式的匹配結果取出 (類型, 編號, 標題)"""
+    # lastgroup 為命中的外層具名群組，據此取回該模式的 (主編號, 次編號, 標題)
+    number1, number2, title = match.group(*CaptionPatterns.CAPTION_GROUP_INDEX[match.lastgroup][:3])
+    type_match = CAPTION_TYPE_REGEX.search(match.group(0))
+    return (
+        CAPTION_TYPES[type_match.lastindex - 1] if type_match else "figure",
+        f"{number1}.{number2}" if number2 else (number1 or ""),
+        (title or "").strip()
+    )
+
+
+def _record_hit(pattern_id: int, start: int, end: int, flags: int, context: Tuple[Set[int], int]) -> None:
+    """Hyperscan 比對回呼：記錄命中的頁面索引"""
+    hit_pages, page_index = context
+    hit_pages.add(page_index)
+
+
+def _hyperscan_hit_pages(hs_db: Optional[Any], texts: Sequence[str]) -> Set[int]:
+    """回傳可能命中的文字索引集合；未啟用 Hyperscan 時視為全部可能命中"""
+    if hs_db is None:
+        return set(range(len(texts)))
+    
+    hit_pages: Set[int] = set()
+    for index, text in enumerate(texts):
+        hs_db.scan(text.encode("utf-8"), match_event_handler=_record_hit, context=(hit_pages, index))
+    return hit_pages
+
+
+# 編譯一次，供所有 CaptionExtractor / PDFCaptionContextProcessor 共用
+CaptionPatterns.COMPILED_CAPTION = tuple(
+    re.compile(pattern, _PATTERN_FLAGS)
+    for pattern in CaptionPatterns.CHINESE_PATTERNS + CaptionPatterns.ENGLISH_PATTERNS
+)
+CaptionPatterns.COMPILED_REFERENCE = tuple(
+    re.compile(pattern, _PATTERN_FLAGS) for pattern in CaptionPatterns.REFERENCE_PATTERNS
+)
+CaptionPatterns.CAPTION_MEGAPATTERN, CaptionPatterns.CAPTION_GROUP_INDEX = _build_megapattern(
+    "c", CaptionPatterns.CHINESE_PATTERNS + CaptionPatterns.ENGLISH_PATTERNS
+)
+CaptionPatterns.REFERENCE_MEGAPATTERN, CaptionPatterns.REFERENCE_GROUP_INDEX = _build_megapattern(
+    "r", CaptionPatterns.REFERENCE_PATTERNS
+)
+
+# 類型判斷：以最左側出現的關鍵字決定，同位置時「圖表」優先於「圖」
+CAPTION_TYPE_REGEX = re.compile(r'(chart|圖表)|(圖片|圖像|figure|fig\.|圖)|(表格|table|tab\.|表)', re.IGNORECASE)
+CAPTION_TYPES = ("chart", "figure", "table")
+
+REFERENCE_TYPE_REGEX = re.compile(r'(figure|fig\.|圖)|(table|tab\.|表)', re.IGNORECASE)
+REFERENCE_TYPES = ("figure", "table")
+
+# 快速子字串過濾：所有 Caption 與引用模式都必須含有以下其一（區分大小寫，不需建立小寫副本）
+# "Fig" 涵蓋 Figure / Fig.，"FIG" 涵蓋 FIGURE / FIG.，"Tab" / "tab" / "TAB" 同理；
+# "圖" 涵蓋圖表 / 圖片 / 圖像。大小寫混雜的寫法（如 "fIgure"）不在涵蓋範圍內
+CAPTION_KEYWORDS = ("圖", "表", "Fig", "fig", "FIG", "Tab", "tab", "TAB")
+
+
+def _has_caption_keyword(text: str) -> bool:
+    """判斷文字是否可能含有 Caption 或引用，不含關鍵字者可直接略過正規表示式掃描"""
+    return any(keyword in text for keyword in CAPTION_KEYWORDS)
 
 
 # =============================================================================
 # 資料結構
 # =============================================================================
 
-@dataclass
+@dataclass(**_SLOTS)
 class TextBlock:
     """文字區塊"""
     text: str
@@ -75,7 +302,7 @@ class TextBlock:
     is_bold: bool = False
 
 
-@dataclass
+@dataclass(**_SLOTS)
 class CaptionCandidate:
     """Caption 候選項"""
     text: str
@@ -87,7 +314,7 @@ class CaptionCandidate:
     font_info: Dict[str, Any] = field(default_factory=dict)
 
 
-@dataclass
+@dataclass(**_SLOTS)
 class ReferenceMatch:
     """內文引用匹配結果"""
     text: str
@@ -99,6 +326,116 @@ class ReferenceMatch:
     confidence: float = 0.0
 
 
+# =============================================================================
+# 逐頁文字擷取
+# =============================================================================
+
+# 頁數達此門檻才啟用多行程擷取，小檔案的行程啟動成本高於收益
+PARALLEL_PAGE_THRESHOLD = 16
+PAGE_CHUNK_SIZE = 4
+
+# 擷取文字的旗標：不解碼圖像區塊；與 get_text() 純文字模式的預設旗標相同，
+# 因此同一個 TextPage 可同時用於區塊擷取與整頁純文字（首次使用時才載入 PyMuPDF 取得常數）
+@lru_cache(maxsize=1)
+def page_text_flags() -> int:
+    return _fitz().TEXTFLAGS_DICT & ~_fitz().TEXT_PRESERVE_IMAGES
+
+
+def _extract_page_blocks(page: "fitz.Page", page_number: int, need_font_info: bool,
+                         textpage: Optional["fitz.TextPage"] = None
+                         ) -> List[Tuple[str, int, Tuple[float, float, float, float], float, str, bool]]:
+    """擷取單頁文字區塊，回傳可序列化的 TextBlock 欄位 tuple
+    
+    textpage: 已解析的 TextPage（以 page_text_flags() 建立）；傳入時直接沿用，
+              同一頁的其他 get_text 呼叫不必再解析一次頁面內容
+    """
+    page_blocks = []
+    
+    if not need_font_info:
+        # "blocks" 模式直接回傳 (x0, y0, x1, y1, text, block_no, block_type)
+        for x0, y0, x1, y1, text, _, block_type in page.get_text(
+                "blocks", flags=page_text_flags(), sort=False, textpage=textpage):
+            if block_type != 0 or not text.strip():  # 跳過圖像區塊
+                continue
+            page_blocks.append((text.strip(), page_number, (x0, y0, x1, y1), 0.0, "", False))
+        return page_blocks
+    
+    # 獲取文字區塊，包含字體資訊（不解碼圖像區塊；正規表示式比對不依賴閱讀順序，免排序）
+    blocks = page.get_text("dict", flags=page_text_flags(), sort=False, textpage=textpage)
+    
+    for block in blocks.get("blocks", []):
+        if "lines" not in block:  # 跳過圖像區塊
+            continue
+        
+        # 一次 join 組合整個區塊文字，避免逐段 += 的重複配置
+        block_text = "\n".join(
+            "".join(span["text"] for span in line["spans"])
+            for line in block["lines"]
+        )
+        bbox = block["bbox"]
+        
+        # 以第一個 span 的字體資訊代表整個區塊
+        first_span = next((span for line in block["lines"] for span in line["spans"]), {})
+        font_info = {
+            "font": first_span.get("font", ""),
+            "size": first_span.get("size", 0),
+            "flags": first_span.get("flags", 0)
+        }
+        
+        if block_text.strip():
+            page_blocks.append((
+                block_text.strip(),
+                page_number,
+                tuple(bbox),
+                font_info.get("size", 0),
+                font_info.get("font", ""),
+                bool(font_info.get("flags", 0) & 2**4)  # Bold flag
+            ))
+    
+    return page_blocks
+
+
+def _extract_one_page(args: Tuple[str, int, bool]) -> List[Tuple]:
+    """行程池工作函式：重新開啟 PDF 並擷取指定頁（頁索引從 0 開始）"""
+    pdf_path, page_index, need_font_info = args
+    with _fitz().open(pdf_path, filetype="pdf") as pdf_doc:
+        return _extract_page_blocks(pdf_doc.load_page(page_index), page_index + 1, need_font_info)
+
+
+# =============================================================================
+# Caption 比對熱迴圈
+# =============================================================================
+
+def _scan_caption_matches(page_text: str, offsets: List[int],
+                          min_caption_length: int) -> List[Tuple[int, str, str, str]]:
+    """掃描整頁文字，回傳 (區塊索引, 編號, Caption 文字, 完整匹配文字) 元組列表
+    
+    熱迴圈內只處理字串與元組，區域變數綁定查詢目標；
+    dataclass 的建立留給呼叫端在迴圈外完成。
+    """
+    results = []
+    append = results.append
+    group_index = CaptionPatterns.CAPTION_GROUP_INDEX
+    
+    for match in CaptionPatterns.CAPTION_MEGAPATTERN.finditer(page_text):
+        group_ids = group_index[match.lastgroup]
+        if len(group_ids) < 3:
+            continue
+        
+        number1, number2, caption_text = match.group(*group_ids[:3])
+        caption_text = (caption_text or "").strip()
+        
+        # 跳過太短的 Caption
+        if len(caption_text) < min_caption_length:
+            continue
+        
+        # 組合編號
+        number = f"{number1}.{number2}" if number2 else (number1 or "")
+        append((bisect_right(offsets, match.start()) - 1, number, caption_text, match.group(0)))
+    
+    return results
+
+
 # =============================================================================
 # Caption 擷取器
 # =============================================================================
@@ -111,78 +448,78 @@ class CaptionExtractor:
                  min_caption_length: int = 5,
                  confidence_threshold: float = 0.3):
         self.context_window = context_window
+        self._ctx_half = context_window // 2  # 上下文左右各取的字元數
         self.min_caption_length = min_caption_length
         self.confidence_threshold = confidence_threshold
         self.logger = logging.getLogger(__name__)
         
-        # 編譯正則表達式以提高效能
-        self._compile_patterns()
-    
-    def _compile_patterns(self):
-        """編譯所有正則表達式模式"""
-        self.caption_patterns = []
-        self.reference_patterns = []
-        
-        # 編譯 Caption 模式
-        for pattern in CaptionPatterns.CHINESE_PATTERNS + CaptionPatterns.ENGLISH_PATTERNS:
-            try:
-                self.caption_patterns.append(re.compile(pattern, re.IGNORECASE | re.MULTILINE))
-            except re.error as e:
-                self.logger.warning(f"無效的 Caption 模式: {pattern}, 錯誤: {e}")
-        
-        # 編譯引用模式
-        for pattern in CaptionPatterns.REFERENCE_PATTERNS:
-            try:
-                self.reference_patterns.append(re.compile(pattern, re.IGNORECASE | re.MULTILINE))
-            except re.error as e:
-                self.logger.warning(f"無效的引用模式: {pattern}, 錯誤: {e}")
-    
-    def extract_text_blocks(self, pdf_path: str) -> List[TextBlock]:
-        """從 PDF 中提取文字區塊，保留格式資訊"""
+        # 共用模組層級預先編譯的模式（保留屬性名稱供外部檢視）
+        self.caption_patterns = CaptionPatterns.COMPILED_CAPTION
+        self.reference_patterns = CaptionPatterns.COMPILED_REFERENCE
+    
+    @staticmethod
+    def _may_match(hs_db: Optional[Any], text: str) -> bool:
+        """以 Hyperscan 判斷文字是否可能命中，未啟用時一律回傳 True"""
+        if hs_db is None:
+            return True
+        
+        hits = []
+        hs_db.scan(text.encode("utf-8"), match_event_handler=lambda *args: hits.append(args[0]))
+        return bool(hits)
+    
+    def extract_page_text_blocks(self, page: "fitz.Page", page_number: int,
+                                 need_font_info: bool = True,
+                                 textpage: Optional["fitz.TextPage"] = None) -> List[TextBlock]:
+        """從已開啟的單一頁面提取文字區塊（頁碼從 1 開始），可沿用呼叫端已解析的 TextPage"""
+        return [TextBlock(*fields) for fields in _extract_page_blocks(page, page_number, need_font_info, textpage)]
+    
+    def extract_text_blocks(self, pdf_path: str, need_font_info: bool = True,
+                            pages: Optional[Iterable[int]] = None) -> List[TextBlock]:
+        """從 PDF 中提取文字區塊，保留格式資訊
+        
+        頁數達 PARALLEL_PAGE_THRESHOLD 時以多行程逐頁擷取後依頁序合併。
+        
+        Args:
+            pdf_path: PDF 檔案路徑
+            need_font_info: 是否需要字體資訊；不需要時改用較快的 "blocks" 模式，
+                            字體大小與名稱以預設值填入
+            pages: 只擷取指定頁（頁碼從 1 開始，超出範圍者忽略）；None 表示全部頁面
+        """
         text_blocks = []
         
         try:
-            pdf_doc = fitz.open(pdf_path)
+            pdf_doc = _fitz().open(pdf_path, filetype="pdf")
+            page_count = len(pdf_doc)
+            if pages is None:
+                page_indices = range(page_count)
+            else:
+                page_indices = sorted({page - 1 for page in pages if 1 <= page <= page_count})
             
-            for page_num in range(len(pdf_doc)):
-                page = pdf_doc.load_page(page_num)
-                
-                # 獲取文字區塊，包含字體資訊
-                blocks = page.get_text("dict")
+            if len(page_indices) < PARALLEL_PAGE_THRESHOLD:
+                # 全部頁面時直接迭代文件；只有指定的頁面子集才以 load_page 逐頁載入
+                if pages is None:
+                    numbered_pages = enumerate(pdf_doc, 1)
+                else:
+                    numbered_pages = ((page_index + 1, pdf_doc.load_page(page_index)) for page_index in page_indices)
+                for page_num, page in numbered_pages:
+                    text_blocks.extend(
+                        TextBlock(*fields) for fields in _extract_page_blocks(page, page_num, need_font_info)
+                    )
+                pdf_doc.close()
+            else:
+                pdf_doc.close()
                 
-                for block in blocks.get("blocks", []):
-                    if "lines" not in block:  # 跳過圖像區塊
-                        continue
-                    
-                    block_text = ""
-                    bbox = block["bbox"]
-                    font_info = {}
-                    
-                    # 提取行文字
-                    for line in block["lines"]:
-                        line_text = ""
-                        for span in line["spans"]:
-                            line_text += span["text"]
-                            # 記錄字體資訊
-                            if not font_info:
-                                font_info = {
-                                    "font": span.get("font", ""),
-                                    "size": span.get("size", 0),
-                                    "flags": span.get("flags", 0)
-                                }
-                        block_text += line_text + "\n"
-                    
-                    if block_text.strip():
-                        text_blocks.append(TextBlock(
-                            text=block_text.strip(),
-                            page_number=page_num + 1,
-                            bbox=tuple(bbox),
-                            font_size=font_info.get("size", 0),
-                            font_name=font_info.get("font", ""),
-                            is_bold=bool(font_info.get("flags", 0) & 2**4)  # Bold flag
-                        ))
-            
-            pdf_doc.close()
+                # "dict" 模式大量建立 Python 物件，受 GIL 限制，因此使用行程而非執行緒；
+                # 每個工作行程處理 PAGE_CHUNK_SIZE 頁，行程數不超過分塊數
+                max_workers = min(os.cpu_count() or 1, -(-len(page_indices) // PAGE_CHUNK_SIZE))
+                with ProcessPoolExecutor(max_workers=max_workers) as executor:
+                    page_results = executor.map(
+                        _extract_one_page,
+                        [(pdf_path, page_index, need_font_info) for page_index in page_indices],
+                        chunksize=PAGE_CHUNK_SIZE
+                    )
+                    for page_blocks in page_results:
+                        text_blocks.extend(TextBlock(*fields) for fields in page_blocks)
             
         except Exception as e:
             self.logger.error(f"提取文字區塊時發生錯誤: {e}")
@@ -190,49 +527,48 @@ class CaptionExtractor:
         
         return text_blocks
     
+    @staticmethod
+    def _iter_page_texts(text_blocks: List[TextBlock]) -> Iterator[Tuple[List[TextBlock], str, List[int]]]:
+        """依頁分組文字區塊，回傳 (區塊列表, 以分隔字元串接的整頁文字, 各區塊起始位移)
+        
+        不含任何 CAPTION_KEYWORDS 的區塊（多數內文段落）不納入掃描。
+        """
+        for _, group in groupby(text_blocks, key=lambda block: block.page_number):
+            page_blocks = [block for block in group if _has_caption_keyword(block.text)]
+            if not page_blocks:
+                continue
+            offsets = [0]
+            for block in page_blocks[:-1]:
+                offsets.append(offsets[-1] + len(block.text) + len(BLOCK_SEPARATOR))
+            yield page_blocks, BLOCK_SEPARATOR.join(block.text for block in page_blocks), offsets
+    
     def identify_captions(self, text_blocks: List[TextBlock]) -> List[CaptionCandidate]:
         """識別 Caption 候選項"""
         caption_candidates = []
+        caption_hs_db, _ = CaptionPatterns.hyperscan_dbs()
         
-        for block in text_blocks:
-            # 對每個文字區塊應用 Caption 模式
-            for pattern in self.caption_patterns:
-                matches = pattern.finditer(block.text)
+        for page_blocks, page_text, offsets in self._iter_page_texts(text_blocks):
+            if not self._may_match(caption_hs_db, page_text):
+                continue
+            
+            # 以合併模式一次掃描整頁文字，再依位移表對回文字區塊
+            for block_index, number, caption_text, match_text in _scan_caption_matches(
+                    page_text, offsets, self.min_caption_length):
+                block = page_blocks[block_index]
                 
-                for match in matches:
-                    # 提取匹配結果
-                    groups = match.groups()
-                    if len(groups) >= 3:
-                        number1 = groups[0] if groups[0] else ""
-                        number2 = groups[1] if groups[1] else ""
-                        caption_text = groups[2] if groups[2] else ""
-                        
-                        # 組合編號
-                        number = f"{number1}.{number2}" if number2 else number1
-                        
-                        # 跳過太短的 Caption
-                        if len(caption_text.strip()) < self.min_caption_length:
-                            continue
-                        
-                        # 判斷 Caption 類型
-                        caption_type = self._determine_caption_type(match.group(0))
-                        
-                        # 計算信心度
-                        confidence = self._calculate_caption_confidence(block, match.group(0))
-                        
-                        caption_candidates.append(CaptionCandidate(
-                            text=caption_text.strip(),
-                            page_number=block.page_number,
-                            position=block.bbox,
-                            caption_type=caption_type,
-                            number=number,
-                            confidence=confidence,
-                            font_info={
-                                "font_name": block.font_name,
-                                "font_size": block.font_size,
-                                "is_bold": block.is_bold
-                            }
-                        ))
+                caption_candidates.append(CaptionCandidate(
+                    text=caption_text,
+                    page_number=block.page_number,
+                    position=block.bbox,
+                    caption_type=self._determine_caption_type(match_text),
+                    number=number,
+                    confidence=self._calculate_caption_confidence(block, match_text),
+                    font_info={
+                        "font_name": block.font_name,
+                        "font_size": block.font_size,
+                        "is_bold": block.is_bold
+                    }
+                ))
         
         # 去重和排序
         caption_candidates = self._deduplicate_captions(caption_candidates)
@@ -245,44 +581,56 @@ class CaptionExtractor:
         """在內文中尋找對 Caption 的引用"""
         references = []
         
-        # 建立 Caption 編號索引
-        caption_numbers = {f"{cap.caption_type}_{cap.number}" for cap in captions}
-        caption_numbers.update({cap.number for cap in captions})
+        # 單次走訪建立 Caption 編號索引與主編號索引（"2.1" -> "2"）
+        caption_numbers: Set[str] = set()
+        caption_tokens: Set[str] = set()
+        for cap in captions:
+            caption_numbers.add(cap.number)
+            caption_numbers.add(f"{cap.caption_type}_{cap.number}")
+            caption_tokens.add(cap.number)
+            caption_tokens.add(cap.number.split('.', 1)[0])
+        
+        _, reference_hs_db = CaptionPatterns.hyperscan_dbs()
         
-        for block in text_blocks:
-            # 對每個文字區塊應用引用模式
-            for pattern in self.reference_patterns:
-                matches = pattern.finditer(block.text)
+        for page_blocks, page_text, offsets in self._iter_page_texts(text_blocks):
+            if not self._may_match(reference_hs_db, page_text):
+                continue
+            
+            # 以合併模式一次掃描整頁文字，再依位移表對回文字區塊
+            for match in CaptionPatterns.REFERENCE_MEGAPATTERN.finditer(page_text):
+                group_ids = CaptionPatterns.REFERENCE_GROUP_INDEX[match.lastgroup]
+                if not group_ids:
+                    continue
+                
+                number1 = match.group(group_ids[0]) or ""
+                number2 = (match.group(group_ids[1]) or "") if len(group_ids) > 1 else ""
+                
+                # 組合編號
+                ref_number = f"{number1}.{number2}" if number2 else number1
                 
-                for match in matches:
-                    groups = match.groups()
-                    if len(groups) >= 1:
-                        number1 = groups[0] if groups[0] else ""
-                        number2 = groups[1] if len(groups) > 1 and groups[1] else ""
-                        
-                        # 組合編號
-                        ref_number = f"{number1}.{number2}" if number2 else number1
-                        
-                        # 檢查是否有對應的 Caption
-                        if ref_number in caption_numbers or any(ref_number in num for num in caption_numbers):
-                            # 擷取上下文
-                            context = self._extract_context(block.text, match.start(), match.end())
-                            
-                            # 判斷引用類型
-                            ref_type = self._determine_reference_type(match.group(0))
-                            
-                            # 計算信心度
-                            confidence = self._calculate_reference_confidence(match.group(0), context)
-                            
-                            references.append(ReferenceMatch(
-                                text=match.group(0),
-                                page_number=block.page_number,
-                                reference_type=ref_type,
-                                reference_number=ref_number,
-                                surrounding_context=context,
-                                position=block.bbox,
-                                confidence=confidence
-                            ))
+                # 先以集合查詢排除沒有對應 Caption 的引用，再進行區塊定位與上下文擷取
+                if ref_number not in caption_numbers and ref_number.split('.', 1)[0] not in caption_tokens:
+                    continue
+                
+                block_index = bisect_right(offsets, match.start()) - 1
+                block = page_blocks[block_index]
+                block_offset = offsets[block_index]
+                ref_text = match.group(0)
+                
+                # 擷取上下文
+                context = self._extract_context(
+                    block.text, match.start() - block_offset, match.end() - block_offset
+                )
+                
+                references.append(ReferenceMatch(
+                    text=ref_text,
+                    page_number=block.page_number,
+                    reference_type=self._determine_reference_type(ref_text),
+                    reference_number=ref_number,
+                    surrounding_context=context,
+                    position=block.bbox,
+                    confidence=self._calculate_reference_confidence(ref_text, context)
+                ))
         
         return references
     
@@ -292,23 +640,27 @@ class CaptionExtractor:
         """將 Caption 與內文引用配對"""
         pairs = []
         
-        # 按 Caption 分組引用
-        caption_refs = defaultdict(list)
+        # 建立 Caption 索引：完整編號 -> 索引；(類型, 主編號) -> 索引
+        by_number: Dict[str, List[int]] = defaultdict(list)
+        by_type_major: Dict[Tuple[str, str], List[int]] = defaultdict(list)
+        for idx, caption in enumerate(captions):
+            by_number[caption.number].append(idx)
+            by_type_major[(caption.caption_type, caption.number.split('.', 1)[0])].append(idx)
+        
+        # 按 Caption 索引分組引用
+        caption_refs: Dict[int, List[ReferenceMatch]] = defaultdict(list)
         
         for ref in references:
-            # 尋找匹配的 Caption
-            matching_captions = [
-                cap for cap in captions 
-                if self._is_matching_caption(cap, ref)
-            ]
+            # 編號完全相同或同類型同主編號者即匹配（與 _is_matching_caption 規則一致）
+            matched = set(by_number.get(ref.reference_number, ()))
+            matched.update(by_type_major.get((ref.reference_type, ref.reference_number.split('.', 1)[0]), ()))
             
-            for caption in matching_captions:
-                caption_refs[id(caption)].append(ref)
+            for idx in matched:
+                caption_refs[idx].append(ref)
         
         # 建立配對結果
-        for caption in captions:
-            caption_id = id(caption)
-            matched_refs = caption_refs.get(caption_id, [])
+        for idx, caption in enumerate(captions):
+            matched_refs = caption_refs.get(idx, [])
             
             # 轉換為 DTO 格式
             caption_info = CaptionInfo(
@@ -352,16 +704,8 @@ class CaptionExtractor:
     
     def _determine_caption_type(self, caption_text: str) -> str:
         """判斷 Caption 類型"""
-        caption_lower = caption_text.lower()
-        
-        if any(word in caption_lower for word in ['圖', 'figure', 'fig.', '圖片', '圖像']):
-            return "figure"
-        elif any(word in caption_lower for word in ['表', 'table', 'tab.', '表格']):
-            return "table"
-        elif any(word in caption_lower for word in ['chart', '圖表']):
-            return "chart"
-        else:
-            return "figure"  # 預設為圖片
+        match = CAPTION_TYPE_REGEX.search(caption_text)
+        return CAPTION_TYPES[match.lastindex - 1] if match else "figure"  # 預設為圖片
     
     def _calculate_caption_confidence(self, block: TextBlock, match_text: str) -> float:
         """計算 Caption 的信心度"""
@@ -391,14 +735,8 @@ class CaptionExtractor:
     
     def _determine_reference_type(self, ref_text: str) -> str:
         """判斷引用類型"""
-        ref_lower = ref_text.lower()
-        
-        if any(word in ref_lower for word in ['圖', 'figure', 'fig.']):
-            return "figure"
-        elif any(word in ref_lower for word in ['表', 'table', 'tab.']):
-            return "table"
-        else:
-            return "general"
+        match = REFERENCE_TYPE_REGEX.search(ref_text)
+        return REFERENCE_TYPES[match.lastindex - 1] if match else "general"
     
     def _calculate_reference_confidence(self, ref_text: str, context: str) -> float:
         """計算引用的信心度"""
@@ -416,10 +754,7 @@ class CaptionExtractor:
     
     def _extract_context(self, text: str, start_pos: int, end_pos: int) -> str:
         """擷取指定位置周圍的上下文"""
-        context_start = max(0, start_pos - self.context_window // 2)
-        context_end = min(len(text), end_pos + self.context_window // 2)
-        
-        return text[context_start:context_end].strip()
+        return text[max(0, start_pos - self._ctx_half):min(len(text), end_pos + self._ctx_half)].strip()
     
     def _is_matching_caption(self, caption: CaptionCandidate, reference: ReferenceMatch) -> bool:
         """檢查 Caption 和引用是否匹配"""
@@ -427,13 +762,12 @@ class CaptionExtractor:
         if caption.number == reference.reference_number:
             return True
         
-        # 類型匹配檢查
-        if caption.caption_type == reference.reference_type:
-            # 更寬鬆的編號匹配
-            if caption.number in reference.reference_number or reference.reference_number in caption.number:
-                return True
+        # 類型不同即不匹配
+        if caption.caption_type != reference.reference_type:
+            return False
         
-        return False
+        # 同類型時比較主編號（"2.1" 與 "2" 視為匹配）
+        return caption.number.split('.', 1)[0] == reference.reference_number.split('.', 1)[0]
     
     def _calculate_pairing_confidence(self, caption: CaptionCandidate, 
                                     references: List[ReferenceMatch]) -> float:
@@ -468,64 +802,109 @@ class CaptionExtractor:
         return "\n\n".join(combined_parts)
     
     def _deduplicate_captions(self, captions: List[CaptionCandidate]) -> List[CaptionCandidate]:
-        """去除重複的 Caption"""
-        seen = set()
-        deduplicated = []
+        """去除重複的 Caption（dict 保留插入順序，保留每個鍵的第一筆）"""
+        deduplicated: Dict[Tuple[int, str, str], CaptionCandidate] = {}
         
         for caption in captions:
             key = (caption.page_number, caption.number, caption.text[:50])  # 使用前50字符避免完全相同
-            if key not in seen:
-                seen.add(key)
-                deduplicated.append(caption)
+            if key not in deduplicated:
+                deduplicated[key] = caption
         
-        return deduplicated
+        return list(deduplicated.values())
 
 
 # =============================================================================
 # 主要處理介面
 # =============================================================================
 
+@lru_cache(maxsize=1)
+def _pairs_code_digest() -> str:
+    """產生配對結果的程式碼（本模組與 DTO 模組原始碼）的雜湊
+    
+    納入快取鍵，擷取、比對或配對邏輯與 DTO 結構一有變更，舊快取即自動失效。
+    """
+    hasher = hashlib.blake2b(digest_size=16)
+    for module_name in (__name__, CaptionInfo.__module__):
+        hasher.update(Path(sys.modules[module_name].__file__).read_bytes())
+    return hasher.hexdigest()
+
+
 class PDFCaptionContextProcessor:
     """PDF Caption 和上下文處理器 - 階段 A 的主要介面"""
     
     def __init__(self, 
                  context_window: int = 200,
                  min_caption_length: int = 5,
-                 confidence_threshold: float = 0.3):
+                 confidence_threshold: float = 0.3,
+                 cache_config: Optional[CacheConfig] = None):
         self.extractor = CaptionExtractor(
             context_window=context_window,
             min_caption_length=min_caption_length,
             confidence_threshold=confidence_threshold
         )
+        self.cache_config = cache_config
         self.logger = logging.getLogger(__name__)
     
-    def process_pdf(self, pdf_path: str) -> List[CaptionContextPair]:
-        """處理單個 PDF 檔案，回傳 Caption-Context 配對結果"""
+    def _get_cache_path(self, pdf_path: str,
+                        pages: Optional[Tuple[int, ...]] = None) -> Optional[Path]:
+        """以檔案內容、程式碼版本、擷取參數與頁面範圍的 BLAKE2b 雜湊作為快取鍵；未啟用快取時回傳 None"""
+        if self.cache_config is None or not self.cache_config.enabled:
+            return None
+        
+        hasher = hashlib.blake2b(Path(pdf_path).read_bytes(), digest_size=16)
+        # 擷取參數不同時結果不同，一併納入快取鍵；程式碼變更時以原始碼雜湊讓舊快取失效
+        hasher.update(repr((
+            _pairs_code_digest(),
+            self.extractor.context_window,
+            self.extractor.min_caption_length,
+            self.extractor.confidence_threshold
+        )).encode("utf-8"))
+        if pages is not None:
+            hasher.update(repr(pages).encode("utf-8"))
+        return Path(self.cache_config.cache_directory) / f"{hasher.hexdigest()}.pkl"
+    
+    def process_pdf(self, pdf_path: str,
+                    pages: Optional[Iterable[int]] = None) -> List[CaptionContextPair]:
+        """處理單個 PDF 檔案，回傳 Caption-Context 配對結果
+        
+        提供 cache_config 且啟用時，相同內容的 PDF 直接讀取快取結果。
+        
+        Args:
+            pdf_path: PDF 檔案路徑
+            pages: 只處理指定頁（頁碼從 1 開始）；內文引用也只在這些頁中搜尋
+        """
+        if pages is not None:
+            pages = tuple(sorted(set(pages)))
+        
         try:
             self.logger.info(f"開始處理 PDF: {pdf_path}")
             
-            # 步驟 1: 提取文字區塊
-            text_blocks = self.extractor.extract_text_blocks(pdf_path)
-            self.logger.info(f"提取到 {len(text_blocks)} 個文字區塊")
+            cache_path = self._get_cache_path(pdf_path, pages)
+            if cache_path is not None and cache_path.exists():
+                try:
+                    cached_pairs = pickle.loads(cache_path.read_bytes())
+                    self.logger.info(f"使用快取結果: {cache_path}")
+                    return cached_pairs
+                except Exception as e:
+                    self.logger.warning(f"讀取快取失敗，重新處理: {e}")
             
-            # 步驟 2: 識別 Caption
-            captions = self.extractor.identify_captions(text_blocks)
-            self.logger.info(f"識別到 {len(captions)} 個 Caption 候選項")
-            
-            # 步驟 3: 尋找內文引用
-            references = self.extractor.find_references(text_blocks, captions)
-            self.logger.info(f"找到 {len(references)} 個內文引用")
-            
-            # 步驟 4: 配對 Caption 與引用
-            pairs = self.extractor.pair_captions_with_contexts(captions, references)
+            # 步驟 1: 提取文字區塊（未指定頁面時擷取全部）
+            text_blocks = self.extractor.extract_text_blocks(pdf_path, pages=pages)
+            self.logger.info(f"提取到 {len(text_blocks)} 個文字區塊")
             
-            # 過濾低信心度結果
-            filtered_pairs = [
-                pair for pair in pairs 
-                if pair.pairing_confidence >= self.extractor.confidence_threshold
-            ]
+            # 步驟 2-4: 識別 Caption、尋找內文引用並配對
+            filtered_pairs = self.process_text_blocks(text_blocks)
             
-            self.logger.info(f"生成 {len(filtered_pairs)} 個高品質配對結果")
+            if cache_path is not None:
+                try:
+                    cache_path.parent.mkdir(parents=True, exist_ok=True)
+                    # 先寫入暫存檔再替換，避免中斷時留下不完整的快取；
+                    # 暫存檔名唯一，多個 xdist worker 或執行緒共用快取目錄時不會互相覆寫
+                    with tempfile.NamedTemporaryFile(dir=cache_path.parent, suffix=".tmp", delete=False) as temp_file:
+                        temp_file.write(pickle.dumps(filtered_pairs, protocol=pickle.HIGHEST_PROTOCOL))
+                    os.replace(temp_file.name, cache_path)
+                except Exception as e:
+                    self.logger.warning(f"寫入快取失敗: {e}")
             
             return filtered_pairs
             
@@ -533,6 +912,32 @@ class PDFCaptionContextProcessor:
             self.logger.error(f"處理 PDF 時發生錯誤: {e}")
             raise
     
+    def process_text_blocks(self, text_blocks: List[TextBlock]) -> List[CaptionContextPair]:
+        """對已擷取的文字區塊進行 Caption 識別、引用搜尋與配對
+        
+        供已自行開啟 PDF 的呼叫端使用，避免重複解析同一份檔案。
+        """
+        # 步驟 2: 識別 Caption
+        captions = self.extractor.identify_captions(text_blocks)
+        self.logger.info(f"識別到 {len(captions)} 個 Caption 候選項")
+        
+        # 步驟 3: 尋找內文引用
+        references = self.extractor.find_references(text_blocks, captions)
+        self.logger.info(f"找到 {len(references)} 個內文引用")
+        
+        # 步驟 4: 配對 Caption 與引用
+        pairs = self.extractor.pair_captions_with_contexts(captions, references)
+        
+        # 過濾低信心度結果
+        filtered_pairs = [
+            pair for pair in pairs 
+            if pair.pairing_confidence >= self.extractor.confidence_threshold
+        ]
+        
+        self.logger.info(f"生成 {len(filtered_pairs)} 個高品質配對結果")
+        
+        return filtered_pairs
+    
     def get_processing_stats(self, pairs: List[CaptionContextPair]) -> Dict[str, Any]:
         """取得處理統計資訊"""
         if not pairs:
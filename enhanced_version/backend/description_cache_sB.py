@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+階段B：描述結果快取 - 以請求內容雜湊為鍵，避免重複呼叫LLM
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from dataclasses import asdict
+from typing import Any, Dict, Optional
+
+# diskcache 為選用套件，未安裝時使用標準庫的 SQLite 快取
+try:
+    import diskcache
+    DISKCACHE_AVAILABLE = True
+except ImportError:
+    DISKCACHE_AVAILABLE = False
+
+# 預設放在使用者快取目錄，不在目前工作目錄下產生檔案
+DEFAULT_CACHE_PATH = os.getenv(
+    'DESCRIPTION_CACHE_PATH',
+    os.path.join(os.path.expanduser("~"), ".cache", "chartcut", "description_cache.sqlite3")
+)
+
+
+def make_cache_key(request: Any, provider: str = "") -> str:
+    """以正規化後的請求內容計算快取鍵
+
+    提供者名稱也納入雜湊，避免切換到真實LLM後仍取回模擬結果。
+    """
+    payload = json.dumps(asdict(request), sort_keys=True, ensure_ascii=False)
+    return hashlib.blake2b(f"{provider}\x1f{payload}".encode('utf-8'), digest_size=16).hexdigest()
+
+
+class CacheStrategy(ABC):
+    """描述快取策略抽象基類"""
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """取得快取內容，不存在時回傳 None"""
+        pass
+
+    @abstractmethod
+    def set(self, key: str, value: Dict[str, Any]) -> None:
+        """寫入快取內容"""
+        pass
+
+    def close(self) -> None:
+        """釋放資源"""
+        pass
+
+
+class SQLiteCache(CacheStrategy):
+    """以單一 SQLite 檔案儲存的快取"""
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS descriptions (key TEXT PRIMARY KEY, value TEXT NOT NULL)"
+        )
+        self._conn.commit()
+
+    def __reduce__(self):
+        # 連線與鎖無法序列化；傳到子行程時以同一路徑重新開啟（WAL 模式可多行程共用）
+        return (type(self), (self._path,))
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM descriptions WHERE key = ?", (key,)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set(self, key: str, value: Dict[str, Any]) -> None:
+        data = json.dumps(value, ensure_ascii=False)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO descriptions (key, value) VALUES (?, ?)", (key, data)
+            )
+            self._conn.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class DiskCache(CacheStrategy):
+    """以 diskcache 套件實作的快取"""
+
+    def __init__(self, directory: str = os.path.splitext(DEFAULT_CACHE_PATH)[0]):
+        if not DISKCACHE_AVAILABLE:
+            raise ImportError("需要安裝 diskcache 套件")
+        self._directory = directory
+        self._cache = diskcache.Cache(directory)
+
+    def __reduce__(self):
+        return (type(self), (self._directory,))
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        return self._cache.get(key)
+
+    def set(self, key: str, value: Dict[str, Any]) -> None:
+        self._cache.set(key, value)
+
+    def close(self) -> None:
+        self._cache.close()
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+階段C：OpenAI 嵌入用戶端 - 分批呼叫、限制並行數，並以文字雜湊快取向量
+"""
+
+import asyncio
+import hashlib
+import logging
+import os
+from typing import Dict, List, Optional
+
+from interfaces import IAsyncEmbeddingClient
+from enhanced_version.backend.llm_providers_sB import (
+    LoopBoundAsyncClient, RateLimiter, acall_with_retry, call_with_retry, create_sync_client,
+    load_dotenv_once, run_sync,
+)
+from enhanced_version.backend.result_cache_sC import DiskCacheManager
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_EMBEDDING_MODEL = os.getenv('OPENAI_EMBEDDING_MODEL', 'text-embedding-3-small')
+
+# 單次請求的輸入筆數與估計 token 上限（API 上限約 2048 筆 / 30 萬 token，保留餘裕）
+EMBEDDING_BATCH_SIZE = 256
+EMBEDDING_BATCH_TOKENS = 100000
+EMBEDDING_MAX_CONCURRENCY = 8
+
+
+def _estimate_tokens(text: str) -> int:
+    return len(text) // 4 + 1
+
+
+def _batched(texts: List[str], batch_size: int, token_budget: int) -> List[List[str]]:
+    """依筆數與估計 token 數切分批次，保持原順序"""
+    batches: List[List[str]] = []
+    current: List[str] = []
+    current_tokens = 0
+    for text in texts:
+        tokens = _estimate_tokens(text)
+        if current and (len(current) >= batch_size or current_tokens + tokens > token_budget):
+            batches.append(current)
+            current, current_tokens = [], 0
+        current.append(text)
+        current_tokens += tokens
+    if current:
+        batches.append(current)
+    return batches
+
+
+class OpenAIEmbeddingClient(IAsyncEmbeddingClient):
+    """OpenAI 嵌入 API 用戶端
+
+    文字去重後切成多批，以 Semaphore 限制同時進行的請求數並行送出，結果依原順序組回；
+    指定 cache 時以「模型 + 文字」的雜湊為鍵保存向量，重跑時只嵌入新增的文字。
+    另提供 langchain Embeddings 相容的 embed_documents / embed_query，可直接交給 FAISS 使用：
+    embed_documents 在共用的背景事件迴圈上執行（用戶端與連線池跨呼叫重用），
+    embed_query 以同步用戶端直接呼叫，且不寫入快取（查詢文字幾乎不會重複）。
+    """
+
+    def __init__(self, model: str = DEFAULT_EMBEDDING_MODEL,
+                 cache: Optional[DiskCacheManager] = None,
+                 batch_size: int = EMBEDDING_BATCH_SIZE,
+                 max_concurrency: int = EMBEDDING_MAX_CONCURRENCY):
+        load_dotenv_once()
+        self.model = model
+        self.cache = cache
+        self.batch_size = batch_size
+        self.max_concurrency = max_concurrency
+        self.api_key = os.environ.get('OPENAI_API_KEY')
+        self.base_url = os.environ.get('OPENAI_BASE_URL', 'https://api.openai.com/v1')
+        self.rate_limiter = RateLimiter()
+        self._client = None
+        self._aclient = LoopBoundAsyncClient(self.api_key, self.base_url)
+
+    def _sync_client(self):
+        """取得共用的同步 OpenAI 用戶端"""
+        if self._client is None:
+            self._client = create_sync_client(self.api_key, self.base_url)
+        return self._client
+
+    def _async_client(self):
+        """取得目前事件迴圈專用的非同步 OpenAI 用戶端"""
+        return self._aclient.get()
+
+    def _cache_key(self, text: str) -> str:
+        digest = hashlib.blake2b(f"{self.model}\0{text}".encode('utf-8'), digest_size=20).hexdigest()
+        return f"emb-{digest}"
+
+    async def _embed_batch(self, batch: List[str], semaphore: asyncio.Semaphore) -> List[List[float]]:
+        """嵌入單一批次，暫時性錯誤時退避重試"""
+        async with semaphore:
+            response = await acall_with_retry(
+                lambda: self._async_client().embeddings.create(model=self.model, input=batch),
+                self.rate_limiter, sum(map(_estimate_tokens, batch)), label="嵌入請求"
+            )
+        # 回應項目帶有 index，依其排序以對應輸入順序
+        return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+
+    async def create_embeddings(self, texts: List[str]) -> List[List[float]]:
+        """批次建立嵌入向量，回傳順序與 texts 相同"""
+        vectors: Dict[str, List[float]] = {}
+        pending: List[str] = []
+        for text in dict.fromkeys(texts):
+            cached = self.cache.get(self._cache_key(text)) if self.cache is not None else None
+            if cached is None:
+                pending.append(text)
+            else:
+                vectors[text] = cached
+
+        if pending:
+            semaphore = asyncio.Semaphore(self.max_concurrency)
+            batches = _batched(pending, self.batch_size, EMBEDDING_BATCH_TOKENS)
+            logger.info(f"嵌入 {len(pending)} 段文字（{len(batches)} 批，快取命中 {len(vectors)} 段）")
+            results = await asyncio.gather(*(self._embed_batch(batch, semaphore) for batch in batches))
+            for batch, embeddings in zip(batches, results):
+                for text, embedding in zip(batch, embeddings):
+                    vectors[text] = embedding
+                    if self.cache is not None:
+                        self.cache.set(self._cache_key(text), embedding)
+
+        return [vectors[text] for text in texts]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """langchain Embeddings 介面：同步嵌入多段文字（於共用的背景事件迴圈上分批並行）"""
+        return run_sync(self.create_embeddings(list(texts)))
+
+    def embed_query(self, text: str) -> List[float]:
+        """langchain Embeddings 介面：以同步用戶端嵌入單一查詢，暫時性錯誤時退避重試"""
+        response = call_with_retry(
+            lambda: self._sync_client().embeddings.create(model=self.model, input=[text]),
+            self.rate_limiter, _estimate_tokens(text), label="嵌入請求"
+        )
+        return response.data[0].embedding
@@ -7,21 +7,44 @@
 import os
 import asyncio
 import hashlib
+import hmac
+import secrets
 import jwt
 import json
+import time
+import logging
+import queue
+import threading
 from datetime import datetime, timedelta, timezone
-from fastapi import FastAPI, HTTPException, Depends, status
+from fastapi import FastAPI, HTTPException, Depends, status, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi.responses import HTMLResponse, JSONResponse, ORJSONResponse, StreamingResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from pydantic import BaseModel
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Tuple, Callable, Awaitable, Set
 from dotenv import load_dotenv
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import FileResponse
 import sqlite3
 import uuid
-from contextlib import asynccontextmanager
+from contextlib import asynccontextmanager, contextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+# bcrypt 為選用套件，未安裝時改用標準庫的 PBKDF2
+try:
+    import bcrypt
+    BCRYPT_AVAILABLE = True
+except ImportError:
+    BCRYPT_AVAILABLE = False
+
+# orjson 為選用套件，未安裝時退回標準 JSON 回應
+try:
+    import orjson  # noqa: F401  (ORJSONResponse 需要)
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+FastJSONResponse = ORJSONResponse if ORJSON_AVAILABLE else JSONResponse
 
 # 導入增強型RAG系統
 import sys
@@ -36,10 +59,200 @@ SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-change-this")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
+# JWT 驗證結果快取：以 token 的 SHA-256 為鍵（不保存原始 token），只快取驗證成功的結果
+TOKEN_CACHE_TTL_SECONDS = 30
+TOKEN_CACHE_MAX_SIZE = 10000
+_token_cache: Dict[bytes, Tuple[str, float]] = {}  # token 雜湊 -> (user_id, 到期時間)
+_token_cache_lock = threading.Lock()
+
+# 密碼雜湊設定
+BCRYPT_ROUNDS = 12
+PBKDF2_ITERATIONS = 600000
+# bcrypt 只接受 72 位元組以內的密碼（約 24 個中文字），更長的密碼於註冊時拒絕
+MAX_PASSWORD_BYTES = 72
+
+# 登入驗證快取：短時間內吸收用戶端重試，避免重複執行昂貴的 KDF
+PASSWORD_CACHE_TTL_SECONDS = 5
+PASSWORD_CACHE_MAX_SIZE = 1000
+_password_cache: Dict[bytes, float] = {}  # 雜湊(帳號, 密碼, 儲存的雜湊) -> 到期時間
+_password_cache_lock = threading.Lock()
+
+# 資料庫設定
+DATABASE_PATH = 'rag_users.db'
+DB_POOL_SIZE = 8
+
+class SQLiteConnectionPool:
+    """SQLite 連線池：讀取連線由佇列輪用，寫入統一走單一專用連線以避免 SQLITE_BUSY"""
+    
+    def __init__(self, database: str, size: int = DB_POOL_SIZE):
+        self.database = database
+        self._readers: "queue.Queue[sqlite3.Connection]" = queue.Queue(maxsize=size)
+        for _ in range(size):
+            self._readers.put(self._create_connection())
+        self._writer = self._create_connection()
+        self._writer_lock = threading.Lock()
+    
+    def _create_connection(self) -> sqlite3.Connection:
+        """建立連線並套用一次性的 PRAGMA 設定"""
+        conn = sqlite3.connect(self.database, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        conn.execute("PRAGMA cache_size=-64000")
+        return conn
+    
+    @contextmanager
+    def reader(self):
+        """借出一條讀取連線，用畢歸還"""
+        conn = self._readers.get()
+        try:
+            yield conn
+        finally:
+            self._readers.put(conn)
+    
+    @contextmanager
+    def writer(self):
+        """獨占寫入連線，發生例外時回滾未提交的交易"""
+        with self._writer_lock:
+            try:
+                yield self._writer
+            except Exception:
+                self._writer.rollback()
+                raise
+    
+    def close(self):
+        """關閉所有連線（關閉前讓 SQLite 依查詢紀錄更新統計資訊）"""
+        while not self._readers.empty():
+            self._readers.get_nowait().close()
+        self._writer.execute("PRAGMA optimize")
+        self._writer.close()
+
+# RAG 專用執行緒池與並行上限（於 lifespan 中建立與關閉）：不與預設執行緒池共用佇列，並避免壓垮 LLM / 嵌入後端
+RAG_MAX_WORKERS = os.cpu_count() or 4
+RAG_MAX_CONCURRENCY = int(os.getenv("RAG_MAX_CONCURRENCY", str(RAG_MAX_WORKERS)))
+rag_executor: Optional[ThreadPoolExecutor] = None
+rag_semaphore: Optional[asyncio.Semaphore] = None
+init_rag_lock: Optional[asyncio.Lock] = None  # 同時多個 /init-rag 請求只初始化一次
+
+async def run_rag_call(func, *args):
+    """在 RAG 專用執行緒池中執行阻塞呼叫，並以 semaphore 限制同時進行的數量"""
+    async with rag_semaphore:
+        return await asyncio.get_running_loop().run_in_executor(rag_executor, func, *args)
+
+# /ask 批次設定：累積到 QUERY_BATCH_SIZE 個問題或等待滿 QUERY_BATCH_MAX_WAIT 秒即送出
+QUERY_BATCH_SIZE = 16
+QUERY_BATCH_MAX_WAIT = 0.05
+
+class QueryBatcher:
+    """將同時到達的問題合併為批次送入 RAG 引擎，攤提檢索與 LLM 的固定成本"""
+    
+    def __init__(self, handler: Callable[[List[str]], Awaitable[List[Any]]],
+                 batch_size: int = QUERY_BATCH_SIZE, max_wait: float = QUERY_BATCH_MAX_WAIT):
+        self.handler = handler
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._dispatch_tasks: Set[asyncio.Task] = set()
+    
+    def start(self):
+        """啟動收集批次的背景工作（需在事件迴圈中呼叫）"""
+        self._queue = asyncio.Queue()
+        self._worker = asyncio.create_task(self._collect_batches())
+    
+    async def stop(self):
+        """停止背景工作與進行中的批次，並讓尚未處理的請求以錯誤結束，不會無限等待"""
+        tasks = list(self._dispatch_tasks)
+        if self._worker is not None:
+            tasks.append(self._worker)
+            self._worker = None
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        
+        pending = []
+        while self._queue is not None and not self._queue.empty():
+            pending.append(self._queue.get_nowait())
+        self._fail_all(pending, RuntimeError("服務關閉中，問題未處理"))
+    
+    async def submit(self, question: str) -> Any:
+        """送出單一問題並等待其批次結果"""
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((question, future))
+        return await future
+    
+    async def _collect_batches(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait
+            
+            while len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            
+            # 批次在獨立任務中執行，處理期間可繼續收集下一批
+            task = asyncio.create_task(self._dispatch(batch))
+            self._dispatch_tasks.add(task)
+            task.add_done_callback(self._dispatch_tasks.discard)
+    
+    @staticmethod
+    def _fail_all(batch: List[Tuple[str, asyncio.Future]], error: Exception):
+        for _, future in batch:
+            if not future.done():
+                future.set_exception(error)
+    
+    async def _dispatch(self, batch: List[Tuple[str, asyncio.Future]]):
+        """處理函式回傳的每個位置可為結果或例外，各請求只承受自己問題的錯誤"""
+        try:
+            results = await self.handler([question for question, _ in batch])
+        except asyncio.CancelledError:
+            self._fail_all(batch, RuntimeError("服務關閉中，問題未處理"))
+            raise
+        except Exception as e:
+            # 整批失敗（例如處理函式本身出錯）：通知批次內所有請求
+            self._fail_all(batch, e)
+            return
+        
+        for (_, future), result in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+async def _ask_batch(questions: List[str]) -> List[Any]:
+    """QueryBatcher 的處理函式：以一次批次呼叫回答多個問題"""
+    return await run_rag_call(enhanced_rag_instance.ask_enhanced_batch, questions)
+
+query_batcher = QueryBatcher(_ask_batch)
+
+# 問答統計以單一查詢取得；固定的 SQL 字串可命中 sqlite3 連線的預備語句快取
+USAGE_STATISTICS_SQL = (
+    "SELECT COUNT(*), AVG(response_time), SUM(charts_count) FROM enhanced_questions_log"
+)
+
+# 全域連線池（於 lifespan 中建立）
+db_pool: Optional[SQLiteConnectionPool] = None
+
+def get_conn():
+    """取得讀取連線（context manager）"""
+    return db_pool.reader()
+
+def get_writer_conn():
+    """取得寫入連線（context manager）"""
+    return db_pool.writer()
+
 # 資料庫初始化
 def init_database():
     """初始化 SQLite 資料庫"""
-    conn = sqlite3.connect('rag_users.db')
+    conn = sqlite3.connect(DATABASE_PATH)
     cursor = conn.cursor()
 
     # 使用者表
@@ -72,35 +285,57 @@ def init_database():
     )
     ''')
 
+    # 依使用者查詢問答歷史時避免全表掃描（users 的 user_id / username 已由 UNIQUE 建立索引）
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_qlog_user_time
+        ON enhanced_questions_log(user_id, created_at DESC)
+    ''')
+
     conn.commit()
     conn.close()
 
 # 應用程式生命週期管理
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # 啟動時執行
+    global db_pool, rag_executor, rag_semaphore, init_rag_lock
+    
+    # 啟動時執行（日誌只在應用程式入口設定一次）
+    logging.basicConfig(level=logging.INFO)
     init_database()
+    db_pool = SQLiteConnectionPool(DATABASE_PATH)
+    rag_executor = ThreadPoolExecutor(max_workers=RAG_MAX_WORKERS, thread_name_prefix="rag")
+    rag_semaphore = asyncio.Semaphore(RAG_MAX_CONCURRENCY)
+    init_rag_lock = asyncio.Lock()
+    query_batcher.start()
     yield
-    # 關閉時執行（如果需要清理）
+    # 關閉時執行
+    await query_batcher.stop()
+    db_pool.close()
+    db_pool = None
+    rag_executor.shutdown(wait=False)
+    rag_executor = None
 
 # FastAPI 應用程式
 app = FastAPI(
     title="增強型RAG問答系統",
     description="支援圖文混合的智能問答系統",
+    default_response_class=FastJSONResponse,
     lifespan=lifespan
 )
 
 # 掛載靜態檔案
 app.mount("/static", StaticFiles(directory="../frontend"), name="static")
 
-# 設定 CORS
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+# 設定 CORS：僅允許 ALLOWED_ORIGINS（逗號分隔）列出的來源，未設定時不掛載中介層
+ALLOWED_ORIGINS = [origin.strip() for origin in os.getenv("ALLOWED_ORIGINS", "").split(",") if origin.strip()]
+if ALLOWED_ORIGINS:
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=ALLOWED_ORIGINS,
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
 
 # 全域增強型RAG實例
 enhanced_rag_instance: Optional[EnhancedRAGHelper] = None
@@ -121,23 +356,56 @@ class UserLogin(BaseModel):
 class QuestionRequest(BaseModel):
     question: str
 
-class EnhancedQuestionResponse(BaseModel):
-    """增強的問答回應 - 包含圖表資訊"""
-    answer: str
-    sources: List[Dict[str, Any]]
-    charts: List[Dict[str, Any]]
-    response_time: float
-    charts_count: int
-    sources_count: int
-
 # 工具函數
 def hash_password(password: str) -> str:
-    """密碼雜湊"""
-    return hashlib.sha256(password.encode()).hexdigest()
-
-def verify_password(password: str, hashed: str) -> bool:
-    """驗證密碼"""
-    return hash_password(password) == hashed
+    """密碼雜湊（bcrypt，未安裝時使用 PBKDF2-SHA256）"""
+    if BCRYPT_AVAILABLE:
+        return bcrypt.hashpw(password.encode(), bcrypt.gensalt(rounds=BCRYPT_ROUNDS)).decode()
+    
+    salt = secrets.token_hex(16)
+    digest = hashlib.pbkdf2_hmac("sha256", password.encode(), salt.encode(), PBKDF2_ITERATIONS)
+    return f"pbkdf2_sha256${PBKDF2_ITERATIONS}${salt}${digest.hex()}"
+
+def _check_password_hash(password: str, hashed: str) -> bool:
+    """依雜湊格式驗證密碼（相容舊版未加鹽的 SHA-256 十六進位雜湊）"""
+    if hashed.startswith("$2"):
+        # 超過長度上限的密碼不可能註冊成功，且 bcrypt 會對其拋出 ValueError
+        return (BCRYPT_AVAILABLE and len(password.encode()) <= MAX_PASSWORD_BYTES
+                and bcrypt.checkpw(password.encode(), hashed.encode()))
+    
+    if hashed.startswith("pbkdf2_sha256$"):
+        _, iterations, salt, digest = hashed.split("$")
+        candidate = hashlib.pbkdf2_hmac("sha256", password.encode(), salt.encode(), int(iterations))
+        return hmac.compare_digest(candidate, bytes.fromhex(digest))
+    
+    # 舊版雜湊：直接比較 32 位元組摘要，不產生十六進位字串
+    try:
+        legacy_digest = bytes.fromhex(hashed)
+    except ValueError:
+        return False
+    return hmac.compare_digest(hashlib.sha256(password.encode()).digest(), legacy_digest)
+
+def is_legacy_password_hash(hashed: str) -> bool:
+    """是否為舊版未加鹽的 SHA-256 雜湊（登入成功時需升級）"""
+    return not (hashed.startswith("$2") or hashed.startswith("pbkdf2_sha256$"))
+
+def verify_password(password: str, hashed: str, username: str = "") -> bool:
+    """驗證密碼，成功結果短暫快取以吸收重試風暴"""
+    cache_key = hashlib.sha256("\0".join((username, password, hashed)).encode()).digest()
+    now = time.time()
+    with _password_cache_lock:
+        expires_at = _password_cache.get(cache_key)
+        if expires_at is not None and expires_at > now:
+            return True
+    
+    if not _check_password_hash(password, hashed):
+        return False
+    
+    with _password_cache_lock:
+        if len(_password_cache) >= PASSWORD_CACHE_MAX_SIZE:
+            _password_cache.clear()
+        _password_cache[cache_key] = now + PASSWORD_CACHE_TTL_SECONDS
+    return True
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     """建立 JWT token"""
@@ -150,8 +418,43 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
+def _get_cached_user_id(token_key: bytes) -> Optional[str]:
+    """取得快取中尚未過期的 user_id"""
+    now = time.time()
+    with _token_cache_lock:
+        entry = _token_cache.get(token_key)
+        if entry is None:
+            return None
+        if entry[1] <= now:
+            del _token_cache[token_key]
+            return None
+        return entry[0]
+
+def _cache_user_id(token_key: bytes, user_id: str, token_exp: Optional[float]):
+    """快取驗證成功的 user_id，存活時間不超過 token 本身的到期時間"""
+    now = time.time()
+    expires_at = now + TOKEN_CACHE_TTL_SECONDS
+    if token_exp is not None:
+        expires_at = min(expires_at, token_exp)
+    if expires_at <= now:
+        return
+    
+    with _token_cache_lock:
+        if len(_token_cache) >= TOKEN_CACHE_MAX_SIZE:
+            # 先清除過期項目，仍然已滿時淘汰最早加入的項目
+            for key in [key for key, (_, exp) in _token_cache.items() if exp <= now]:
+                del _token_cache[key]
+            if len(_token_cache) >= TOKEN_CACHE_MAX_SIZE:
+                del _token_cache[next(iter(_token_cache))]
+        _token_cache[token_key] = (user_id, expires_at)
+
 def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
-    """驗證 JWT token"""
+    """驗證 JWT token（短時間內重複出現的 token 直接使用快取結果）"""
+    token_key = hashlib.sha256(credentials.credentials.encode()).digest()
+    cached_user_id = _get_cached_user_id(token_key)
+    if cached_user_id is not None:
+        return cached_user_id
+    
     try:
         payload = jwt.decode(credentials.credentials, SECRET_KEY, algorithms=[ALGORITHM])
         user_id: str = payload.get("sub")
@@ -161,6 +464,7 @@ def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
                 detail="Invalid authentication credentials",
                 headers={"WWW-Authenticate": "Bearer"},
             )
+        _cache_user_id(token_key, user_id, payload.get("exp"))
         return user_id
     except jwt.PyJWTError:
         raise HTTPException(
@@ -171,25 +475,40 @@ def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
 
 def get_user_from_db(user_id: str):
     """從資料庫取得使用者資訊"""
-    conn = sqlite3.connect('rag_users.db')
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM users WHERE user_id = ?", (user_id,))
-    user = cursor.fetchone()
-    conn.close()
-    return user
+    with get_conn() as conn:
+        return conn.execute("SELECT * FROM users WHERE user_id = ?", (user_id,)).fetchone()
+
+def log_question(user_id: str, question: str, answer: str, sources_count: int,
+                 charts_count: int, chart_references_json: str, response_time: float):
+    """寫入問答紀錄（供背景任務使用，沿用連線池的寫入連線）"""
+    with get_writer_conn() as conn:
+        conn.execute("""
+            INSERT INTO enhanced_questions_log 
+            (user_id, question, answer, sources_count, charts_count, chart_references, response_time) 
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, (user_id, question, answer, sources_count, charts_count, chart_references_json, response_time))
+        conn.commit()
+
+def build_sources(context_docs, chart_metadata) -> List[Dict[str, Any]]:
+    """準備來源文檔資訊（內容截斷至 300 字；chart_references 由內部列索引轉回 chart_id）"""
+    sources = []
+    for doc in context_docs:
+        metadata = doc.metadata
+        if metadata.get("chart_references"):
+            metadata = {**metadata, "chart_references": chart_metadata.chart_ids(metadata["chart_references"])}
+        sources.append({
+            "content": doc.page_content[:300] + "..." if len(doc.page_content) > 300 else doc.page_content,
+            "metadata": metadata
+        })
+    return sources
+
+def sse_event(data: Dict[str, Any]) -> str:
+    """格式化 Server-Sent Events 資料框"""
+    return f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
 
 def chart_metadata_to_dict(chart: ChartMetadata) -> Dict[str, Any]:
-    """將圖表元數據轉換為字典"""
-    return {
-        "chart_id": chart.chart_id,
-        "chart_type": chart.chart_type,
-        "chart_number": chart.chart_number,
-        "original_caption": chart.original_caption,
-        "generated_description": chart.generated_description,
-        "page_number": chart.page_number,
-        "confidence_score": chart.confidence_score,
-        "source_file": chart.source_file
-    }
+    """將圖表元數據轉換為字典（使用 ChartMetadata 建立時預先計算的結果）"""
+    return chart.to_dict()
 
 # API 路由
 @app.get("/", response_class=HTMLResponse)
@@ -200,45 +519,59 @@ async def read_root():
 @app.post("/register")
 async def register(user: UserCreate):
     """使用者註冊"""
-    conn = sqlite3.connect('rag_users.db')
-    cursor = conn.cursor()
+    if len(user.password.encode()) > MAX_PASSWORD_BYTES:
+        raise HTTPException(status_code=400, detail=f"密碼長度不可超過 {MAX_PASSWORD_BYTES} 位元組")
+    
+    # 密碼雜湊刻意耗時，於執行緒中計算，且在取得寫入鎖之前完成
+    password_hash = await asyncio.get_running_loop().run_in_executor(None, hash_password, user.password)
     
     try:
-        # 檢查使用者名稱是否已存在
-        cursor.execute("SELECT username FROM users WHERE username = ?", (user.username,))
-        if cursor.fetchone():
-            raise HTTPException(status_code=400, detail="使用者名稱已存在")
-        
-        # 建立新使用者
-        user_id = str(uuid.uuid4())
-        password_hash = hash_password(user.password)
-        
-        cursor.execute("""
-            INSERT INTO users (user_id, username, email, password_hash) 
-            VALUES (?, ?, ?, ?)
-        """, (user_id, user.username, user.email, password_hash))
-        
-        conn.commit()
-        return {"message": "註冊成功", "user_id": user_id}
+        with get_writer_conn() as conn:
+            cursor = conn.cursor()
+            
+            # 檢查使用者名稱是否已存在
+            cursor.execute("SELECT username FROM users WHERE username = ?", (user.username,))
+            if cursor.fetchone():
+                raise HTTPException(status_code=400, detail="使用者名稱已存在")
+            
+            # 建立新使用者
+            user_id = str(uuid.uuid4())
+            
+            cursor.execute("""
+                INSERT INTO users (user_id, username, email, password_hash) 
+                VALUES (?, ?, ?, ?)
+            """, (user_id, user.username, user.email, password_hash))
+            
+            conn.commit()
+            return {"message": "註冊成功", "user_id": user_id}
     
     except sqlite3.IntegrityError:
         raise HTTPException(status_code=400, detail="使用者名稱已存在")
-    finally:
-        conn.close()
 
 @app.post("/login")
 async def login(user: UserLogin):
     """使用者登入"""
-    conn = sqlite3.connect('rag_users.db')
-    cursor = conn.cursor()
-    
-    cursor.execute("SELECT user_id, password_hash FROM users WHERE username = ?", (user.username,))
-    db_user = cursor.fetchone()
-    conn.close()
+    with get_conn() as conn:
+        db_user = conn.execute(
+            "SELECT user_id, password_hash FROM users WHERE username = ?", (user.username,)
+        ).fetchone()
     
-    if not db_user or not verify_password(user.password, db_user[1]):
+    loop = asyncio.get_running_loop()
+    if not db_user or not await loop.run_in_executor(
+            None, verify_password, user.password, db_user[1], user.username):
         raise HTTPException(status_code=401, detail="帳號或密碼錯誤")
     
+    # 舊版 SHA-256 雜湊無法離線轉換，於登入成功時以明文密碼一次性升級
+    # （超過 bcrypt 長度上限的舊密碼維持原雜湊）
+    if is_legacy_password_hash(db_user[1]) and len(user.password.encode()) <= MAX_PASSWORD_BYTES:
+        password_hash = await loop.run_in_executor(None, hash_password, user.password)
+        with get_writer_conn() as conn:
+            conn.execute(
+                "UPDATE users SET password_hash = ? WHERE user_id = ?",
+                (password_hash, db_user[0])
+            )
+            conn.commit()
+    
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
         data={"sub": db_user[0]}, expires_delta=access_token_expires
@@ -246,18 +579,23 @@ async def login(user: UserLogin):
     
     return {"access_token": access_token, "token_type": "bearer"}
 
+def _create_enhanced_rag() -> EnhancedRAGHelper:
+    """建立並完整初始化增強型RAG實例（阻塞，於 RAG 執行緒池中執行）"""
+    instance = EnhancedRAGHelper("pdfFiles")
+    instance.prepare_enhanced(rebuild_index=False)
+    instance.setup_enhanced_retrieval_chain()
+    return instance
+
 @app.get("/init-rag")
 async def init_rag(user_id: str = Depends(verify_token)):
     """初始化增強型RAG系統"""
     global enhanced_rag_instance
     
     try:
-        if enhanced_rag_instance is None:
-            enhanced_rag_instance = EnhancedRAGHelper("pdfFiles")
-            await asyncio.get_event_loop().run_in_executor(
-                None, enhanced_rag_instance.load_and_prepare_enhanced, False
-            )
-            enhanced_rag_instance.setup_enhanced_retrieval_chain()
+        async with init_rag_lock:
+            if enhanced_rag_instance is None:
+                # 檢索鏈就緒後才發布全域實例，/ask 不會看到初始化到一半的物件
+                enhanced_rag_instance = await run_rag_call(_create_enhanced_rag)
         
         # 獲取系統統計
         stats = enhanced_rag_instance.get_statistics()
@@ -270,9 +608,10 @@ async def init_rag(user_id: str = Depends(verify_token)):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"初始化失敗: {str(e)}")
 
-@app.post("/ask", response_model=EnhancedQuestionResponse)
-async def ask_question(request: QuestionRequest, user_id: str = Depends(verify_token)):
-    """增強型問答"""
+@app.post("/ask")
+async def ask_question(request: QuestionRequest, background_tasks: BackgroundTasks,
+                       user_id: str = Depends(verify_token)):
+    """增強型問答 - 回應包含 answer、sources、charts、response_time、charts_count、sources_count"""
     global enhanced_rag_instance
     
     if enhanced_rag_instance is None:
@@ -282,50 +621,85 @@ async def ask_question(request: QuestionRequest, user_id: str = Depends(verify_t
     
     try:
         # 執行增強型問答
-        answer, context_docs, related_charts = await asyncio.get_event_loop().run_in_executor(
-            None, enhanced_rag_instance.ask_enhanced, request.question
-        )
+        answer, context_docs, related_charts = await query_batcher.submit(request.question)
         
         # 處理回應時間
         response_time = (datetime.now() - start_time).total_seconds()
         
         # 準備來源文檔資訊
-        sources = []
-        for doc in context_docs:
-            sources.append({
-                "content": doc.page_content[:300] + "..." if len(doc.page_content) > 300 else doc.page_content,
-                "metadata": doc.metadata
-            })
+        sources = build_sources(context_docs, enhanced_rag_instance.chart_metadata)
         
         # 準備圖表資訊
         charts = [chart_metadata_to_dict(chart) for chart in related_charts]
         
-        # 記錄到資料庫
-        conn = sqlite3.connect('rag_users.db')
-        cursor = conn.cursor()
-        
+        # 記錄到資料庫（回應送出後於背景執行，不佔用問答延遲）
         chart_references_json = json.dumps([chart.chart_id for chart in related_charts])
+        background_tasks.add_task(
+            log_question, user_id, request.question, answer,
+            len(sources), len(charts), chart_references_json, response_time
+        )
         
-        cursor.execute("""
-            INSERT INTO enhanced_questions_log 
-            (user_id, question, answer, sources_count, charts_count, chart_references, response_time) 
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        """, (user_id, request.question, answer, len(sources), len(charts), chart_references_json, response_time))
+        # 直接回傳序列化後的回應，略過 Pydantic 驗證與 jsonable_encoder
+        return FastJSONResponse(content={
+            "answer": answer,
+            "sources": sources,
+            "charts": charts,
+            "response_time": response_time,
+            "charts_count": len(charts),
+            "sources_count": len(sources)
+        })
+    
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"問答處理失敗: {str(e)}")
+
+@app.post("/ask/stream")
+async def ask_question_stream(request: QuestionRequest, user_id: str = Depends(verify_token)):
+    """串流增強型問答（SSE）- 逐段送出 {"token": ...}，最後送出 sources 與 charts"""
+    global enhanced_rag_instance
+    
+    if enhanced_rag_instance is None:
+        raise HTTPException(status_code=400, detail="RAG系統尚未初始化，請先呼叫 /init-rag")
+    
+    async def event_stream():
+        start_time = datetime.now()
+        loop = asyncio.get_running_loop()
         
-        conn.commit()
-        conn.close()
+        try:
+            async with rag_semaphore:
+                # 阻塞的串流迭代器逐段交給 RAG 執行緒池推進
+                stream = enhanced_rag_instance.ask_enhanced_stream(request.question)
+                while True:
+                    event = await loop.run_in_executor(rag_executor, next, stream, None)
+                    if event is None:
+                        break
+                    if "token" in event:
+                        yield sse_event({"token": event["token"]})
+                    else:
+                        result = event
+        except Exception as e:
+            yield sse_event({"error": f"問答處理失敗: {str(e)}"})
+            return
+        
+        response_time = (datetime.now() - start_time).total_seconds()
+        sources = build_sources(result["context"], enhanced_rag_instance.chart_metadata)
+        charts = [chart_metadata_to_dict(chart) for chart in result["charts"]]
         
-        return EnhancedQuestionResponse(
-            answer=answer,
-            sources=sources,
-            charts=charts,
-            response_time=response_time,
-            charts_count=len(charts),
-            sources_count=len(sources)
+        yield sse_event({
+            "sources": sources,
+            "charts": charts,
+            "response_time": response_time,
+            "charts_count": len(charts),
+            "sources_count": len(sources)
+        })
+        
+        # 結束資料框送出後記錄到資料庫
+        chart_references_json = json.dumps([chart.chart_id for chart in result["charts"]])
+        await loop.run_in_executor(
+            None, log_question, user_id, request.question, result["answer"],
+            len(sources), len(charts), chart_references_json, response_time
         )
     
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"問答處理失敗: {str(e)}")
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
 
 @app.get("/charts")
 async def list_charts(user_id: str = Depends(verify_token)):
@@ -337,10 +711,10 @@ async def list_charts(user_id: str = Depends(verify_token)):
     
     try:
         charts = enhanced_rag_instance.list_all_charts()
-        return {
+        return FastJSONResponse(content={
             "total_charts": len(charts),
             "charts": [chart_metadata_to_dict(chart) for chart in charts]
-        }
+        })
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"獲取圖表列表失敗: {str(e)}")
 
@@ -371,28 +745,21 @@ async def get_statistics(user_id: str = Depends(verify_token)):
         rag_stats = enhanced_rag_instance.get_statistics()
         
         # 問答紀錄統計
-        conn = sqlite3.connect('rag_users.db')
-        cursor = conn.cursor()
-        
-        cursor.execute("SELECT COUNT(*) FROM enhanced_questions_log")
-        total_questions = cursor.fetchone()[0]
+        with get_conn() as conn:
+            total_questions, avg_response_time, total_chart_references = conn.execute(
+                USAGE_STATISTICS_SQL
+            ).fetchone()
+        avg_response_time = avg_response_time or 0
+        total_chart_references = total_chart_references or 0
         
-        cursor.execute("SELECT AVG(response_time) FROM enhanced_questions_log")
-        avg_response_time = cursor.fetchone()[0] or 0
-        
-        cursor.execute("SELECT SUM(charts_count) FROM enhanced_questions_log")
-        total_chart_references = cursor.fetchone()[0] or 0
-        
-        conn.close()
-        
-        return {
+        return FastJSONResponse(content={
             "rag_statistics": rag_stats,
             "usage_statistics": {
                 "total_questions": total_questions,
                 "average_response_time": round(avg_response_time, 2),
                 "total_chart_references": total_chart_references
             }
-        }
+        })
     
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"獲取統計資訊失敗: {str(e)}")
@@ -7,30 +7,63 @@
 import os
 import sys
 import glob
+import asyncio
+import hashlib
 import json
 import logging
+import math
+import multiprocessing
+import uuid
+from array import array
+from collections import Counter, defaultdict
 from pathlib import Path
-from typing import List, Dict, Optional, Tuple, Any
-from dataclasses import dataclass, asdict
+from typing import TYPE_CHECKING, List, Dict, Optional, Tuple, Any, Iterable, Iterator, Union
+from dataclasses import dataclass, field, fields
 from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import lru_cache
 
-# LangChain 相關套件
-from langchain.chains import create_retrieval_chain
-from langchain.chains.combine_documents import create_stuff_documents_chain
-from langchain_core.prompts import ChatPromptTemplate
+# LangChain 相關套件（檢索鏈、提示詞與向量庫於使用處延遲匯入）
 from langchain_core.documents import Document
 
+if TYPE_CHECKING:
+    from langchain_core.prompts import ChatPromptTemplate
+
+# orjson 為選用套件，未安裝時使用標準庫 json
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
 # 導入我們的模組
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
-from enhanced_version.backend.caption_extractor_sA import PDFCaptionContextProcessor
+from enhanced_version.backend.caption_extractor_sA import PDFCaptionContextProcessor, _fitz, page_text_flags
 from enhanced_version.backend.llm_description_generator_v2_sB import LLMDescriptionGeneratorV2, DescriptionRequest
+from enhanced_version.backend.result_cache_sC import DiskCacheManager, file_content_hash
+from enhanced_version.backend.embedding_client_sC import OpenAIEmbeddingClient
 
 # 導入組長的RAG Helper
 project_root = Path(__file__).parent.parent.parent.parent.parent
 sys.path.append(str(project_root))
 from RAG_Helper import RAGHelper
 
-@dataclass
+logger = logging.getLogger(__name__)
+
+# 伴生索引檔案：圖表元數據與增強型向量索引一起載入
+CHART_METADATA_PATH = "chart_metadata.json"
+ENHANCED_INDEX_PATH = "enhanced_faiss_index"
+# 與向量索引一起保存的圖表元數據指紋，載入時比對以避免列索引對應到錯誤的圖表
+INDEX_FINGERPRINT_FILE = "chart_metadata.fingerprint"
+
+# 向量數超過此值改用 IVF 倒排索引（nlist≈√N，探查 nlist/16 個分群），查詢不再逐一比對全部向量
+IVF_MIN_VECTORS = 1024
+IVF_TRAIN_SAMPLES_PER_LIST = 50
+
+# 大量常駐的元數據使用 __slots__（需 Python 3.10+，舊版維持一般 dataclass）
+_SLOTS = {"slots": True} if sys.version_info >= (3, 10) else {}
+
+@dataclass(frozen=True, **_SLOTS)
 class ChartMetadata:
     """圖表元數據"""
     chart_id: str
@@ -41,18 +74,182 @@ class ChartMetadata:
     page_number: int
     confidence_score: float
     source_file: str
+    # 內容不可變，字典形式於建立時預先計算一次
+    _dict: Dict[str, Any] = field(init=False, repr=False, compare=False)
+    
+    def __post_init__(self):
+        object.__setattr__(self, "_dict", {name: getattr(self, name) for name in CHART_METADATA_FIELDS})
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """回傳預先計算的字典（共用物件，呼叫端不應修改）"""
+        return self._dict
 
-@dataclass
+CHART_METADATA_FIELDS = tuple(f.name for f in fields(ChartMetadata) if f.init)
+
+# 數值欄位以 array 連續儲存（typecode），其餘欄位為一般 list
+_NUMERIC_COLUMNS = {"page_number": "i", "confidence_score": "d"}
+
+class ChartMetadataColumns:
+    """圖表元數據的欄位式（SoA）儲存
+    
+    每個欄位一個序列，篩選與統計只走訪用到的欄位，序列化時整欄一次輸出；
+    列索引即為文檔 metadata 中 chart_references 的整數索引。
+    需要完整物件時以列索引或 chart_id 取得 ChartMetadata。
+    """
+    
+    __slots__ = ('columns', '_row_of')
+    
+    def __init__(self):
+        self.columns: Dict[str, Any] = {
+            name: array(_NUMERIC_COLUMNS[name]) if name in _NUMERIC_COLUMNS else []
+            for name in CHART_METADATA_FIELDS
+        }
+        self._row_of: Dict[str, int] = {}
+    
+    @classmethod
+    def from_json_data(cls, data: Dict[str, Any]) -> "ChartMetadataColumns":
+        """由 chart_metadata.json 的內容建立（相容舊版 {chart_id: 單筆字典} 格式）"""
+        store = cls()
+        if isinstance(data.get("chart_id"), list):
+            for values in zip(*(data[name] for name in CHART_METADATA_FIELDS)):
+                store.add(**dict(zip(CHART_METADATA_FIELDS, values)))
+        else:
+            for record in data.values():
+                store.add(**record)
+        return store
+    
+    def add(self, **values: Any) -> int:
+        """加入一筆圖表（chart_id 已存在時覆寫該列），回傳列索引"""
+        row = self._row_of.get(values["chart_id"])
+        if row is None:
+            row = self._row_of[values["chart_id"]] = len(self._row_of)
+            for name, column in self.columns.items():
+                column.append(values[name])
+        else:
+            for name, column in self.columns.items():
+                column[row] = values[name]
+        return row
+    
+    def row_of(self, chart_id: str) -> Optional[int]:
+        """取得 chart_id 的列索引，不存在時回傳 None"""
+        return self._row_of.get(chart_id)
+    
+    def __len__(self) -> int:
+        return len(self._row_of)
+    
+    def __contains__(self, chart_id: str) -> bool:
+        return chart_id in self._row_of
+    
+    def __getitem__(self, row: int) -> ChartMetadata:
+        return ChartMetadata(*(column[row] for column in self.columns.values()))
+    
+    def __iter__(self) -> Iterator[ChartMetadata]:
+        return (self[row] for row in range(len(self)))
+    
+    def get(self, chart_id: str) -> Optional[ChartMetadata]:
+        row = self._row_of.get(chart_id)
+        return None if row is None else self[row]
+    
+    def values(self) -> Iterator[ChartMetadata]:
+        return iter(self)
+    
+    def to_columns(self) -> Dict[str, List[Any]]:
+        """回傳 {欄位名稱: 值列表}，可直接序列化為 JSON"""
+        return {name: list(column) for name, column in self.columns.items()}
+    
+    def chart_ids(self, chart_refs: Iterable[Any]) -> List[str]:
+        """將文檔 metadata 的 chart_references（列索引，舊索引為 chart_id）轉為 chart_id 列表"""
+        chart_ids = self.columns["chart_id"]
+        return [chart_ids[ref] if isinstance(ref, int) and 0 <= ref < len(chart_ids) else ref
+                for ref in chart_refs]
+    
+    def fingerprint(self) -> str:
+        """依列順序的 chart_id 雜湊；向量索引以列索引引用圖表，須與建立時的元數據一致"""
+        payload = "\0".join(self.columns["chart_id"]).encode("utf-8")
+        return hashlib.blake2b(payload, digest_size=16).hexdigest()
+
+@dataclass(frozen=True, **_SLOTS)
 class EnhancedDocument:
     """增強文檔 - 包含圖表資訊"""
     content: str
     metadata: Dict[str, Any]
     chart_references: List[str] = None  # 關聯的圖表ID列表
 
+# 增強的系統提示詞 - 專門支援圖表資訊
+ENHANCED_SYSTEM_PROMPT = (
+    "你是一個基於增強型 RAG 系統的計算機概論家教，能夠同時理解文字內容和圖表資訊。"
+    "請參考以下提供的內容來回答問題，包括文字說明和圖表描述。"
+    "當回答涉及圖表時，請特別說明圖表的內容和意義。"
+    "用詞上請多使用正向鼓勵的詞語，並基於現有問題延伸出更多相關的問題。"
+    "請針對問題舉出簡單好懂的比喻或例子。"
+    "如果內容中包含圖表描述，請善用這些資訊來豐富你的回答。"
+    "如果不知道如何回答問題，請說出來。"
+    "如果問題和計算機概論無關，請將主題拉回計算機概論。"
+    "使用 LaTeX 時，請使用 $ 符號作為塊級公式。"
+    "請用繁體中文回答。\n\n"
+    "{context}"
+)
+
+@lru_cache(maxsize=8)
+def get_enhanced_prompt(system_prompt: str = ENHANCED_SYSTEM_PROMPT) -> "ChatPromptTemplate":
+    """建立（並快取）增強型問答的提示詞模板"""
+    from langchain_core.prompts import ChatPromptTemplate
+    return ChatPromptTemplate.from_messages([
+        ("system", system_prompt),
+        ("human", "{input}"),
+    ])
+
+def _read_json(path: str) -> Any:
+    """讀取 JSON 檔案（orjson 可用時直接解析位元組）"""
+    if ORJSON_AVAILABLE:
+        return orjson.loads(Path(path).read_bytes())
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def _write_json(path: str, data: Any) -> None:
+    """寫入縮排 2 格的 UTF-8 JSON 檔案（orjson 可用時一次編碼為位元組）"""
+    if ORJSON_AVAILABLE:
+        Path(path).write_bytes(orjson.dumps(data, option=orjson.OPT_INDENT_2))
+    else:
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+
+def _scan_pdf_for_charts(pdf_path: str,
+                         processor: Optional[PDFCaptionContextProcessor] = None) -> Tuple[List[Any], List[Document]]:
+    """單次開啟PDF，同時取得 Caption 擷取所需的文字區塊與每頁的原始文字文檔
+    
+    也作為行程池工作函式使用。回傳 (Caption-Context 配對, 原始文字文檔)。
+    """
+    processor = processor or PDFCaptionContextProcessor()
+    text_blocks = []
+    original_documents = []
+    
+    with _fitz().open(pdf_path, filetype="pdf") as pdf_doc:
+        for page_index, page in enumerate(pdf_doc):
+            # 每頁只解析一次：區塊擷取與整頁純文字共用同一個 TextPage
+            textpage = page.get_textpage(flags=page_text_flags())
+            text_blocks.extend(processor.extractor.extract_page_text_blocks(
+                page, page_index + 1, textpage=textpage))
+            # metadata 與 PyPDFLoader 相同：page 從 0 開始
+            original_documents.append(Document(
+                page_content=page.get_text(textpage=textpage),
+                metadata={"source": pdf_path, "page": page_index}
+            ))
+    
+    return processor.process_text_blocks(text_blocks), original_documents
+
 class EnhancedRAGHelper:
     """增強型RAG助手 - 支援圖文混合檢索"""
     
-    def __init__(self, pdf_folder: str, chunk_size: int = 300, chunk_overlap: int = 50):
+    def __init__(self, pdf_folder: str, chunk_size: int = 300, chunk_overlap: int = 50,
+                 result_cache: Optional[DiskCacheManager] = None,
+                 embedding_client: Optional[OpenAIEmbeddingClient] = None):
+        """
+        Args:
+            result_cache: PDF 處理結果快取；指定時以 PDF 內容雜湊為鍵，
+                          重跑時略過解析、描述生成與向量化
+            embedding_client: 分批並行的嵌入用戶端；指定時取代 RAG Helper 的 embeddings
+        """
         self.pdf_folder = pdf_folder
         self.chunk_size = chunk_size
         self.chunk_overlap = chunk_overlap
@@ -67,18 +264,23 @@ class EnhancedRAGHelper:
         # RAG 組件 (委託給RAG Helper)
         self.vectorstore = None
         self.retrieval_chain = None
+        self._chain_vectorstore = None  # 建立 retrieval_chain 時使用的向量庫
         
         # 圖表處理組件 (Enhanced RAG Helper專屬)
         self.caption_processor = PDFCaptionContextProcessor()
         self.description_generator = LLMDescriptionGeneratorV2("mock")
         
-        # 圖表資料庫 (Enhanced RAG Helper專屬)
-        self.chart_metadata: Dict[str, ChartMetadata] = {}
+        # 圖表資料庫 (Enhanced RAG Helper專屬)：欄位式儲存，文檔 metadata 只存其列索引
+        self.chart_metadata = ChartMetadataColumns()
         self.enhanced_documents: List[EnhancedDocument] = []
         
-        # 設定日誌
-        logging.basicConfig(level=logging.INFO)
-        self.logger = logging.getLogger(__name__)
+        # 處理結果快取（以 PDF 內容雜湊為鍵）與最近一次建立語料所用的快取鍵
+        self.result_cache = result_cache
+        self._corpus_keys: List[str] = []
+        self.embedding_client = embedding_client
+        
+        # 日誌由應用程式入口統一設定，此處只取用模組 logger
+        self.logger = logger
         
         self.logger.info("增強型RAG助手初始化完成")
     
@@ -87,11 +289,60 @@ class EnhancedRAGHelper:
         
         self.logger.info(f"開始處理PDF: {pdf_path}")
         
-        # 步驟1：提取Caption (階段A)
-        caption_pairs = self.caption_processor.process_pdf(pdf_path)
-        self.logger.info(f"找到 {len(caption_pairs)} 個Caption")
+        cache_key = self._result_cache_key(pdf_path) if self.result_cache is not None else None
+        cached = self.result_cache.get(cache_key) if cache_key else None
+        if cached is not None:
+            # 快取命中：略過PDF解析與描述生成，只重建本實例的圖表登錄與增強文檔
+            self.logger.info("使用快取的PDF處理結果")
+            original_documents, description_requests, description_results = cached
+        else:
+            # 步驟1：單次掃描PDF，提取Caption (階段A) 並載入原始文字內容
+            caption_pairs, original_documents = _scan_pdf_for_charts(pdf_path, self.caption_processor)
+            self.logger.info(f"找到 {len(caption_pairs)} 個Caption")
+            
+            # 步驟2：生成描述 (階段B)
+            description_requests = self._build_description_requests(caption_pairs)
+            
+            # 批次生成描述
+            if description_requests:
+                self.logger.info(f"開始生成 {len(description_requests)} 個圖表描述")
+                description_results = self.description_generator.batch_generate_descriptions(description_requests)
+            else:
+                description_results = []
+            
+            if cache_key:
+                self.result_cache.set(cache_key, (original_documents, description_requests, description_results))
+        
+        # 步驟3：登錄圖表元數據
+        chart_rows = self._register_charts(
+            os.path.basename(pdf_path), description_requests, description_results
+        )
+        
+        # 步驟4：創建增強文檔 (將圖表描述整合到文字中)
+        enhanced_documents = self._create_enhanced_documents(original_documents, chart_rows)
+        
+        self.logger.info(f"PDF處理完成：{len(enhanced_documents)} 個文檔，{len(chart_rows)} 個圖表")
         
-        # 步驟2：生成描述 (階段B)
+        return enhanced_documents, [self.chart_metadata[row] for row in chart_rows]
+    
+    def _result_cache_key(self, pdf_path: str) -> str:
+        """PDF 處理結果的快取鍵：內容雜湊加上描述提供者（切換到真實LLM後不取回模擬結果）
+        
+        快取鍵會用作檔名，雜湊中的演算法分隔符「:」改為「-」（Windows 檔名不允許冒號）。
+        """
+        provider = self.description_generator.llm_manager.get_current_provider()
+        content_hash = file_content_hash(pdf_path).replace(":", "-")
+        return f"charts-{provider}-{content_hash}"
+    
+    def _vectorstore_cache_key(self) -> str:
+        """向量索引的快取鍵：語料各PDF的處理結果鍵、切塊設定與嵌入模型"""
+        embeddings = self._get_embeddings()
+        model_name = getattr(embeddings, "model", None) or type(embeddings).__name__
+        payload = json.dumps([sorted(self._corpus_keys), self.chunk_size, self.chunk_overlap, model_name])
+        return f"faiss-{hashlib.blake2b(payload.encode('utf-8'), digest_size=16).hexdigest()}"
+    
+    def _build_description_requests(self, caption_pairs) -> List[DescriptionRequest]:
+        """由 Caption-Context 配對建立描述生成請求"""
         description_requests = []
         for pair in caption_pairs:
             caption = pair.caption  # 修正：使用正確的屬性名
@@ -114,24 +365,18 @@ class EnhancedRAGHelper:
             )
             description_requests.append(request)
         
-        # 批次生成描述
-        if description_requests:
-            self.logger.info(f"開始生成 {len(description_requests)} 個圖表描述")
-            description_results = self.description_generator.batch_generate_descriptions(description_requests)
-        else:
-            description_results = []
-        
-        # 步驟3：建立圖表元數據
-        chart_metadata_list = []
-        filename = os.path.basename(pdf_path)
+        return description_requests
+    
+    def _register_charts(self, filename: str, description_requests: List[DescriptionRequest],
+                         description_results) -> List[int]:
+        """將成功的描述生成結果登錄到圖表資料庫，回傳各圖表的列索引"""
+        chart_rows = []
         
         for i, result in enumerate(description_results):
             if result.success:
-                chart_id = f"{filename}_chart_{i+1}"
                 request = description_requests[i]
-                
-                metadata = ChartMetadata(
-                    chart_id=chart_id,
+                chart_rows.append(self.chart_metadata.add(
+                    chart_id=f"{filename}_chart_{i+1}",
                     chart_type=request.caption_type,
                     chart_number=request.caption_number,
                     original_caption=request.caption_text,
@@ -139,46 +384,39 @@ class EnhancedRAGHelper:
                     page_number=request.page_number,
                     confidence_score=result.confidence_score,
                     source_file=filename
-                )
-                chart_metadata_list.append(metadata)
-                self.chart_metadata[chart_id] = metadata
-        
-        # 步驟4：載入原始PDF文字內容
-        from langchain_community.document_loaders import PyPDFLoader
-        loader = PyPDFLoader(pdf_path)
-        original_documents = loader.load()
+                ))
         
-        # 步驟5：創建增強文檔 (將圖表描述整合到文字中)
-        enhanced_documents = self._create_enhanced_documents(original_documents, chart_metadata_list)
-        
-        self.logger.info(f"PDF處理完成：{len(enhanced_documents)} 個文檔，{len(chart_metadata_list)} 個圖表")
-        
-        return enhanced_documents, chart_metadata_list
+        return chart_rows
     
     def _create_enhanced_documents(self, original_documents: List[Document], 
-                                 chart_metadata_list: List[ChartMetadata]) -> List[Document]:
+                                 chart_rows: List[int]) -> List[Document]:
         """創建增強文檔 - 將圖表描述整合到原始文字中"""
         
+        # 只走訪頁碼欄位，一次分組出各頁的圖表列索引
+        columns = self.chart_metadata.columns
+        page_numbers = columns["page_number"]
+        rows_by_page = defaultdict(list)
+        for row in chart_rows:
+            rows_by_page[page_numbers[row]].append(row)
+        
         enhanced_docs = []
         
         for doc in original_documents:
             page_num = doc.metadata.get('page', 0) + 1  # PDF loader的page從0開始
             
             # 找到這一頁的圖表
-            page_charts = [chart for chart in chart_metadata_list 
-                          if chart.page_number == page_num]
+            page_rows = rows_by_page.get(page_num, ())
             
             enhanced_content = doc.page_content
-            chart_refs = []
             
             # 在文檔末尾添加圖表描述
-            if page_charts:
+            if page_rows:
                 enhanced_content += "\n\n--- 本頁圖表說明 ---\n"
-                for chart in page_charts:
-                    chart_section = f"\n{chart.chart_type} {chart.chart_number}：{chart.original_caption}\n"
-                    chart_section += f"詳細描述：{chart.generated_description}\n"
+                for row in page_rows:
+                    chart_section = (f"\n{columns['chart_type'][row]} {columns['chart_number'][row]}："
+                                     f"{columns['original_caption'][row]}\n")
+                    chart_section += f"詳細描述：{columns['generated_description'][row]}\n"
                     enhanced_content += chart_section
-                    chart_refs.append(chart.chart_id)
             
             # 創建增強文檔
             enhanced_doc = Document(
@@ -186,88 +424,242 @@ class EnhancedRAGHelper:
                 metadata={
                     **doc.metadata,
                     'enhanced': True,
-                    'chart_count': len(page_charts),
-                    'chart_references': chart_refs
+                    'chart_count': len(page_rows),
+                    'chart_references': list(page_rows)
                 }
             )
             enhanced_docs.append(enhanced_doc)
         
         return enhanced_docs
     
-    def load_and_prepare_enhanced(self, rebuild_index: bool = False):
-        """載入並準備增強型向量資料庫 - 委託給RAG Helper處理向量化"""
+    async def load_and_prepare_enhanced(self, rebuild_index: bool = False):
+        """prepare_enhanced 的非同步版本：整個載入與建立流程交給執行緒，不佔用事件迴圈"""
+        await asyncio.get_running_loop().run_in_executor(None, self.prepare_enhanced, rebuild_index)
+    
+    def prepare_enhanced(self, rebuild_index: bool = False):
+        """載入並準備增強型向量資料庫 - 以RAG Helper的embeddings建立向量索引
         
-        metadata_path = "chart_metadata.json"
+        圖表元數據與已保存的向量索引都存在時直接載入，不重新嵌入語料。
+        整個流程皆為阻塞工作（檔案 I/O、PDF 處理與嵌入），呼叫端應在執行緒中執行。
+        """
         
         # 檢查是否需要重建索引
-        if not rebuild_index and os.path.exists(metadata_path):
+        if not rebuild_index and os.path.exists(CHART_METADATA_PATH):
             self.logger.info("載入現有的圖表元數據...")
             
             # 載入圖表元數據
-            with open(metadata_path, 'r', encoding='utf-8') as f:
-                metadata_data = json.load(f)
-                self.chart_metadata = {
-                    chart_id: ChartMetadata(**data) 
-                    for chart_id, data in metadata_data.items()
-                }
+            self.chart_metadata = ChartMetadataColumns.from_json_data(_read_json(CHART_METADATA_PATH))
             
             self.logger.info(f"載入完成：{len(self.chart_metadata)} 個圖表元數據")
-        else:
-            # 重建索引 - 先處理圖表描述
-            self.logger.info("建立增強型文檔...")
-            
-            all_enhanced_docs = []
-            all_chart_metadata = []
             
-            # 處理所有PDF檔案，生成增強文檔
-            pdf_files = glob.glob(os.path.join(self.pdf_folder, "*.pdf"))
+            # 已有保存的向量索引時直接載入
+            self.vectorstore = self._load_persisted_vectorstore()
+            if self.vectorstore is not None:
+                self.logger.info("載入現有的增強型向量索引，略過向量化")
+                return
             
+            self.logger.info("未找到可用的向量索引，重新建立增強型文檔")
+        
+        enhanced_docs = self._prepare_enhanced_documents()
+        
+        # 增強文檔直接在記憶體中交給向量庫，不經過暫存檔
+        self.logger.info("建立增強型向量索引...")
+        self.vectorstore = self._build_or_load_cached_vectorstore(enhanced_docs)
+        self._persist_vectorstore()
+        
+        self.logger.info("增強型RAG系統準備完成")
+    
+    def _prepare_enhanced_documents(self) -> List[Document]:
+        """處理所有PDF的圖表描述，保存圖表元數據並回傳增強文檔"""
+        self.logger.info("建立增強型文檔...")
+        
+        all_enhanced_docs = []
+        
+        # 步驟0：內容未變的PDF直接取用快取的 (原始文檔, 描述請求, 描述結果)
+        pdf_files = glob.glob(os.path.join(self.pdf_folder, "*.pdf"))
+        processed = {}
+        cache_keys = {}
+        if self.result_cache is not None:
             for pdf_path in pdf_files:
-                try:
-                    enhanced_docs, chart_metadata = self.process_pdf_with_charts(pdf_path)
-                    all_enhanced_docs.extend(enhanced_docs)
-                    all_chart_metadata.extend(chart_metadata)
-                except Exception as e:
-                    self.logger.error(f"處理 {pdf_path} 時發生錯誤: {e}")
-                    continue
-            
-            if not all_enhanced_docs:
-                raise ValueError("沒有成功處理任何PDF檔案")
-            
-            # 保存圖表元數據
-            with open(metadata_path, 'w', encoding='utf-8') as f:
-                metadata_dict = {chart_id: asdict(metadata) 
-                               for chart_id, metadata in self.chart_metadata.items()}
-                json.dump(metadata_dict, f, ensure_ascii=False, indent=2)
-            
-            # 將增強文檔寫入pdf_folder，讓RAG Helper處理
-            temp_enhanced_folder = os.path.join(self.pdf_folder, "enhanced_docs")
-            os.makedirs(temp_enhanced_folder, exist_ok=True)
-            
-            for i, doc in enumerate(all_enhanced_docs):
-                temp_file = os.path.join(temp_enhanced_folder, f"enhanced_doc_{i}.txt")
-                with open(temp_file, 'w', encoding='utf-8') as f:
-                    f.write(doc.page_content)
-            
-            self.logger.info(f"增強文檔準備完成：{len(all_enhanced_docs)} 個文檔，{len(self.chart_metadata)} 個圖表")
+                cache_keys[pdf_path] = self._result_cache_key(pdf_path)
+                cached = self.result_cache.get(cache_keys[pdf_path])
+                if cached is not None:
+                    processed[pdf_path] = cached
+            if processed:
+                self.logger.info(f"{len(processed)} 個PDF使用快取的處理結果")
+        
+        # 步驟1：以多行程平行掃描其餘PDF，一次取得Caption與原始文字（CPU 密集的解析工作）
+        pending_files = [pdf_path for pdf_path in pdf_files if pdf_path not in processed]
+        extracted = {}
+        
+        if pending_files:
+            # 以 spawn 建立子行程：在多執行緒的 Web 服務中 fork 可能複製到他執行緒持有的鎖而死結
+            with ProcessPoolExecutor(max_workers=min(len(pending_files), os.cpu_count() or 1),
+                                     mp_context=multiprocessing.get_context("spawn")) as executor:
+                futures = {executor.submit(_scan_pdf_for_charts, pdf_path): pdf_path for pdf_path in pending_files}
+                for future in as_completed(futures):
+                    pdf_path = futures[future]
+                    try:
+                        extracted[pdf_path] = future.result()
+                    except Exception as e:
+                        self.logger.error(f"處理 {pdf_path} 時發生錯誤: {e}")
+        
+        # 步驟2：合併所有PDF的描述請求，一次批次生成（維持檔案順序以保持結果穩定）
+        pdf_jobs = []
+        all_requests: List[DescriptionRequest] = []
+        for pdf_path in pending_files:
+            if pdf_path not in extracted:
+                continue
+            caption_pairs, original_documents = extracted[pdf_path]
+            requests = self._build_description_requests(caption_pairs)
+            pdf_jobs.append((pdf_path, original_documents, len(all_requests), len(requests)))
+            all_requests.extend(requests)
+        
+        if all_requests:
+            self.logger.info(f"開始生成 {len(all_requests)} 個圖表描述（{len(pdf_jobs)} 個PDF）")
+            all_results = self.description_generator.batch_generate_descriptions(all_requests)
+        else:
+            all_results = []
+        
+        for pdf_path, original_documents, start, count in pdf_jobs:
+            processed[pdf_path] = (
+                original_documents,
+                all_requests[start:start + count],
+                all_results[start:start + count]
+            )
+            if self.result_cache is not None:
+                self.result_cache.set(cache_keys[pdf_path], processed[pdf_path])
+        
+        # 步驟3：依PDF建立圖表元數據與增強文檔（依檔案順序，快取命中與否結果一致）
+        for pdf_path in pdf_files:
+            if pdf_path not in processed:
+                continue
+            original_documents, requests, results = processed[pdf_path]
+            chart_rows = self._register_charts(os.path.basename(pdf_path), requests, results)
+            all_enhanced_docs.extend(self._create_enhanced_documents(original_documents, chart_rows))
+        self._corpus_keys = [cache_keys[pdf_path] for pdf_path in pdf_files
+                             if pdf_path in processed and pdf_path in cache_keys]
+        
+        if not all_enhanced_docs:
+            raise ValueError("沒有成功處理任何PDF檔案")
+        
+        # 保存圖表元數據（欄位式：每個欄位一個列表）
+        _write_json(CHART_METADATA_PATH, self.chart_metadata.to_columns())
+        
+        self.logger.info(f"增強文檔準備完成：{len(all_enhanced_docs)} 個文檔，{len(self.chart_metadata)} 個圖表")
+        return all_enhanced_docs
+    
+    def _get_embeddings(self):
+        """取得建立與載入索引共用的 embeddings（優先使用指定的嵌入用戶端），確保使用同一模型"""
+        if self.embedding_client is not None:
+            return self.embedding_client
+        return getattr(self.rag_helper, "embeddings", None)
+    
+    def _build_vectorstore(self, documents: List[Document]):
+        """依 RAG Helper 的切塊設定切分增強文檔，並建立 FAISS 向量索引"""
+        embeddings = self._get_embeddings()
+        if embeddings is None:
+            raise ValueError("RAG Helper 未提供 embeddings，無法建立向量索引")
         
-        # 委託RAG Helper進行向量化
-        self.logger.info("委託RAG Helper進行向量化...")
-        import asyncio
+        from langchain_community.vectorstores import FAISS
+        from langchain_text_splitters import RecursiveCharacterTextSplitter
         
-        # 創建新的RAG Helper實例專門處理增強文檔
-        enhanced_rag = RAGHelper(
-            pdf_folder=self.pdf_folder,
+        splitter = RecursiveCharacterTextSplitter(
             chunk_size=self.chunk_size,
             chunk_overlap=self.chunk_overlap
         )
-        asyncio.run(enhanced_rag.load_and_prepare(['.pdf', '.txt']))
+        chunks = splitter.split_documents(documents)
+        if len(chunks) <= IVF_MIN_VECTORS:
+            return FAISS.from_documents(chunks, embeddings)
+        return self._build_ivf_vectorstore(chunks, embeddings)
+    
+    def _build_ivf_vectorstore(self, chunks: List[Document], embeddings):
+        """以 IndexIVFFlat 建立向量索引（L2 距離，與 FAISS.from_documents 預設一致）
+        
+        隨機抽樣約 50·nlist 個向量訓練分群中心後加入全部向量；
+        nprobe 隨索引一起由 save_local / load_local 保存與載入。
+        """
+        import faiss
+        import numpy as np
+        from langchain_community.docstore.in_memory import InMemoryDocstore
+        from langchain_community.vectorstores import FAISS
+        
+        vectors = np.asarray(embeddings.embed_documents([chunk.page_content for chunk in chunks]), dtype='float32')
+        count, dimension = vectors.shape
+        nlist = int(math.sqrt(count))
+        
+        index = faiss.IndexIVFFlat(faiss.IndexFlatL2(dimension), dimension, nlist, faiss.METRIC_L2)
+        sample_size = min(count, IVF_TRAIN_SAMPLES_PER_LIST * nlist)
+        index.train(vectors[np.random.default_rng(0).choice(count, size=sample_size, replace=False)])
+        index.add(vectors)
+        index.nprobe = max(1, nlist // 16)
+        self.logger.info(f"建立 IVF 向量索引：{count} 個向量，nlist={nlist}，nprobe={index.nprobe}")
+        
+        doc_ids = [str(uuid.uuid4()) for _ in chunks]
+        return FAISS(
+            embedding_function=embeddings,
+            index=index,
+            docstore=InMemoryDocstore(dict(zip(doc_ids, chunks))),
+            index_to_docstore_id=dict(enumerate(doc_ids)),
+        )
+    
+    def _build_or_load_cached_vectorstore(self, documents: List[Document]):
+        """語料與設定未變時由結果快取載入向量索引，否則重新建立並存入快取"""
+        if self.result_cache is None or not self._corpus_keys:
+            return self._build_vectorstore(documents)
+        
+        index_dir = str(self.result_cache.artifact_directory(self._vectorstore_cache_key()))
+        vectorstore = self._load_persisted_vectorstore(index_dir)
+        if vectorstore is not None:
+            self.logger.info("由結果快取載入向量索引，略過向量化")
+            return vectorstore
+        
+        vectorstore = self._build_vectorstore(documents)
+        try:
+            self._save_vectorstore(vectorstore, index_dir)
+        except Exception as e:
+            self.logger.warning(f"向量索引寫入快取失敗: {e}")
+        return vectorstore
+    
+    def _save_vectorstore(self, vectorstore, index_path: str) -> None:
+        """保存向量索引與目前圖表元數據的指紋"""
+        vectorstore.save_local(index_path)
+        Path(index_path, INDEX_FINGERPRINT_FILE).write_text(self.chart_metadata.fingerprint(), encoding="utf-8")
+    
+    def _load_persisted_vectorstore(self, index_path: str = ENHANCED_INDEX_PATH):
+        """載入已保存的 FAISS 增強型向量索引，不存在、與目前圖表元數據不一致或無法載入時回傳 None"""
+        if not os.path.isdir(index_path):
+            return None
         
-        # 獲取RAG Helper的vectorstore
-        self.vectorstore = enhanced_rag.vectorstore
-        self.rag_helper = enhanced_rag  # 更新引用
+        try:
+            saved_fingerprint = Path(index_path, INDEX_FINGERPRINT_FILE).read_text(encoding="utf-8").strip()
+        except OSError:
+            saved_fingerprint = None
+        if saved_fingerprint != self.chart_metadata.fingerprint():
+            self.logger.warning(f"向量索引 {index_path} 與目前的圖表元數據不一致，改為重新建立")
+            return None
+        
+        embeddings = self._get_embeddings()
+        if embeddings is None:
+            self.logger.warning("RAG Helper 未提供 embeddings，無法載入既有向量索引")
+            return None
         
-        self.logger.info("增強型RAG系統準備完成")
+        try:
+            from langchain_community.vectorstores import FAISS
+            return FAISS.load_local(index_path, embeddings, allow_dangerous_deserialization=True)
+        except Exception as e:
+            self.logger.warning(f"載入既有向量索引失敗，改為重新建立: {e}")
+            return None
+    
+    def _persist_vectorstore(self):
+        """保存向量索引，供下次啟動直接載入"""
+        if not hasattr(self.vectorstore, "save_local"):
+            return
+        
+        try:
+            self._save_vectorstore(self.vectorstore, ENHANCED_INDEX_PATH)
+        except Exception as e:
+            self.logger.warning(f"保存向量索引失敗: {e}")
     
     def setup_enhanced_retrieval_chain(self):
         """設定增強型檢索鏈 - 保持圖表支援特性"""
@@ -275,6 +667,10 @@ class EnhancedRAGHelper:
         if not self.vectorstore:
             raise ValueError("請先執行 load_and_prepare_enhanced()")
         
+        # 同一個向量庫已建立過檢索鏈時直接沿用
+        if self.retrieval_chain is not None and self._chain_vectorstore is self.vectorstore:
+            return
+        
         # 使用Mock LLM用於測試 (未來可整合到RAG Helper的LLM切換功能)
         from enhanced_version.backend.llm_providers_sB import LLMManager, LLMRequest
         
@@ -308,29 +704,15 @@ class EnhancedRAGHelper:
             search_kwargs={"k": 5}  # 檢索前5個最相關的段落
         )
         
-        # 增強的提示詞模板 - 專門支援圖表資訊
-        system_prompt = (
-            "你是一個基於增強型 RAG 系統的計算機概論家教，能夠同時理解文字內容和圖表資訊。"
-            "請參考以下提供的內容來回答問題，包括文字說明和圖表描述。"
-            "當回答涉及圖表時，請特別說明圖表的內容和意義。"
-            "用詞上請多使用正向鼓勵的詞語，並基於現有問題延伸出更多相關的問題。"
-            "請針對問題舉出簡單好懂的比喻或例子。"
-            "如果內容中包含圖表描述，請善用這些資訊來豐富你的回答。"
-            "如果不知道如何回答問題，請說出來。"
-            "如果問題和計算機概論無關，請將主題拉回計算機概論。"
-            "使用 LaTeX 時，請使用 $ 符號作為塊級公式。"
-            "請用繁體中文回答。\n\n"
-            "{context}"
-        )
-        
-        prompt = ChatPromptTemplate.from_messages([
-            ("system", system_prompt),
-            ("human", "{input}"),
-        ])
+        # 增強的提示詞模板 - 專門支援圖表資訊（模組層級快取，重建檢索鏈時不重新解析）
+        prompt = get_enhanced_prompt()
         
         # 創建文檔合併鏈和檢索鏈
+        from langchain.chains import create_retrieval_chain
+        from langchain.chains.combine_documents import create_stuff_documents_chain
         question_answer_chain = create_stuff_documents_chain(llm, prompt)
         self.retrieval_chain = create_retrieval_chain(retriever, question_answer_chain)
+        self._chain_vectorstore = self.vectorstore
         
         self.logger.info("增強型檢索鏈設定完成 (向量化委託給RAG Helper，圖表功能保留)")
     
@@ -343,25 +725,75 @@ class EnhancedRAGHelper:
         try:
             # 執行檢索和問答
             result = self.retrieval_chain.invoke({"input": query})
-            answer = result["answer"]
-            context_docs = result["context"]
-            
-            # 找出相關的圖表
-            related_charts = []
-            for doc in context_docs:
-                chart_refs = doc.metadata.get('chart_references', [])
-                for chart_id in chart_refs:
-                    if chart_id in self.chart_metadata:
-                        chart = self.chart_metadata[chart_id]
-                        if chart not in related_charts:
-                            related_charts.append(chart)
-            
-            return answer, context_docs, related_charts
+            return self._build_enhanced_answer(result)
             
         except Exception as e:
             self.logger.error(f"問答過程中發生錯誤: {e}")
             raise e
     
+    def ask_enhanced_batch(self, queries: List[str]
+                           ) -> List[Union[Tuple[str, List[Document], List[ChartMetadata]], Exception]]:
+        """批次增強型問答 - 一次呼叫檢索鏈處理多個問題，結果順序與輸入相同
+        
+        個別問題失敗時該位置為其例外物件，不影響同批次的其他問題。
+        """
+        
+        if not self.retrieval_chain:
+            raise ValueError("請先執行 setup_enhanced_retrieval_chain()")
+        
+        results = self.retrieval_chain.batch([{"input": query} for query in queries], return_exceptions=True)
+        answers = []
+        for query, result in zip(queries, results):
+            if not isinstance(result, Exception):
+                try:
+                    result = self._build_enhanced_answer(result)
+                except Exception as e:
+                    result = e
+            if isinstance(result, Exception):
+                self.logger.error(f"批次問答過程中發生錯誤（{query[:30]}）: {result}")
+            answers.append(result)
+        return answers
+    
+    def ask_enhanced_stream(self, query: str) -> Iterator[Dict[str, Any]]:
+        """串流增強型問答 - 逐段產生 {"token": ...}，最後產生含完整答案、文檔與圖表的結果"""
+        
+        if not self.retrieval_chain:
+            raise ValueError("請先執行 setup_enhanced_retrieval_chain()")
+        
+        answer_parts = []
+        context_docs: List[Document] = []
+        
+        for chunk in self.retrieval_chain.stream({"input": query}):
+            if "context" in chunk:
+                context_docs = chunk["context"]
+            if chunk.get("answer"):
+                answer_parts.append(chunk["answer"])
+                yield {"token": chunk["answer"]}
+        
+        answer, context_docs, related_charts = self._build_enhanced_answer(
+            {"answer": "".join(answer_parts), "context": context_docs}
+        )
+        yield {"answer": answer, "context": context_docs, "charts": related_charts}
+    
+    def _build_enhanced_answer(self, result: Dict[str, Any]) -> Tuple[str, List[Document], List[ChartMetadata]]:
+        """從檢索鏈結果取出答案、相關文檔，並找出相關的圖表"""
+        answer = result["answer"]
+        context_docs = result["context"]
+        
+        # 找出相關的圖表（以列索引集合去重；相容舊索引中以字串保存的 chart_id）
+        related_charts = []
+        seen_chart_idx = set()
+        chart_count = len(self.chart_metadata)
+        for doc in context_docs:
+            for chart_ref in doc.metadata.get('chart_references', ()):
+                idx = chart_ref if isinstance(chart_ref, int) else self.chart_metadata.row_of(chart_ref)
+                if idx is None or idx in seen_chart_idx or idx >= chart_count:
+                    continue
+                seen_chart_idx.add(idx)
+                related_charts.append(self.chart_metadata[idx])
+        
+        return answer, context_docs, related_charts
+    
     def get_chart_by_id(self, chart_id: str) -> Optional[ChartMetadata]:
         """根據ID獲取圖表元數據"""
         return self.chart_metadata.get(chart_id)
@@ -372,9 +804,7 @@ class EnhancedRAGHelper:
     
     def get_statistics(self) -> Dict[str, Any]:
         """獲取系統統計資訊"""
-        chart_types = {}
-        for chart in self.chart_metadata.values():
-            chart_types[chart.chart_type] = chart_types.get(chart.chart_type, 0) + 1
+        chart_types = dict(Counter(self.chart_metadata.columns["chart_type"]))
         
         return {
             "total_charts": len(self.chart_metadata),
@@ -385,6 +815,8 @@ class EnhancedRAGHelper:
         }
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    
     # 基本測試
     pdf_folder = "../../pdfFiles"
     rag = EnhancedRAGHelper(pdf_folder)
@@ -394,7 +826,7 @@ if __name__ == "__main__":
     
     # 載入和準備
     try:
-        rag.load_and_prepare_enhanced(rebuild_index=False)
+        asyncio.run(rag.load_and_prepare_enhanced(rebuild_index=False))
         rag.setup_enhanced_retrieval_chain()
         
         # 顯示統計資訊
@@ -4,15 +4,79 @@
 階段B：LLM描述生成器 v2 - 支援多種LLM後端
 """
 
+import asyncio
 import logging
-from typing import List, Dict, Optional
-from dataclasses import dataclass
+import re
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from operator import attrgetter
+from typing import Callable, List, Dict, Optional, Tuple
+from dataclasses import dataclass, asdict, replace
 import time
 import json
 from datetime import datetime
+from pathlib import Path
+
+# orjson 為選用套件，未安裝時使用標準庫 json
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
 
 # 導入LLM提供者
-from enhanced_version.backend.llm_providers_sB import LLMManager, LLMRequest
+from enhanced_version.backend.llm_providers_sB import LLMManager, LLMRequest, LLMResponse, PACKED_ITEMS_MARKER, run_sync
+from enhanced_version.backend.description_cache_sB import CacheStrategy, SQLiteCache, make_cache_key
+
+# Python 3.10+ 才支援 dataclass(slots=True)
+_SLOTS = {"slots": True} if sys.version_info >= (3, 10) else {}
+
+# 所有描述請求共用的系統訊息與提示詞前綴；保持逐字不變才能命中提供者的前綴快取
+DESCRIPTION_SYSTEM_MESSAGE = "你是一個專業的學術文件分析助手，擅長為圖表生成清晰、準確的文字描述。"
+
+DESCRIPTION_PROMPT_PREFIX = """你是一個專業的學術文件分析助手。請根據下方的圖表資訊，為圖表生成一個詳細、準確的文字描述。
+
+【任務要求】
+請依圖表類型說明描述內容，生成一個 100-200 字的完整描述，包含：
+1. 圖表的主要內容或主題
+2. 關鍵資訊或數據（如果有）
+3. 在文件中的作用或意義
+4. 與上下文的關聯性
+
+【回應格式】
+請只回傳描述文字，不要包含額外說明。
+
+"""
+
+# 個別請求後綴：靜態部分只在載入時建立一次，每次呼叫只代入欄位
+_PROMPT_SUFFIX_TMPL = """【圖表資訊】
+- 類型：{t}
+- 編號：{n}
+- 原始說明：{c}
+- 頁碼：第{p}頁
+- 類型說明：{instr}
+
+【相關內文脈絡】
+{ctx}
+
+描述：""".format
+
+_INSTR_FIG = "這是一個圖片/圖表。請描述其視覺內容、數據關係或概念說明。"
+_INSTR_TAB = "這是一個表格。請描述其數據結構、統計內容或資訊整理。"
+_NO_CONTEXT = "無相關內文"
+
+# 完整性檢查的標記詞
+_MARKER_RE = re.compile("[圖表]|顯示")
+
+# 結果欄位存取器（C 層級的 callable，供 map / filter 使用）
+_success = attrgetter('success')
+
+# 批次生成時每個結果就緒的回呼：(請求索引, 結果)
+ResultCallback = Callable[[int, "DescriptionResult"], None]
+
+# Batch API 工作的終止狀態
+BATCH_TERMINAL_STATUSES = frozenset({"completed", "failed", "expired", "cancelled"})
 
 @dataclass
 class DescriptionRequest:
@@ -22,8 +86,12 @@ class DescriptionRequest:
     caption_number: str
     related_context: List[str]
     page_number: int
+    
+    def __post_init__(self):
+        # 預先切分內文詞彙，供信心度計算重用（非 dataclass 欄位，不影響 asdict / 快取鍵）
+        self._context_sets = [frozenset(c.split()) for c in self.related_context]
 
-@dataclass
+@dataclass(frozen=True, **_SLOTS)
 class DescriptionResult:
     """描述生成結果"""
     original_caption: str
@@ -38,128 +106,203 @@ class DescriptionResult:
 class LLMDescriptionGeneratorV2:
     """LLM描述生成器 v2"""
     
-    def __init__(self, preferred_provider: str = "auto"):
+    def __init__(self, preferred_provider: str = "auto",
+                 cache: Optional[CacheStrategy] = None, use_cache: bool = False):
         """初始化生成器
         
         Args:
             preferred_provider: 偏好的LLM提供者 ("auto", "mock", "openai", "local")
+            cache: 描述快取實作；指定時即啟用快取
+            use_cache: 未指定 cache 時是否啟用預設的 SQLite 快取（預設不啟用）
         """
         self.llm_manager = LLMManager(preferred_provider)
+        self.cache = cache if cache is not None else (SQLiteCache() if use_cache else None)
         
-        # 設定日誌
-        logging.basicConfig(level=logging.INFO)
+        # 日誌由應用程式入口統一設定，此處只取用模組 logger
         self.logger = logging.getLogger(__name__)
         
         # 統計資訊
         self.total_tokens_used = 0
         self.total_requests = 0
+        self.cache_hits = 0
+        self._stats_lock = threading.Lock()
         
         self.logger.info(f"描述生成器初始化完成，使用LLM提供者: {self.llm_manager.get_current_provider()}")
     
+    def __reduce__(self):
+        """以建構參數重建，供 multiprocessing 傳遞到子行程
+        
+        鎖、HTTP 連線池與快取連線都無法序列化，子行程會依相同設定重新建立；
+        統計資訊不隨之傳遞，各行程分別累計。
+        """
+        return (type(self), (self.llm_manager.preferred_provider, self.cache, self.cache is not None))
+    
+    def create_prompt_parts(self, request: DescriptionRequest) -> Tuple[str, str]:
+        """建立提示詞的 (可快取前綴, 個別請求後綴)
+        
+        不變的說明放在最前面，讓提供者的前綴快取（prompt caching）能在同一批次中重用。
+        """
+        suffix = _PROMPT_SUFFIX_TMPL(
+            t=request.caption_type,
+            n=request.caption_number,
+            c=request.caption_text,
+            p=request.page_number,
+            instr=_INSTR_FIG if request.caption_type == '圖' else _INSTR_TAB,
+            ctx="\n".join(request.related_context) if request.related_context else _NO_CONTEXT
+        )
+        return DESCRIPTION_PROMPT_PREFIX, suffix
+    
     def create_prompt_template(self, request: DescriptionRequest) -> str:
-        """建立提示詞模板"""
+        """建立提示詞模板（前綴在前、個別內容在後）"""
+        prefix, suffix = self.create_prompt_parts(request)
+        return prefix + suffix
+    
+    def _build_llm_request(self, request: DescriptionRequest) -> LLMRequest:
+        """建立LLM請求"""
+        return LLMRequest(
+            prompt=self.create_prompt_template(request),
+            max_tokens=300,
+            temperature=0.3,
+            system_message=DESCRIPTION_SYSTEM_MESSAGE
+        )
+    
+    def _streamed_response(self, chunks: List[str], usage: Dict[str, int],
+                           start_time: float) -> LLMResponse:
+        """將串流片段組合為完整回應"""
+        return LLMResponse(
+            content="".join(chunks),
+            success=True,
+            processing_time=time.time() - start_time,
+            token_usage=usage,
+            provider=self.llm_manager.get_current_provider()
+        )
+    
+    def _build_result(self, request: DescriptionRequest, llm_response: LLMResponse,
+                      start_time: float) -> DescriptionResult:
+        """將LLM回應整理為描述結果"""
+        if not llm_response.success:
+            raise Exception(llm_response.error_message or "LLM調用失敗")
         
-        # 根據圖表類型調整提示詞
-        if request.caption_type == '圖':
-            type_instruction = "這是一個圖片/圖表。請描述其視覺內容、數據關係或概念說明。"
-        else:  # 表
-            type_instruction = "這是一個表格。請描述其數據結構、統計內容或資訊整理。"
+        # 清理描述文字
+        description = llm_response.content.strip()
+        if description.startswith("描述："):
+            description = description[3:].strip()
         
-        # 組合相關內文
-        context_text = "\n".join(request.related_context) if request.related_context else "無相關內文"
+        # 計算處理時間
+        processing_time = time.time() - start_time
         
-        prompt = f"""你是一個專業的學術文件分析助手。請根據以下資訊，為圖表生成一個詳細、準確的文字描述。
-
-【圖表資訊】
-- 類型：{request.caption_type}
-- 編號：{request.caption_number}
-- 原始說明：{request.caption_text}
-- 頁碼：第{request.page_number}頁
-
-【相關內文脈絡】
-{context_text}
-
-【任務要求】
-{type_instruction}
-
-請生成一個 100-200 字的完整描述，包含：
-1. 圖表的主要內容或主題
-2. 關鍵資訊或數據（如果有）
-3. 在文件中的作用或意義
-4. 與上下文的關聯性
-
-【回應格式】
-請只回傳描述文字，不要包含額外說明。
-
-描述："""
-
-        return prompt
+        # 更新統計（執行緒池批次會並行呼叫）
+        with self._stats_lock:
+            self.total_tokens_used += llm_response.token_usage.get('total_tokens', 0)
+            self.total_requests += 1
+        
+        # 計算信心度
+        confidence = self._calculate_confidence(description, request, llm_response.provider)
+        
+        self.logger.info(f"描述生成成功，耗時 {processing_time:.2f}s，使用 {llm_response.token_usage.get('total_tokens', 0)} tokens")
+        
+        return DescriptionResult(
+            original_caption=request.caption_text,
+            generated_description=description,
+            confidence_score=confidence,
+            processing_time=processing_time,
+            token_usage=llm_response.token_usage,
+            success=True,
+            llm_provider=llm_response.provider
+        )
+    
+    def _build_error_result(self, request: DescriptionRequest, error: Exception,
+                            start_time: float) -> DescriptionResult:
+        """建立失敗結果"""
+        error_msg = f"描述生成失敗：{str(error)}"
+        self.logger.error(error_msg)
+        
+        return DescriptionResult(
+            original_caption=request.caption_text,
+            generated_description="",
+            confidence_score=0.0,
+            processing_time=time.time() - start_time,
+            token_usage={},
+            success=False,
+            llm_provider=self.llm_manager.get_current_provider(),
+            error_message=error_msg
+        )
+    
+    # ==================== 描述快取 ====================
+    
+    def _cache_key(self, request: DescriptionRequest) -> str:
+        return make_cache_key(request, self.llm_manager.get_current_provider())
+    
+    def _get_cached(self, request: DescriptionRequest, start_time: float) -> Optional[DescriptionResult]:
+        """查詢快取，命中時回傳結果（計入請求數與快取命中數，不計入 token 統計）"""
+        if self.cache is None:
+            return None
+        data = self.cache.get(self._cache_key(request))
+        if data is None:
+            return None
+        with self._stats_lock:
+            self.total_requests += 1
+            self.cache_hits += 1
+        data["processing_time"] = time.time() - start_time
+        return DescriptionResult(**data)
+    
+    def _store_cached(self, request: DescriptionRequest, result: DescriptionResult) -> None:
+        """只快取成功的結果"""
+        if self.cache is not None and result.success:
+            self.cache.set(self._cache_key(request), asdict(result))
+    
+    def find_uncached_requests(self, requests: List[DescriptionRequest]
+                               ) -> Tuple[List[Optional[DescriptionResult]], List[int]]:
+        """將請求分為已快取與未快取
+        
+        Returns:
+            (與 requests 等長的結果列表，未命中處為 None；未命中請求的索引)
+        """
+        start_time = time.time()
+        results = [self._get_cached(r, start_time) for r in requests]
+        uncached = [i for i, result in enumerate(results) if result is None]
+        return results, uncached
     
     def generate_description(self, request: DescriptionRequest) -> DescriptionResult:
         """生成單個圖表描述"""
         start_time = time.time()
         
+        cached = self._get_cached(request, start_time)
+        if cached is not None:
+            return cached
+        
         try:
-            # 建立提示詞
-            prompt = self.create_prompt_template(request)
-            
             self.logger.info(f"正在生成描述：{request.caption_type} {request.caption_number}")
-            
-            # 建立LLM請求
-            llm_request = LLMRequest(
-                prompt=prompt,
-                max_tokens=300,
-                temperature=0.3,
-                system_message="你是一個專業的學術文件分析助手，擅長為圖表生成清晰、準確的文字描述。"
-            )
-            
-            # 調用LLM
-            llm_response = self.llm_manager.generate(llm_request)
-            
-            if not llm_response.success:
-                raise Exception(llm_response.error_message or "LLM調用失敗")
-            
-            # 清理描述文字
-            description = llm_response.content.strip()
-            if description.startswith("描述："):
-                description = description[3:].strip()
-            
-            # 計算處理時間
-            processing_time = time.time() - start_time
-            
-            # 更新統計
-            self.total_tokens_used += llm_response.token_usage.get('total_tokens', 0)
-            self.total_requests += 1
-            
-            # 計算信心度
-            confidence = self._calculate_confidence(description, request, llm_response.provider)
-            
-            self.logger.info(f"描述生成成功，耗時 {processing_time:.2f}s，使用 {llm_response.token_usage.get('total_tokens', 0)} tokens")
-            
-            return DescriptionResult(
-                original_caption=request.caption_text,
-                generated_description=description,
-                confidence_score=confidence,
-                processing_time=processing_time,
-                token_usage=llm_response.token_usage,
-                success=True,
-                llm_provider=llm_response.provider
-            )
-            
+            # 串流接收，片段先收集在 list 中最後一次 join
+            usage: Dict[str, int] = {}
+            chunks = list(self.llm_manager.generate_stream(self._build_llm_request(request), usage))
+            llm_response = self._streamed_response(chunks, usage, start_time)
+            result = self._build_result(request, llm_response, start_time)
         except Exception as e:
-            error_msg = f"描述生成失敗：{str(e)}"
-            self.logger.error(error_msg)
-            
-            return DescriptionResult(
-                original_caption=request.caption_text,
-                generated_description="",
-                confidence_score=0.0,
-                processing_time=time.time() - start_time,
-                token_usage={},
-                success=False,
-                llm_provider=self.llm_manager.get_current_provider(),
-                error_message=error_msg
-            )
+            return self._build_error_result(request, e, start_time)
+        
+        self._store_cached(request, result)
+        return result
+    
+    async def agenerate_description(self, request: DescriptionRequest) -> DescriptionResult:
+        """非同步生成單個圖表描述"""
+        start_time = time.time()
+        
+        cached = self._get_cached(request, start_time)
+        if cached is not None:
+            return cached
+        
+        try:
+            self.logger.info(f"正在生成描述：{request.caption_type} {request.caption_number}")
+            usage: Dict[str, int] = {}
+            chunks = [chunk async for chunk in self.llm_manager.agenerate_stream(self._build_llm_request(request), usage)]
+            llm_response = self._streamed_response(chunks, usage, start_time)
+            result = self._build_result(request, llm_response, start_time)
+        except Exception as e:
+            return self._build_error_result(request, e, start_time)
+        
+        self._store_cached(request, result)
+        return result
     
     def _calculate_confidence(self, description: str, request: DescriptionRequest, provider: str) -> float:
         """計算描述品質的信心度"""
@@ -181,49 +324,316 @@ class LLMDescriptionGeneratorV2:
         if request.caption_number in description or request.caption_type in description:
             score += 0.1
         
-        # 內容相關性檢查
-        if request.related_context:
-            for context in request.related_context:
-                # 簡單的關鍵詞匹配
-                common_words = set(context.split()) & set(description.split())
-                if len(common_words) > 2:
-                    score += 0.1
-                    break
+        # 內容相關性檢查：任一段內文與描述共用超過 2 個詞
+        if request._context_sets:
+            desc_set = set(description.split())
+            if any(len(cs & desc_set) > 2 for cs in request._context_sets):
+                score += 0.1
         
         # 完整性檢查
-        if "圖" in description or "表" in description or "顯示" in description:
+        if _MARKER_RE.search(description):
             score += 0.1
         
         return min(score, 1.0)
     
+    @staticmethod
+    def _dedup_key(request: DescriptionRequest) -> Tuple:
+        return (request.caption_text, request.caption_type, request.caption_number,
+                tuple(request.related_context), request.page_number)
+    
+    def _dedup_indices(self, requests: List[DescriptionRequest],
+                       indices: List[int]) -> Tuple[List[int], Dict[int, int]]:
+        """批次內去重
+        
+        Returns:
+            (需實際生成的索引, 重複請求索引 -> 代表請求索引)
+        """
+        first_of: Dict[Tuple, int] = {}
+        unique: List[int] = []
+        duplicates: Dict[int, int] = {}
+        for i in indices:
+            key = self._dedup_key(requests[i])
+            if key in first_of:
+                duplicates[i] = first_of[key]
+            else:
+                first_of[key] = i
+                unique.append(i)
+        return unique, duplicates
+    
+    @staticmethod
+    def _fan_out_duplicates(results: List[Optional[DescriptionResult]],
+                            duplicates: Dict[int, int]) -> None:
+        """將代表請求的結果複製給重複請求"""
+        for i, source in duplicates.items():
+            results[i] = replace(results[source])
+    
+    def generate_descriptions(self, requests: List[DescriptionRequest]) -> List[DescriptionResult]:
+        """一次生成多個圖表描述，回傳順序與輸入一致
+
+        未命中快取且不重複的請求合併為一次提供者批次呼叫（generate_batch），
+        由提供者決定如何處理整批請求。單一請求仍使用 generate_description。
+        """
+        results, uncached = self.find_uncached_requests(requests)
+        unique, duplicates = self._dedup_indices(requests, uncached)
+        
+        if unique:
+            start_time = time.time()
+            self.logger.info(f"正在批次生成 {len(unique)} 個描述，使用 {self.llm_manager.get_current_provider()}")
+            try:
+                responses = self.llm_manager.generate_batch(
+                    [self._build_llm_request(requests[i]) for i in unique]
+                )
+            except Exception as e:
+                for i in unique:
+                    results[i] = self._build_error_result(requests[i], e, start_time)
+            else:
+                for i, llm_response in zip(unique, responses):
+                    try:
+                        result = self._build_result(requests[i], llm_response, start_time)
+                    except Exception as e:
+                        results[i] = self._build_error_result(requests[i], e, start_time)
+                        continue
+                    self._store_cached(requests[i], result)
+                    results[i] = result
+        
+        self._fan_out_duplicates(results, duplicates)
+        return results
+    
+    async def abatch_generate_descriptions(self, requests: List[DescriptionRequest],
+                                           max_concurrency: int = 10,
+                                           on_result: Optional[ResultCallback] = None
+                                           ) -> List[DescriptionResult]:
+        """非同步批次生成描述
+
+        以 asyncio.gather 併發送出請求，總耗時取決於最慢的請求而非延遲總和；
+        併發數量由 Semaphore 限制。回傳順序與輸入一致。
+        on_result(索引, 結果) 會在每個結果就緒時呼叫（快取命中者最先）。
+        """
+        results, uncached = self.find_uncached_requests(requests)
+        unique, duplicates = self._dedup_indices(requests, uncached)
+        self.logger.info(f"開始批次生成 {len(requests)} 個描述（快取命中 {len(requests) - len(uncached)} 個，"
+                         f"批次內重複 {len(duplicates)} 個），使用 {self.llm_manager.get_current_provider()}")
+        
+        if on_result:
+            for i, result in enumerate(results):
+                if result is not None:
+                    on_result(i, result)
+        
+        semaphore = asyncio.Semaphore(max_concurrency)
+        completed = 0
+        success_count = 0
+        pending = len(unique)
+        
+        async def sem_wrapped(i: int) -> DescriptionResult:
+            nonlocal completed, success_count
+            async with semaphore:
+                result = await self.agenerate_description(requests[i])
+            if on_result:
+                on_result(i, result)
+            
+            # 顯示進度
+            completed += 1
+            success_count += result.success
+            if completed % 5 == 0 or completed == pending:
+                self.logger.info(f"進度: {completed}/{pending}, 成功率: {success_count}/{completed}")
+            return result
+        
+        generated = await asyncio.gather(*[sem_wrapped(i) for i in unique])
+        for i, result in zip(unique, generated):
+            results[i] = result
+        self._fan_out_duplicates(results, duplicates)
+        if on_result:
+            for i in duplicates:
+                on_result(i, results[i])
+        
+        self.logger.info(f"批次處理完成，總計使用 {self.total_tokens_used} tokens")
+        return results
+    
     def batch_generate_descriptions(self, requests: List[DescriptionRequest], 
-                                   delay: float = 0.5) -> List[DescriptionResult]:
-        """批次生成描述"""
-        results = []
+                                   delay: float = 0.5,
+                                   max_concurrency: int = 10,
+                                   mode: str = "realtime",
+                                   poll_interval: float = 30.0,
+                                   on_result: Optional[ResultCallback] = None) -> List[DescriptionResult]:
+        """批次生成描述（同步介面）
+
+        delay 參數僅為相容保留，請求間隔改由併發上限與提供者的速率限制器控制。
+        mode="batch_api" 時改用 OpenAI Batch API（非即時，費用減半）。
+        """
+        if mode == "batch_api":
+            if hasattr(self.llm_manager.current_provider, "submit_batch"):
+                return self._generate_via_batch_api(requests, poll_interval)
+            self.logger.warning(f"{self.get_current_provider()} 不支援 Batch API，改用即時呼叫")
+        return run_sync(self.abatch_generate_descriptions(requests, max_concurrency, on_result))
+    
+    def warmup(self) -> bool:
+        """預熱目前的LLM提供者（建立連線），避免第一個請求承擔 DNS/TLS 成本"""
+        return self.llm_manager.current_provider.warmup()
+    
+    def batch_generate_descriptions_threaded(self, requests: List[DescriptionRequest],
+                                            max_workers: int = 8) -> List[DescriptionResult]:
+        """以執行緒池批次生成描述（供無法改用 async 的同步呼叫端）
+        
+        瓶頸在網路 I/O，同時進行中的請求數由 max_workers 限制；回傳順序與輸入一致。
+        """
+        results: List[Optional[DescriptionResult]] = [None] * len(requests)
+        unique, duplicates = self._dedup_indices(requests, list(range(len(requests))))
+        
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {executor.submit(self.generate_description, requests[i]): i for i in unique}
+            for completed, future in enumerate(as_completed(futures), 1):
+                results[futures[future]] = future.result()
+                if completed % 5 == 0 or completed == len(unique):
+                    self.logger.info(f"進度: {completed}/{len(unique)}")
+        
+        self._fan_out_duplicates(results, duplicates)
+        return results
+    
+    def _generate_via_batch_api(self, requests: List[DescriptionRequest],
+                                poll_interval: float) -> List[DescriptionResult]:
+        """提交 Batch API 工作並輪詢至結束"""
+        results, uncached = self.find_uncached_requests(requests)
+        if not uncached:
+            return results
+        
+        start_time = time.time()
+        provider = self.llm_manager.current_provider
+        batch_id = provider.submit_batch([self._build_llm_request(requests[i]) for i in uncached])
         
-        self.logger.info(f"開始批次生成 {len(requests)} 個描述，使用 {self.llm_manager.get_current_provider()}")
+        while True:
+            batch = provider.poll_batch(batch_id)
+            if batch.status in BATCH_TERMINAL_STATUSES:
+                break
+            self.logger.info(f"Batch API 工作 {batch_id} 狀態：{batch.status}")
+            time.sleep(poll_interval)
         
-        for i, request in enumerate(requests, 1):
+        responses = provider.fetch_batch_results(batch_id, len(uncached))
+        for i, llm_response in zip(uncached, responses):
             try:
-                result = self.generate_description(request)
-                results.append(result)
-                
-                # 顯示進度
-                if i % 5 == 0 or i == len(requests):
-                    success_count = sum(1 for r in results if r.success)
-                    self.logger.info(f"進度: {i}/{len(requests)}, 成功率: {success_count}/{i}")
-                
-                # API 呼叫間隔 (Mock LLM不需要間隔)
-                if i < len(requests) and self.llm_manager.get_current_provider() != "MockLLM":
-                    time.sleep(delay)
-                    
+                results[i] = self._build_result(requests[i], llm_response, start_time)
             except Exception as e:
-                self.logger.error(f"處理第 {i} 個請求時發生錯誤：{str(e)}")
+                results[i] = self._build_error_result(requests[i], e, start_time)
                 continue
+            self._store_cached(requests[i], results[i])
         
-        self.logger.info(f"批次處理完成，總計使用 {self.total_tokens_used} tokens")
+        self.logger.info(f"Batch API 處理完成，總計使用 {self.total_tokens_used} tokens")
         return results
     
+    # ==================== 打包請求 ====================
+    
+    def create_packed_prompt(self, requests: List[DescriptionRequest]) -> str:
+        """將多個圖表打包為單一提示詞，共用的說明只送一次"""
+        items = [
+            {
+                "id": i,
+                "type": r.caption_type,
+                "number": r.caption_number,
+                "caption": r.caption_text,
+                "context": r.related_context,
+                "page": r.page_number
+            }
+            for i, r in enumerate(requests)
+        ]
+        
+        return f"""你是一個專業的學術文件分析助手。請根據以下每個圖表的資訊，分別生成詳細、準確的文字描述。
+
+【任務要求】
+- 類型為「圖」者：描述其視覺內容、數據關係或概念說明。
+- 類型為「表」者：描述其數據結構、統計內容或資訊整理。
+每個描述 100-200 字，包含圖表的主要內容、關鍵資訊、在文件中的作用，以及與上下文的關聯性。
+
+【回應格式】
+請只回傳 JSON 物件：{{"descriptions": [{{"id": 圖表id, "description": "描述文字"}}, ...]}}，每個圖表一筆。
+
+{PACKED_ITEMS_MARKER}{json.dumps(items, ensure_ascii=False)}"""
+    
+    @staticmethod
+    def _parse_packed_response(content: str) -> Dict[int, str]:
+        """解析打包回應，回傳 id -> 描述；格式錯誤時回傳空字典"""
+        try:
+            entries = json.loads(content)["descriptions"]
+            return {
+                int(entry["id"]): str(entry["description"]).strip()
+                for entry in entries
+                if str(entry.get("description", "")).strip()
+            }
+        except (ValueError, TypeError, KeyError, AttributeError):
+            return {}
+    
+    async def _agenerate_pack(self, chunk: List[DescriptionRequest]) -> List[DescriptionResult]:
+        """以單次LLM呼叫生成一組描述，缺漏的項目退回逐一生成"""
+        start_time = time.time()
+        self.logger.info(f"正在以單一請求生成 {len(chunk)} 個描述")
+        
+        llm_response = await self.llm_manager.agenerate(LLMRequest(
+            prompt=self.create_packed_prompt(chunk),
+            max_tokens=300 * len(chunk),
+            temperature=0.3,
+            system_message=DESCRIPTION_SYSTEM_MESSAGE,
+            response_format={"type": "json_object"}
+        ))
+        descriptions = self._parse_packed_response(llm_response.content) if llm_response.success else {}
+        
+        # 依描述長度按比例分攤 completion tokens，prompt tokens 平均分攤
+        usage = llm_response.token_usage
+        total_length = sum(len(d) for d in descriptions.values()) or 1
+        prompt_share = usage.get('prompt_tokens', 0) // len(chunk)
+        
+        results: List[Optional[DescriptionResult]] = [None] * len(chunk)
+        for i, description in descriptions.items():
+            if not 0 <= i < len(chunk):
+                continue
+            completion_share = round(usage.get('completion_tokens', 0) * len(description) / total_length)
+            item_response = LLMResponse(
+                content=description,
+                success=True,
+                processing_time=llm_response.processing_time,
+                token_usage={
+                    "prompt_tokens": prompt_share,
+                    "completion_tokens": completion_share,
+                    "total_tokens": prompt_share + completion_share
+                },
+                provider=llm_response.provider
+            )
+            results[i] = self._build_result(chunk[i], item_response, start_time)
+            self._store_cached(chunk[i], results[i])
+        
+        missing = [i for i, result in enumerate(results) if result is None]
+        if missing:
+            self.logger.warning(f"打包回應缺少 {len(missing)} 個描述，改為逐一生成")
+            fallback = await asyncio.gather(*[self.agenerate_description(chunk[i]) for i in missing])
+            for i, result in zip(missing, fallback):
+                results[i] = result
+        return results
+    
+    async def agenerate_descriptions_packed(self, requests: List[DescriptionRequest],
+                                            pack_size: int = 8,
+                                            max_concurrency: int = 10) -> List[DescriptionResult]:
+        """非同步打包生成描述：每 pack_size 個圖表共用一次LLM呼叫"""
+        results, uncached = self.find_uncached_requests(requests)
+        self.logger.info(f"開始打包生成 {len(requests)} 個描述（快取命中 {len(requests) - len(uncached)} 個），"
+                         f"每包 {pack_size} 個")
+        
+        packs = [uncached[i:i + pack_size] for i in range(0, len(uncached), pack_size)]
+        semaphore = asyncio.Semaphore(max_concurrency)
+        
+        async def sem_wrapped(indices: List[int]) -> List[DescriptionResult]:
+            async with semaphore:
+                return await self._agenerate_pack([requests[i] for i in indices])
+        
+        generated = await asyncio.gather(*[sem_wrapped(pack) for pack in packs])
+        for indices, pack_results in zip(packs, generated):
+            for i, result in zip(indices, pack_results):
+                results[i] = result
+        
+        self.logger.info(f"打包處理完成，總計使用 {self.total_tokens_used} tokens")
+        return results
+    
+    def generate_descriptions_packed(self, requests: List[DescriptionRequest],
+                                     pack_size: int = 8) -> List[DescriptionResult]:
+        """打包生成描述（同步介面）"""
+        return run_sync(self.agenerate_descriptions_packed(requests, pack_size))
+    
     def switch_llm_provider(self, provider_name: str) -> bool:
         """切換LLM提供者"""
         success = self.llm_manager.switch_provider(provider_name)
@@ -244,6 +654,7 @@ class LLMDescriptionGeneratorV2:
         return {
             "current_provider": self.get_current_provider(),
             "total_requests": self.total_requests,
+            "cache_hits": self.cache_hits,
             "total_tokens_used": self.total_tokens_used,
             "average_tokens_per_request": self.total_tokens_used / max(self.total_requests, 1)
         }
@@ -255,29 +666,24 @@ class LLMDescriptionGeneratorV2:
             "generation_time": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
             "llm_provider": self.get_current_provider(),
             "total_results": len(results),
-            "success_count": sum(1 for r in results if r.success),
+            "success_count": sum(map(_success, results)),
             "usage_statistics": self.get_usage_statistics(),
-            "results": [
-                {
-                    "original_caption": r.original_caption,
-                    "generated_description": r.generated_description,
-                    "confidence_score": r.confidence_score,
-                    "processing_time": r.processing_time,
-                    "token_usage": r.token_usage,
-                    "success": r.success,
-                    "llm_provider": r.llm_provider,
-                    "error_message": r.error_message
-                }
-                for r in results
-            ]
+            "results": results
         }
         
-        with open(output_path, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        if ORJSON_AVAILABLE:
+            # orjson 原生序列化 dataclass，不需先轉成 dict
+            Path(output_path).write_bytes(orjson.dumps(data, option=orjson.OPT_INDENT_2))
+        else:
+            data["results"] = [asdict(r) for r in results]
+            with open(output_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False, indent=2)
         
         self.logger.info(f"結果已保存到 {output_path}")
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    
     # 基本測試
     generator = LLMDescriptionGeneratorV2("mock")  # 使用模擬提供者
     
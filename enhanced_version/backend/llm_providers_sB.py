@@ -5,14 +5,47 @@ LLM提供者抽象層 - 支援多種LLM後端切換
 """
 
 from abc import ABC, abstractmethod
-from typing import Dict, List, Optional
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterator, List, Optional, Tuple
 from dataclasses import dataclass
+import asyncio
+import json
+import re
 import time
 import logging
 import os
-from dotenv import load_dotenv
+import random
+import tempfile
+import threading
+import atexit
+import weakref
 
-load_dotenv()
+logger = logging.getLogger(__name__)
+
+# openai 與 dotenv 延遲載入：只使用模擬提供者時不需付出匯入成本
+_openai_mod = None
+_DOTENV_LOADED = False
+
+
+def _openai():
+    """延遲匯入 openai 模組"""
+    global _openai_mod
+    _openai_mod = _openai_mod or __import__('openai')
+    return _openai_mod
+
+
+def load_dotenv_once() -> None:
+    """需要 OpenAI 設定且環境變數未提供時，才讀取 .env（dotenv 為選用套件）"""
+    global _DOTENV_LOADED
+    if _DOTENV_LOADED:
+        return
+    _DOTENV_LOADED = True
+    if os.environ.get('OPENAI_API_KEY'):
+        return
+    try:
+        from dotenv import load_dotenv
+    except ImportError:
+        return
+    load_dotenv()
 
 @dataclass
 class LLMRequest:
@@ -21,6 +54,7 @@ class LLMRequest:
     max_tokens: int = 300
     temperature: float = 0.3
     system_message: Optional[str] = None
+    response_format: Optional[Dict[str, Any]] = None  # 例如 {"type": "json_object"}
 
 @dataclass 
 class LLMResponse:
@@ -32,9 +66,258 @@ class LLMResponse:
     error_message: Optional[str] = None
     provider: str = ""
 
+# ==================== 速率限制 ====================
+
+# 預設的每分鐘請求數 / token 數上限，可由環境變數覆寫
+DEFAULT_RATE_LIMIT_PER_MINUTE = 500
+DEFAULT_TOKENS_PER_MINUTE = 200000
+
+
+def env_rate_limits() -> Tuple[int, int]:
+    """從環境變數讀取 (RPM, TPM)；OPENAI_RPM 未設定時沿用 INFERENCE_RATE_LIMIT_PER_MINUTE
+    
+    於建立限制器時才讀取，讓 .env 延遲載入後的設定也能生效。
+    """
+    rpm = os.environ.get('OPENAI_RPM') or os.environ.get('INFERENCE_RATE_LIMIT_PER_MINUTE')
+    tpm = os.environ.get('OPENAI_TPM')
+    return (int(rpm) if rpm else DEFAULT_RATE_LIMIT_PER_MINUTE,
+            int(tpm) if tpm else DEFAULT_TOKENS_PER_MINUTE)
+
+
+# ==================== HTTP 連線設定 ====================
+
+# h2 為選用套件，安裝後才啟用 HTTP/2
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+OPENAI_HTTP_TIMEOUT = 30.0
+
+
+def _openai_http_limits():
+    """OpenAI 用戶端的連線池上限（httpx 延遲匯入）"""
+    import httpx
+    return httpx.Limits(max_connections=64, max_keepalive_connections=32)
+
+
+def create_sync_client(api_key: Optional[str], base_url: Optional[str]):
+    """建立使用共用連線池設定的同步 OpenAI 用戶端（重試由 call_with_retry 統一處理）"""
+    import httpx
+    return _openai().OpenAI(
+        api_key=api_key,
+        base_url=base_url,
+        max_retries=0,
+        http_client=httpx.Client(http2=HTTP2_AVAILABLE, limits=_openai_http_limits(), timeout=OPENAI_HTTP_TIMEOUT)
+    )
+
+
+class LoopBoundAsyncClient:
+    """依事件迴圈保存的 AsyncOpenAI 用戶端
+    
+    httpx.AsyncClient 的連線綁定建立時的事件迴圈，因此在同一迴圈內重用同一個用戶端；
+    切換到其他迴圈時先關閉舊用戶端（舊迴圈已結束時只能釋放參考），行程結束時統一關閉。
+    """
+    
+    __slots__ = ('api_key', 'base_url', '_client', '_loop', '__weakref__')
+    
+    def __init__(self, api_key: Optional[str], base_url: Optional[str]):
+        self.api_key = api_key
+        self.base_url = base_url
+        self._client = None
+        self._loop = None
+        _async_clients.add(self)
+    
+    def get(self):
+        """取得目前事件迴圈的用戶端（需在協程中呼叫）"""
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._loop is not loop:
+            self._release()
+            import httpx
+            self._client = _openai().AsyncOpenAI(
+                api_key=self.api_key,
+                base_url=self.base_url,
+                max_retries=0,  # 重試由呼叫端統一處理
+                http_client=httpx.AsyncClient(http2=HTTP2_AVAILABLE, limits=_openai_http_limits(), timeout=OPENAI_HTTP_TIMEOUT)
+            )
+            self._loop = loop
+        return self._client
+    
+    def _release(self) -> None:
+        """放棄目前的用戶端；其迴圈仍在其他執行緒運行時於該迴圈上關閉連線"""
+        client, loop = self._client, self._loop
+        self._client = self._loop = None
+        if client is not None and loop.is_running() and not loop.is_closed():
+            asyncio.run_coroutine_threadsafe(client.close(), loop)
+    
+    async def aclose(self) -> None:
+        """關閉綁定於目前事件迴圈的用戶端"""
+        if self._client is not None and self._loop is asyncio.get_running_loop():
+            client, self._client, self._loop = self._client, None, None
+            await client.close()
+
+
+# ==================== 共用背景事件迴圈 ====================
+
+# 同步介面（批次生成、嵌入）都在同一個長駐迴圈上執行，非同步用戶端與連線池可跨呼叫重用，
+# 不會每次 asyncio.run 都建立新迴圈與新的連線池
+_async_clients: "weakref.WeakSet[LoopBoundAsyncClient]" = weakref.WeakSet()
+_background_loop: Optional[asyncio.AbstractEventLoop] = None
+_background_loop_lock = threading.Lock()
+
+
+def _get_background_loop() -> asyncio.AbstractEventLoop:
+    global _background_loop
+    with _background_loop_lock:
+        if _background_loop is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="llm-event-loop", daemon=True).start()
+            _background_loop = loop
+            atexit.register(_shutdown_background_loop)
+        return _background_loop
+
+
+def run_sync(coro):
+    """在共用的背景事件迴圈上執行協程並等待結果（不可在該迴圈內呼叫）"""
+    return asyncio.run_coroutine_threadsafe(coro, _get_background_loop()).result()
+
+
+def _shutdown_background_loop() -> None:
+    """行程結束時關閉背景迴圈上的非同步用戶端，再停止迴圈"""
+    loop = _background_loop
+    if loop is None or loop.is_closed():
+        return
+    
+    async def close_clients():
+        await asyncio.gather(*(client.aclose() for client in list(_async_clients)), return_exceptions=True)
+    
+    try:
+        asyncio.run_coroutine_threadsafe(close_clients(), loop).result(timeout=5)
+    except Exception:
+        pass
+    loop.call_soon_threadsafe(loop.stop)
+
+
+# ==================== 重試設定 ====================
+
+# 暫時性錯誤（速率限制、連線、逾時、5xx）以指數退避 + 抖動重試；驗證或請求格式錯誤不重試
+RETRY_MAX_ATTEMPTS = 5
+RETRY_BASE_DELAY = 1.0
+RETRY_MAX_DELAY = 30.0
+
+
+def _retry_delay(attempt: int) -> float:
+    """第 attempt 次（從 0 起算）失敗後的等待秒數"""
+    return min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt) + random.uniform(0, RETRY_BASE_DELAY)
+
+
+def _is_retriable(error: Exception) -> bool:
+    """判斷 openai 例外是否為暫時性錯誤"""
+    openai = _openai()
+    return isinstance(error, (openai.RateLimitError, openai.APIConnectionError,
+                              openai.APITimeoutError, openai.InternalServerError))
+
+
+# 打包提示詞中圖表清單的起始標記，其後緊接 JSON 陣列
+PACKED_ITEMS_MARKER = "【圖表清單】\n"
+
+
+class _TokenBucket:
+    """單一 token bucket，依經過時間連續補充"""
+    
+    def __init__(self, capacity: int):
+        self.capacity = float(capacity)
+        self.tokens = float(capacity)
+        self.refill_rate = capacity / 60.0  # 每秒補充量
+        self.updated_at = time.monotonic()
+    
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.refill_rate)
+        self.updated_at = now
+    
+    def wait_time(self, amount: float) -> float:
+        """取得 amount 個 token 前需等待的秒數（0 表示可立即取得）"""
+        self._refill()
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.refill_rate
+
+
+class RateLimiter:
+    """RPM + TPM 雙 token bucket 速率限制器
+    
+    以經過時間計算補充量，不需要背景任務，因此可跨多個事件迴圈共用；
+    同時提供同步版本供執行緒中的同步呼叫使用。
+    """
+    
+    def __init__(self, requests_per_minute: Optional[int] = None,
+                 tokens_per_minute: Optional[int] = None):
+        env_rpm, env_tpm = env_rate_limits()
+        requests_per_minute = requests_per_minute or env_rpm
+        tokens_per_minute = tokens_per_minute or env_tpm
+        self.request_bucket = _TokenBucket(requests_per_minute)
+        self.token_bucket = _TokenBucket(tokens_per_minute)
+        self._lock = threading.Lock()
+    
+    def _try_take(self, est_tokens: int) -> float:
+        """嘗試扣除額度；成功回傳 0，否則回傳需等待的秒數"""
+        with self._lock:
+            delay = max(self.request_bucket.wait_time(1),
+                        self.token_bucket.wait_time(est_tokens))
+            if delay <= 0:
+                self.request_bucket.tokens -= 1
+                self.token_bucket.tokens -= min(est_tokens, self.token_bucket.capacity)
+            return delay
+    
+    async def acquire(self, est_tokens: int = 0) -> None:
+        """等待直到 1 個請求與 est_tokens 個 token 的額度都可用"""
+        while (delay := self._try_take(est_tokens)) > 0:
+            await asyncio.sleep(delay)
+    
+    def acquire_sync(self, est_tokens: int = 0) -> None:
+        """acquire 的同步版本"""
+        while (delay := self._try_take(est_tokens)) > 0:
+            time.sleep(delay)
+
+
+def call_with_retry(call: Callable[[], Any], rate_limiter: RateLimiter, est_tokens: int = 0,
+                    label: str = "OpenAI") -> Any:
+    """取得速率額度後執行 call()，暫時性錯誤時退避重試（最多 RETRY_MAX_ATTEMPTS 次），其他錯誤直接拋出"""
+    for attempt in range(RETRY_MAX_ATTEMPTS):
+        rate_limiter.acquire_sync(est_tokens=est_tokens)
+        try:
+            return call()
+        except Exception as e:
+            if attempt == RETRY_MAX_ATTEMPTS - 1 or not _is_retriable(e):
+                raise
+            delay = _retry_delay(attempt)
+            logger.warning(f"{label} 暫時性錯誤，{delay:.1f}s 後重試（第 {attempt + 1} 次）：{e}")
+            time.sleep(delay)
+
+
+async def acall_with_retry(call: Callable[[], Awaitable[Any]], rate_limiter: RateLimiter, est_tokens: int = 0,
+                           label: str = "OpenAI") -> Any:
+    """call_with_retry 的非同步版本（call 回傳 awaitable）"""
+    for attempt in range(RETRY_MAX_ATTEMPTS):
+        await rate_limiter.acquire(est_tokens=est_tokens)
+        try:
+            return await call()
+        except Exception as e:
+            if attempt == RETRY_MAX_ATTEMPTS - 1 or not _is_retriable(e):
+                raise
+            delay = _retry_delay(attempt)
+            logger.warning(f"{label} 暫時性錯誤，{delay:.1f}s 後重試（第 {attempt + 1} 次）：{e}")
+            await asyncio.sleep(delay)
+
+
 class LLMProvider(ABC):
     """LLM提供者抽象基類"""
     
+    __slots__ = ('logger',)
+    
     def __init__(self):
         self.logger = logging.getLogger(__name__)
         
@@ -43,20 +326,76 @@ class LLMProvider(ABC):
         """生成回應"""
         pass
     
+    async def agenerate(self, request: LLMRequest) -> LLMResponse:
+        """非同步生成回應
+
+        預設在執行緒中呼叫同步的 generate，避免阻塞事件迴圈；
+        支援原生非同步API的提供者應覆寫此方法。
+        """
+        return await asyncio.to_thread(self.generate, request)
+    
+    def generate_stream(self, request: LLMRequest,
+                        usage: Optional[Dict[str, int]] = None) -> Iterator[str]:
+        """串流生成回應，逐段產出文字
+        
+        預設一次產出完整結果；usage 若提供，會填入 token 用量。失敗時拋出例外。
+        """
+        response = self.generate(request)
+        if not response.success:
+            raise Exception(response.error_message or "LLM調用失敗")
+        if usage is not None:
+            usage.update(response.token_usage)
+        yield response.content
+    
+    async def agenerate_stream(self, request: LLMRequest,
+                               usage: Optional[Dict[str, int]] = None) -> AsyncIterator[str]:
+        """generate_stream 的非同步版本"""
+        response = await self.agenerate(request)
+        if not response.success:
+            raise Exception(response.error_message or "LLM調用失敗")
+        if usage is not None:
+            usage.update(response.token_usage)
+        yield response.content
+    
+    def generate_batch(self, requests: List[LLMRequest]) -> List[LLMResponse]:
+        """一次生成多個回應，順序與輸入一致
+        
+        預設逐一呼叫 generate；能以單次呼叫處理整批請求的提供者應覆寫此方法。
+        """
+        return [self.generate(request) for request in requests]
+    
     @abstractmethod
     def is_available(self) -> bool:
         """檢查是否可用"""
         pass
     
+    def warmup(self) -> bool:
+        """預熱提供者（例如預先建立連線）；預設不需處理"""
+        return True
+    
     @property
     @abstractmethod
     def provider_name(self) -> str:
         """提供者名稱"""
         pass
 
+# 模擬提供者的人工延遲（秒），預設不延遲；設定 MOCK_LATENCY=0.1 可模擬網路耗時
+MOCK_LATENCY = float(os.getenv('MOCK_LATENCY', '0'))
+
 class MockLLMProvider(LLMProvider):
     """模擬LLM提供者 - 用於開發測試"""
     
+    __slots__ = ('response_templates',)
+    
+    _kw_re = re.compile(r'原始說明：\s*([^\n：]*)')
+    _ctx_re = re.compile(r'計算機|電腦|數學|統計')
+    # 依優先順序排列的 (關鍵字集合, 領域名稱)
+    _ctx_priority = (
+        (frozenset({"計算機", "電腦"}), "計算機科學"),
+        (frozenset({"數學"}), "數學"),
+        (frozenset({"統計"}), "統計學"),
+    )
+    
     def __init__(self):
         super().__init__()
         self.response_templates = {
@@ -77,10 +416,14 @@ class MockLLMProvider(LLMProvider):
         
         try:
             # 模擬處理時間
-            time.sleep(0.1)
+            if MOCK_LATENCY > 0:
+                time.sleep(MOCK_LATENCY)
             
             # 簡單的模板生成
-            content = self._generate_mock_content(request.prompt)
+            if request.response_format:
+                content = self._generate_mock_packed(request.prompt)
+            else:
+                content = self._generate_mock_content(request.prompt)
             
             processing_time = time.time() - start_time
             
@@ -122,34 +465,50 @@ class MockLLMProvider(LLMProvider):
             context=context_info or "該領域"
         )
     
+    def _generate_mock_packed(self, prompt: str) -> str:
+        """為打包請求生成模擬的 JSON 回應"""
+        items = json.loads(prompt.rsplit(PACKED_ITEMS_MARKER, 1)[1])
+        context_info = self._extract_context(prompt)
+        descriptions = [
+            {
+                "id": item["id"],
+                "description": self.response_templates.get(item["type"], self.response_templates['圖']).format(
+                    content=item["caption"], context=context_info
+                )
+            }
+            for item in items
+        ]
+        return json.dumps({"descriptions": descriptions}, ensure_ascii=False)
+    
     def _extract_keywords(self, prompt: str) -> str:
         """提取關鍵字"""
-        # 簡單的關鍵字提取
-        lines = prompt.split('\n')
-        for line in lines:
-            if '原始說明' in line:
-                parts = line.split('：')
-                if len(parts) > 1:
-                    return parts[1].strip()
-        return "主要內容"
+        m = self._kw_re.search(prompt)
+        return m.group(1).strip() if m else "主要內容"
     
     def _extract_context(self, prompt: str) -> str:
         """提取上下文"""
-        if "計算機" in prompt or "電腦" in prompt:
-            return "計算機科學"
-        elif "數學" in prompt:
-            return "數學"
-        elif "統計" in prompt:
-            return "統計學"
+        found = set(self._ctx_re.findall(prompt))
+        if found:
+            for keywords, context in self._ctx_priority:
+                if found & keywords:
+                    return context
         return "該主題"
 
 class OpenAIProvider(LLMProvider):
     """OpenAI提供者"""
     
+    __slots__ = ('api_key', 'base_url', 'model', 'rate_limiter', '_client', '_aclient')
+    
     def __init__(self):
         super().__init__()
-        self.api_key = os.getenv('OPENAI_API_KEY')
-        self.base_url = os.getenv('OPENAI_BASE_URL', 'https://api.openai.com/v1')
+        load_dotenv_once()
+        self.api_key = os.environ.get('OPENAI_API_KEY')
+        self.base_url = os.environ.get('OPENAI_BASE_URL', 'https://api.openai.com/v1')
+        self.model = "gpt-3.5-turbo"
+        self.rate_limiter = RateLimiter()
+        # 共用的 HTTP 連線池（首次使用時建立），避免每次呼叫重新進行 TCP/TLS 握手
+        self._client = None
+        self._aclient = LoopBoundAsyncClient(self.api_key, self.base_url)
         
     @property
     def provider_name(self) -> str:
@@ -158,53 +517,230 @@ class OpenAIProvider(LLMProvider):
     def is_available(self) -> bool:
         return bool(self.api_key)
     
+    def _build_messages(self, request: LLMRequest) -> List[Dict[str, str]]:
+        """組合對話訊息"""
+        messages = []
+        if request.system_message:
+            messages.append({"role": "system", "content": request.system_message})
+        messages.append({"role": "user", "content": request.prompt})
+        return messages
+    
+    def _build_body(self, request: LLMRequest) -> Dict[str, Any]:
+        """組合 chat completions 請求內容（即時呼叫與 Batch API 共用）"""
+        body = {
+            "model": self.model,
+            "messages": self._build_messages(request),
+            "max_tokens": request.max_tokens,
+            "temperature": request.temperature
+        }
+        if request.response_format:
+            body["response_format"] = request.response_format
+        return body
+    
+    def _sync_client(self):
+        """取得共用的同步 OpenAI 用戶端"""
+        if self._client is None:
+            self._client = create_sync_client(self.api_key, self.base_url)
+        return self._client
+    
+    def _async_client(self):
+        """取得目前事件迴圈專用的非同步 OpenAI 用戶端"""
+        return self._aclient.get()
+    
+    def warmup(self) -> bool:
+        """查詢模型列表以預先完成 DNS/TCP/TLS 連線，不消耗 token"""
+        try:
+            self._sync_client().models.list()
+            return True
+        except Exception as e:
+            self.logger.warning(f"OpenAI 預熱失敗：{e}")
+            return False
+    
+    @staticmethod
+    def _estimate_tokens(request: LLMRequest) -> int:
+        return request.max_tokens + len(request.prompt) // 4
+    
+    def _do_call(self, est_tokens: int, **kwargs):
+        """呼叫 chat completions，暫時性錯誤時退避重試"""
+        return call_with_retry(lambda: self._sync_client().chat.completions.create(**kwargs),
+                               self.rate_limiter, est_tokens)
+    
+    async def _ado_call(self, est_tokens: int, **kwargs):
+        """_do_call 的非同步版本"""
+        return await acall_with_retry(lambda: self._async_client().chat.completions.create(**kwargs),
+                                      self.rate_limiter, est_tokens)
+    
+    def _to_response(self, response, start_time: float) -> LLMResponse:
+        """將 chat completions 回應轉為 LLMResponse"""
+        return LLMResponse(
+            content=response.choices[0].message.content.strip(),
+            success=True,
+            processing_time=time.time() - start_time,
+            token_usage={
+                "prompt_tokens": response.usage.prompt_tokens,
+                "completion_tokens": response.usage.completion_tokens,
+                "total_tokens": response.usage.total_tokens
+            },
+            provider=self.provider_name
+        )
+    
+    def _error_response(self, error: Exception, start_time: float) -> LLMResponse:
+        return LLMResponse(
+            content="",
+            success=False,
+            processing_time=time.time() - start_time,
+            token_usage={},
+            error_message=str(error),
+            provider=self.provider_name
+        )
+    
     def generate(self, request: LLMRequest) -> LLMResponse:
         """使用OpenAI生成回應"""
         start_time = time.time()
         
         try:
-            import openai
-            
-            # 設定API
-            openai.api_key = self.api_key
-            openai.api_base = self.base_url
-            
-            messages = []
-            if request.system_message:
-                messages.append({"role": "system", "content": request.system_message})
-            messages.append({"role": "user", "content": request.prompt})
-            
-            response = openai.ChatCompletion.create(
-                model="gpt-3.5-turbo",
-                messages=messages,
-                max_tokens=request.max_tokens,
-                temperature=request.temperature
-            )
-            
-            content = response.choices[0].message.content.strip()
-            processing_time = time.time() - start_time
-            
-            return LLMResponse(
-                content=content,
-                success=True,
-                processing_time=processing_time,
-                token_usage=response.usage.__dict__,
-                provider=self.provider_name
-            )
-            
+            response = self._do_call(self._estimate_tokens(request), **self._build_body(request))
+            return self._to_response(response, start_time)
         except Exception as e:
-            return LLMResponse(
+            return self._error_response(e, start_time)
+    
+    async def agenerate(self, request: LLMRequest) -> LLMResponse:
+        """使用OpenAI非同步生成回應"""
+        start_time = time.time()
+        
+        try:
+            response = await self._ado_call(self._estimate_tokens(request), **self._build_body(request))
+            return self._to_response(response, start_time)
+        except Exception as e:
+            return self._error_response(e, start_time)
+    
+    def generate_batch(self, requests: List[LLMRequest]) -> List[LLMResponse]:
+        """以 asyncio.gather 併發送出整批請求，節流交由速率限制器處理"""
+        async def gather_all() -> List[LLMResponse]:
+            return await asyncio.gather(*(self.agenerate(request) for request in requests))
+        return run_sync(gather_all())
+
+    # ==================== 串流 ====================
+    
+    @staticmethod
+    def _collect_usage(chunk, usage: Optional[Dict[str, int]]) -> None:
+        """串流最後一個 chunk 帶有整體用量（需 include_usage）"""
+        if usage is not None and getattr(chunk, "usage", None):
+            usage.update({
+                "prompt_tokens": chunk.usage.prompt_tokens,
+                "completion_tokens": chunk.usage.completion_tokens,
+                "total_tokens": chunk.usage.total_tokens
+            })
+    
+    def generate_stream(self, request: LLMRequest,
+                        usage: Optional[Dict[str, int]] = None) -> Iterator[str]:
+        """以 stream=True 逐段產出生成內容"""
+        # 只重試建立串流；開始產出內容後的錯誤直接拋出
+        stream = self._do_call(
+            self._estimate_tokens(request),
+            **self._build_body(request), stream=True, stream_options={"include_usage": True}
+        )
+        for chunk in stream:
+            self._collect_usage(chunk, usage)
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+    
+    async def agenerate_stream(self, request: LLMRequest,
+                               usage: Optional[Dict[str, int]] = None) -> AsyncIterator[str]:
+        """generate_stream 的非同步版本"""
+        stream = await self._ado_call(
+            self._estimate_tokens(request),
+            **self._build_body(request), stream=True, stream_options={"include_usage": True}
+        )
+        async for chunk in stream:
+            self._collect_usage(chunk, usage)
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+    # ==================== Batch API ====================
+    
+    def submit_batch(self, requests: List[LLMRequest]) -> str:
+        """以 Batch API 提交請求（24小時內完成，費用約為即時呼叫的一半）
+        
+        Returns:
+            batch_id
+        """
+        client = self._sync_client()
+        
+        with tempfile.NamedTemporaryFile('w', suffix='.jsonl', encoding='utf-8', delete=False) as f:
+            for i, request in enumerate(requests):
+                f.write(json.dumps({
+                    "custom_id": str(i),
+                    "method": "POST",
+                    "url": "/v1/chat/completions",
+                    "body": self._build_body(request)
+                }, ensure_ascii=False))
+                f.write("\n")
+            batch_path = f.name
+        
+        try:
+            with open(batch_path, 'rb') as f:
+                batch_file = client.files.create(file=f, purpose="batch")
+        finally:
+            os.remove(batch_path)
+        
+        batch = client.batches.create(
+            input_file_id=batch_file.id,
+            endpoint="/v1/chat/completions",
+            completion_window="24h"
+        )
+        self.logger.info(f"已提交 Batch API 工作 {batch.id}，共 {len(requests)} 個請求")
+        return batch.id
+    
+    def poll_batch(self, batch_id: str):
+        """查詢 Batch API 工作狀態"""
+        return self._sync_client().batches.retrieve(batch_id)
+    
+    def fetch_batch_results(self, batch_id: str, count: int) -> List[LLMResponse]:
+        """下載已完成工作的結果，依提交順序回傳（缺漏者標記為失敗）"""
+        client = self._sync_client()
+        batch = client.batches.retrieve(batch_id)
+        
+        responses: List[Optional[LLMResponse]] = [None] * count
+        if batch.output_file_id:
+            for line in client.files.content(batch.output_file_id).text.splitlines():
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                i = int(record["custom_id"])
+                body = (record.get("response") or {}).get("body") or {}
+                if record.get("error") or "choices" not in body:
+                    continue
+                usage = body.get("usage", {})
+                responses[i] = LLMResponse(
+                    content=body["choices"][0]["message"]["content"].strip(),
+                    success=True,
+                    processing_time=0.0,
+                    token_usage={
+                        "prompt_tokens": usage.get("prompt_tokens", 0),
+                        "completion_tokens": usage.get("completion_tokens", 0),
+                        "total_tokens": usage.get("total_tokens", 0)
+                    },
+                    provider=self.provider_name
+                )
+        
+        return [
+            response or LLMResponse(
                 content="",
                 success=False,
-                processing_time=time.time() - start_time,
+                processing_time=0.0,
                 token_usage={},
-                error_message=str(e),
+                error_message=f"Batch API 工作 {batch_id} 未回傳此請求的結果（狀態：{batch.status}）",
                 provider=self.provider_name
             )
+            for response in responses
+        ]
 
 class LocalLLMProvider(LLMProvider):
     """本地LLM提供者 - 預留給未來的本地模型"""
     
+    __slots__ = ('model_path', 'model')
+    
     def __init__(self, model_path: Optional[str] = None):
         super().__init__()
         self.model_path = model_path
@@ -224,6 +760,7 @@ class LocalLLMProvider(LLMProvider):
         
         # 預留：實作本地LLM調用
         # 這裡可以整合像是 Ollama, llama.cpp, 或其他本地LLM方案
+        # 實作後應一併覆寫 generate_batch，將整批 prompt 以 padding 組成單一批次推論
         
         return LLMResponse(
             content="本地LLM尚未實作",
@@ -282,6 +819,49 @@ class LLMManager:
         
         return self.current_provider.generate(request)
     
+    async def agenerate(self, request: LLMRequest) -> LLMResponse:
+        """非同步生成回應"""
+        if not self.current_provider:
+            return LLMResponse(
+                content="",
+                success=False,
+                processing_time=0,
+                token_usage={},
+                error_message="沒有可用的LLM提供者"
+            )
+        
+        return await self.current_provider.agenerate(request)
+    
+    def generate_batch(self, requests: List[LLMRequest]) -> List[LLMResponse]:
+        """批次生成回應，順序與輸入一致"""
+        if not self.current_provider:
+            return [
+                LLMResponse(
+                    content="",
+                    success=False,
+                    processing_time=0,
+                    token_usage={},
+                    error_message="沒有可用的LLM提供者"
+                )
+                for _ in requests
+            ]
+        
+        return self.current_provider.generate_batch(requests)
+    
+    def generate_stream(self, request: LLMRequest,
+                        usage: Optional[Dict[str, int]] = None) -> Iterator[str]:
+        """串流生成回應"""
+        if not self.current_provider:
+            raise Exception("沒有可用的LLM提供者")
+        return self.current_provider.generate_stream(request, usage)
+    
+    def agenerate_stream(self, request: LLMRequest,
+                         usage: Optional[Dict[str, int]] = None) -> AsyncIterator[str]:
+        """非同步串流生成回應"""
+        if not self.current_provider:
+            raise Exception("沒有可用的LLM提供者")
+        return self.current_provider.agenerate_stream(request, usage)
+    
     def switch_provider(self, provider_name: str) -> bool:
         """切換提供者"""
         if provider_name not in self.providers:
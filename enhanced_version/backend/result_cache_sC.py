@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+階段C：PDF 處理結果快取 - 以 PDF 內容雜湊為鍵，重跑時略過解析、描述生成與向量化
+"""
+
+import hashlib
+import logging
+import mmap
+import os
+import pickle
+import shutil
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+# diskcache 為選用套件，未安裝時以目錄中的 pickle 檔案儲存
+try:
+    import diskcache
+    DISKCACHE_AVAILABLE = True
+except ImportError:
+    DISKCACHE_AVAILABLE = False
+
+# blake3 為選用套件（SIMD 加速），未安裝時使用標準庫的 sha256
+try:
+    import blake3
+    BLAKE3_AVAILABLE = True
+except ImportError:
+    BLAKE3_AVAILABLE = False
+
+from interfaces import ICacheManager
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RESULT_CACHE_DIR = os.getenv(
+    'CHART_RESULT_CACHE_DIR', os.path.join(os.path.expanduser("~"), ".cache", "chartcut")
+)
+
+# 小於此大小的檔案直接一次讀入；mmap 的系統呼叫成本在小檔案上高於省下的複製
+_MMAP_MIN_SIZE = 64 * 1024
+
+
+def _hash_bytes(data) -> str:
+    """雜湊位元組或緩衝區（blake3 優先並自動使用多執行緒，否則 sha256）
+
+    回傳值以演算法名稱為前綴（如 "blake3:..."、"sha256:..."），兩種環境產生的雜湊不會互相混淆。
+    """
+    if BLAKE3_AVAILABLE:
+        return "blake3:" + blake3.blake3(data, max_threads=blake3.blake3.AUTO).hexdigest()
+    return "sha256:" + hashlib.sha256(data).hexdigest()
+
+
+def file_content_hash(file_path: str) -> str:
+    """計算檔案內容的雜湊值，格式為「演算法:十六進位摘要」
+    
+    大檔案以 mmap 直接雜湊頁面快取中的內容，不經過 Python 層的分段讀取與緩衝區複製。
+    """
+    with open(file_path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size < _MMAP_MIN_SIZE:
+            return _hash_bytes(f.read())
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            return _hash_bytes(mapped)
+
+
+class DiskCacheManager(ICacheManager):
+    """以磁碟保存 PDF 處理結果的快取管理器
+
+    值以 pickle（最高協定）保存，任何可序列化的處理結果皆可快取；
+    另提供以快取鍵命名的產物目錄，供向量索引等需整個目錄保存的產物使用。
+    """
+
+    def __init__(self, directory: str = DEFAULT_RESULT_CACHE_DIR, expiry_days: int = 30):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.expiry_seconds = expiry_days * 86400
+        self._cache = diskcache.Cache(str(self.directory / "results")) if DISKCACHE_AVAILABLE else None
+        self._hits = 0
+        self._misses = 0
+
+    def _pickle_path(self, key: str) -> Path:
+        return self.directory / "results" / f"{key}.pkl"
+
+    def get(self, key: str) -> Optional[Any]:
+        """取得快取內容，不存在、已過期或無法讀取時回傳 None"""
+        value = None
+        if self._cache is not None:
+            value = self._cache.get(key)
+        else:
+            path = self._pickle_path(key)
+            try:
+                if time.time() - path.stat().st_mtime <= self.expiry_seconds:
+                    with open(path, 'rb') as f:
+                        value = pickle.load(f)
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                logger.warning(f"讀取快取 {path} 失敗: {e}")
+
+        if value is None:
+            self._misses += 1
+        else:
+            self._hits += 1
+        return value
+
+    def set(self, key: str, value: Any) -> bool:
+        """寫入快取內容，回傳是否成功"""
+        try:
+            if self._cache is not None:
+                self._cache.set(key, value, expire=self.expiry_seconds)
+            else:
+                path = self._pickle_path(key)
+                path.parent.mkdir(parents=True, exist_ok=True)
+                # 先寫入暫存檔再取代，中斷時不會留下不完整的快取
+                tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+                with open(tmp_path, 'wb') as f:
+                    pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+                os.replace(tmp_path, path)
+            return True
+        except Exception as e:
+            logger.warning(f"寫入快取 {key} 失敗: {e}")
+            return False
+
+    def artifact_directory(self, key: str) -> Path:
+        """回傳快取鍵對應的產物目錄（不保證已存在）"""
+        return self.directory / "artifacts" / key
+
+    def get_cached_result(self, file_hash: str) -> Optional[Any]:
+        """取得快取的處理結果"""
+        return self.get(file_hash)
+
+    def cache_result(self, file_hash: str, result: Any) -> bool:
+        """快取處理結果"""
+        return self.set(file_hash, result)
+
+    def clear_expired_cache(self) -> int:
+        """清理過期快取，回傳清除的項目數"""
+        cutoff = time.time() - self.expiry_seconds
+        removed = 0
+
+        if self._cache is not None:
+            removed += self._cache.expire()
+        else:
+            for path in (self.directory / "results").glob("*.pkl"):
+                if path.stat().st_mtime < cutoff:
+                    path.unlink(missing_ok=True)
+                    removed += 1
+
+        artifacts = self.directory / "artifacts"
+        if artifacts.is_dir():
+            for path in artifacts.iterdir():
+                if path.stat().st_mtime < cutoff:
+                    shutil.rmtree(path, ignore_errors=True)
+                    removed += 1
+
+        return removed
+
+    def get_cache_stats(self) -> Dict[str, Any]:
+        """取得快取統計資訊"""
+        return {
+            "directory": str(self.directory),
+            "backend": "diskcache" if self._cache is not None else "pickle",
+            "hits": self._hits,
+            "misses": self._misses,
+        }
+
+    def close(self) -> None:
+        """釋放資源"""
+        if self._cache is not None:
+            self._cache.close()
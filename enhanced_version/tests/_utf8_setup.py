@@ -0,0 +1,26 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+測試輸出的 UTF-8 設定 - 解決 Windows 主控台的中文與 emoji 顯示問題
+
+由 conftest.py 匯入一次即可；以腳本直接執行的工具檔（非 pytest 收集）自行匯入。
+模組只會執行一次，重複匯入不會重新設定。
+"""
+
+import sys
+
+if sys.platform == "win32":
+    try:
+        sys.stdout.reconfigure(encoding='utf-8')
+        sys.stderr.reconfigure(encoding='utf-8')
+    except (AttributeError, ValueError):
+        # 如果 reconfigure 不支援，改用 codecs 包裝
+        import codecs
+        sys.stdout = codecs.getwriter('utf-8')(sys.stdout.buffer)
+        sys.stderr = codecs.getwriter('utf-8')(sys.stderr.buffer)
+
+    import locale
+    try:
+        locale.setlocale(locale.LC_ALL, 'zh_TW.UTF-8')
+    except locale.Error:
+        pass
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+pytest 共用設定 - 測試 PDF 路徑、pdf 標記與共用 fixture
+
+平行執行（需安裝 pytest-xdist）：
+    pytest -n auto --dist=loadfile
+同一測試檔的測試分配到同一個 worker，檔內共用的 PDF 解析結果不會重複載入。
+
+僅執行 / 排除需要 PDF 的測試：
+    pytest -m pdf
+    pytest -m "not pdf"
+"""
+
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterable, List
+
+import pytest
+
+# Windows 主控台 UTF-8 輸出設定，整個測試階段只執行一次（各測試檔不再重複）
+import _utf8_setup  # noqa: F401
+
+# 模組根目錄（dto.py 與 enhanced_version 所在處）與專案根目錄（階段C依賴的 RAG_Helper 所在處）
+# 測試檔不再各自修改 sys.path，統一在此設定一次
+PACKAGE_ROOT = Path(__file__).resolve().parent.parent.parent
+PROJECT_ROOT = PACKAGE_ROOT.parent.parent
+for _path in (PROJECT_ROOT, PACKAGE_ROOT):
+    if str(_path) not in sys.path:
+        sys.path.insert(0, str(_path))
+
+# 測試 PDF 位於專案根目錄的 pdfFiles/，可用 TEST_PDF_DIR 環境變數覆寫
+PDF_DIR = Path(os.getenv('TEST_PDF_DIR', str(PROJECT_ROOT / "pdfFiles")))
+PRIMARY_PDF = PDF_DIR / "計概第一章.pdf"
+
+
+class PdfPairsCache:
+    """同一份 PDF 在整個測試階段只執行一次 process_pdf"""
+
+    def __init__(self, processor):
+        self._processor = processor
+        self._parsed: Dict[Path, List] = {}
+
+    def _parse(self, pdf_path: Path) -> List:
+        return self._processor.process_pdf(str(pdf_path))
+
+    def prefetch(self, pdf_paths: Iterable[Path]) -> None:
+        """以執行緒池同時解析多份小 PDF（PyMuPDF 解析期間會釋放 GIL）
+        
+        頁數達平行門檻的 PDF 由 process_pdf 自行以多行程擷取，逐一在主執行緒解析，
+        只在一個層級平行，也不會從多個執行緒各自建立行程池。
+        """
+        import pymupdf
+        from enhanced_version.backend.caption_extractor_sA import PARALLEL_PAGE_THRESHOLD
+        
+        pending = [path for path in dict.fromkeys(pdf_paths) if path.exists() and path not in self._parsed]
+        small = []
+        for pdf_path in pending:
+            with pymupdf.open(pdf_path) as pdf_doc:
+                page_count = len(pdf_doc)
+            if page_count < PARALLEL_PAGE_THRESHOLD:
+                small.append(pdf_path)
+            else:
+                self._parsed[pdf_path] = self._parse(pdf_path)
+        
+        if small:
+            with ThreadPoolExecutor(max_workers=min(len(small), os.cpu_count() or 1)) as executor:
+                for pdf_path, pairs in zip(small, executor.map(self._parse, small)):
+                    self._parsed[pdf_path] = pairs
+
+    def __call__(self, pdf_path: Path) -> List:
+        if pdf_path not in self._parsed:
+            if not pdf_path.exists():
+                pytest.skip(f"測試 PDF 檔案不存在: {pdf_path}")
+            self._parsed[pdf_path] = self._parse(pdf_path)
+        return self._parsed[pdf_path]
+
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "pdf: 需要讀取測試 PDF 檔案的測試（CI 可據此分片）")
+
+
+@pytest.fixture(scope="session")
+def processor(pytestconfig, tmp_path_factory):
+    """預設參數的 Caption 處理器，整個測試階段只建立這一個（pdf_pairs 亦共用）
+
+    階段A各測試原先使用的「調校參數」(context_window=200, min_caption_length=5,
+    confidence_threshold=0.3) 與預設值相同，因此不需另建處理器。
+
+    啟用處理器內建的 pickle 快取（鍵為 PDF 內容、擷取程式碼原始碼與擷取參數的雜湊，
+    修改階段A程式碼後舊快取自動失效），存放於 pytest 快取目錄，跨測試階段與 xdist worker 共用；
+    停用 cacheprovider 時退回本次測試階段的暫存目錄。
+    """
+    from dto import CacheConfig
+    from enhanced_version.backend.caption_extractor_sA import PDFCaptionContextProcessor
+
+    cache = getattr(pytestconfig, "cache", None)
+    cache_dir = cache.mkdir("pdf_pairs") if cache is not None else tmp_path_factory.mktemp("pdf_pairs")
+    return PDFCaptionContextProcessor(
+        cache_config=CacheConfig(enabled=True, cache_directory=str(cache_dir))
+    )
+
+
+@pytest.fixture(scope="session")
+def mock_generator():
+    """使用模擬提供者的描述生成器（停用快取，確保每次都實際走過生成流程）"""
+    from enhanced_version.backend.llm_description_generator_v2_sB import LLMDescriptionGeneratorV2
+    return LLMDescriptionGeneratorV2("mock", use_cache=False)
+
+
+@pytest.fixture(scope="session")
+def pdf_pairs(processor) -> PdfPairsCache:
+    """回傳可呼叫的解析快取：同一份 PDF 在整個測試階段只執行一次 process_pdf"""
+    return PdfPairsCache(processor)
+
+
+@pytest.fixture(scope="session")
+def caption_pairs(pdf_pairs) -> List:
+    """主要測試 PDF（計概第一章）的 Caption-Context 配對結果"""
+    return pdf_pairs(PRIMARY_PDF)
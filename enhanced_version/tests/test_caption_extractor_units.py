@@ -21,7 +21,7 @@ sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
 
 from enhanced_version.backend.caption_extractor_sA import (
     CaptionExtractor, CaptionPatterns, TextBlock, CaptionCandidate,
-    ReferenceMatch, PDFCaptionContextProcessor
+    ReferenceMatch, PDFCaptionContextProcessor, _has_caption_keyword
 )
 from dto import CaptionInfo, ContextInfo, CaptionContextPair
 
@@ -101,6 +101,35 @@ class TestCaptionPatterns(unittest.TestCase):
                 
                 self.assertTrue(found, f"應該找到引用: {text} -> {expected_number}")
 
+    def test_find_caption_matches_in_pages(self):
+        """測試批次比對與逐字串比對結果一致"""
+        page_texts = [
+            "第一章 概論\n圖 1：這是測試圖片\n說明文字",
+            "沒有任何圖說的頁面",
+            "Table 2.1: Statistical data\nFigure 3: Flow chart",
+            "",
+        ]
+
+        results = CaptionPatterns.find_caption_matches_in_pages(page_texts)
+
+        self.assertEqual(len(results), len(page_texts))
+        self.assertEqual(results[0], [CaptionPatterns.find_caption_match(page_texts[0])])
+        self.assertEqual(results[1], [])
+        self.assertEqual([(m["type"], m["number"]) for m in results[2]],
+                         [("table", "2.1"), ("figure", "3")])
+        self.assertEqual(results[3], [])
+
+    def test_has_caption_keyword(self):
+        """測試關鍵字預篩：常見大小寫寫法都能通過，一般內文段落被略過"""
+        for text in ["圖 1：說明", "如表 2 所示", "Figure 1: Test", "FIGURE 2 RESULTS",
+                     "see fig. 3", "Table 4", "TABLE 5", "Tab. 6", "as shown in table 7"]:
+            with self.subTest(text=text):
+                self.assertTrue(_has_caption_keyword(text))
+        
+        for text in ["一般的內文段落", "Plain paragraph without keywords", ""]:
+            with self.subTest(text=text):
+                self.assertFalse(_has_caption_keyword(text))
+
 
 class TestTextBlock(unittest.TestCase):
     """測試 TextBlock 資料結構"""
@@ -275,13 +304,35 @@ class TestCaptionExtractor(unittest.TestCase):
         self.assertEqual(references[0].reference_number, "1")
         self.assertEqual(references[0].reference_type, "figure")
         self.assertIn("如圖 1 所示", references[0].text)
+    
+    def test_extract_text_blocks_without_font_info(self):
+        """測試 blocks 模式與 dict 模式擷取到相同的文字與頁碼，字體欄位為預設值"""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            pdf_path = create_test_pdf(os.path.join(tmp_dir, "sample.pdf"))
+            
+            with_font = self.extractor.extract_text_blocks(pdf_path)
+            without_font = self.extractor.extract_text_blocks(pdf_path, need_font_info=False)
+            subset = self.extractor.extract_text_blocks(pdf_path, need_font_info=False, pages=[2])
+        
+        self.assertTrue(without_font)
+        self.assertEqual([(block.text, block.page_number) for block in without_font],
+                         [(block.text, block.page_number) for block in with_font])
+        self.assertTrue(all(block.font_size > 0 and block.font_name for block in with_font))
+        for block in without_font:
+            self.assertEqual(block.font_size, 0.0)
+            self.assertEqual(block.font_name, "")
+            self.assertFalse(block.is_bold)
+        self.assertEqual([(block.text, block.page_number) for block in subset],
+                         [(block.text, block.page_number) for block in with_font if block.page_number == 2])
 
 
 class TestPDFCaptionContextProcessor(unittest.TestCase):
     """測試主要處理器"""
     
-    def setUp(self):
-        self.processor = PDFCaptionContextProcessor()
+    @classmethod
+    def setUpClass(cls):
+        # 處理器不保存每次處理的狀態，整個測試類別共用一個實例
+        cls.processor = PDFCaptionContextProcessor()
     
     @patch('caption_extractor.CaptionExtractor.extract_text_blocks')
     @patch('caption_extractor.CaptionExtractor.identify_captions')
@@ -320,6 +371,17 @@ class TestPDFCaptionContextProcessor(unittest.TestCase):
         self.assertEqual(result[0].caption.caption_type, "figure")
         self.assertEqual(len(result[0].contexts), 1)
     
+    def test_process_pdf_pages(self):
+        """測試只處理指定頁面"""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            pdf_path = create_test_pdf(os.path.join(tmp_dir, "sample.pdf"))
+            
+            full = self.processor.process_pdf(pdf_path)
+            self.assertEqual({pair.caption.page_number for pair in full}, {1, 2, 3})
+            
+            subset = self.processor.process_pdf(pdf_path, pages=[2])
+            self.assertEqual({pair.caption.page_number for pair in subset}, {2})
+    
     def test_get_processing_stats(self):
         """測試處理統計功能"""
         # 建立測試資料
@@ -360,11 +422,18 @@ class TestIntegration(unittest.TestCase):
         pass
 
 
-def create_test_pdf():
-    """建立測試用的 PDF 檔案（輔助函數）"""
-    # 這裡可以使用 reportlab 或其他工具建立測試 PDF
-    # 暫時留空，實際實作時可以補充
-    pass
+def create_test_pdf(pdf_path: str, page_count: int = 3) -> str:
+    """建立測試用的 PDF 檔案（輔助函數）：每頁一個圖 Caption 與一句引用"""
+    import pymupdf as fitz
+    
+    doc = fitz.open()
+    for page_number in range(1, page_count + 1):
+        page = doc.new_page()
+        page.insert_text((72, 72), f"Figure {page_number}: Sample chart caption text")
+        page.insert_text((72, 144), f"As shown in Figure {page_number} the values increase")
+    doc.save(pdf_path)
+    doc.close()
+    return pdf_path
 
 
 if __name__ == '__main__':
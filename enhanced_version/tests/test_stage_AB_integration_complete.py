@@ -5,170 +5,193 @@
 """
 
 import sys
-import os
 import json
 from datetime import datetime
 
-# 導入階段A和B的模組
-from modules.pdf_Cutting_TextReplaceImage.enhanced_version.backend.caption_extractor_sA import PDFCaptionContextProcessor
-from llm_description_generator import LLMDescriptionGenerator, DescriptionRequest
+import pytest
 
-def test_stage_ab_integration():
+# 階段A的配對結果與階段B的生成器由 conftest.py 的 fixture 提供
+from enhanced_version.backend.llm_description_generator_v2_sB import DescriptionRequest
+
+@pytest.mark.pdf
+def test_stage_ab_integration(caption_pairs, mock_generator, tmp_path):
     """測試階段A+B整合功能"""
     
     print("🔄 開始階段A+B整合測試")
     print("=" * 60)
     
-    # 步驟1：使用階段A提取Caption
+    # 步驟1：階段A - Caption識別（主要測試 PDF 的配對結果）
     print("📋 步驟1：執行階段A - Caption識別")
-    processor = PDFCaptionContextProcessor()
-    pdf_file = "../../pdfFiles/計概第一章.pdf"
+    print(f"✅ 階段A完成，找到 {len(caption_pairs)} 個Caption")
+    assert caption_pairs, "階段A未識別到任何Caption"
     
-    if not os.path.exists(pdf_file):
-        print(f"❌ 測試檔案不存在: {pdf_file}")
-        return
+    # 步驟2：準備階段B的輸入
+    print("\n📋 步驟2：準備LLM描述生成請求")
+    description_requests = []
     
-    try:
-        # 執行Caption提取
-        stage_a_result = processor.process_pdf(pdf_file)
-        print(f"✅ 階段A完成，找到 {len(stage_a_result.caption_pairs)} 個Caption")
-        
-        # 步驟2：準備階段B的輸入
-        print("\n📋 步驟2：準備LLM描述生成請求")
-        description_requests = []
-        
-        # 選擇前5個高信心度的Caption進行測試
-        high_confidence_pairs = [
-            pair for pair in stage_a_result.caption_pairs 
-            if pair.caption_info.confidence > 0.5
-        ][:5]
-        
-        for pair in high_confidence_pairs:
-            caption = pair.caption_info
-            context = pair.context_info
-            
-            # 準備相關內文
-            related_context = []
-            if context and context.related_paragraphs:
-                related_context = [para[:100] for para in context.related_paragraphs[:3]]
-            
-            # 建立描述請求
-            request = DescriptionRequest(
-                caption_text=caption.title,
-                caption_type=caption.caption_type,
-                caption_number=caption.number,
-                related_context=related_context,
-                page_number=caption.page
-            )
-            description_requests.append(request)
-        
-        print(f"✅ 準備了 {len(description_requests)} 個描述生成請求")
-        
-        # 步驟3：使用階段B生成描述
-        print("\n📋 步驟3：執行階段B - LLM描述生成")
-        generator = LLMDescriptionGenerator()
-        
-        # 生成描述
-        description_results = []
-        for i, request in enumerate(description_requests, 1):
-            print(f"\n🔄 正在處理 {i}/{len(description_requests)}: {request.caption_type} {request.caption_number}")
-            
-            result = generator.generate_description(request)
-            description_results.append(result)
-            
-            if result.success:
-                print(f"✅ 生成成功 (信心度: {result.confidence_score:.2f})")
-                print(f"📝 描述: {result.generated_description[:100]}...")
-            else:
-                print(f"❌ 生成失敗: {result.error_message}")
-        
-        # 步驟4：整合結果分析
-        print("\n📋 步驟4：整合結果分析")
-        analyze_integration_results(stage_a_result, description_results)
-        
-        # 步驟5：保存整合結果
-        print("\n📋 步驟5：保存整合結果")
-        save_integration_results(stage_a_result, description_results)
+    # 選擇前5個高信心度的Caption進行測試
+    high_confidence_pairs = [
+        pair for pair in caption_pairs
+        if pair.caption.confidence > 0.5
+    ][:5]
+    
+    for pair in high_confidence_pairs:
+        caption = pair.caption
         
-        print("\n✅ 階段A+B整合測試完成")
+        # 準備相關內文
+        related_context = [context.text[:100] for context in pair.contexts[:3]]
         
-    except Exception as e:
-        print(f"❌ 整合測試失敗: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        # 建立描述請求
+        request = DescriptionRequest(
+            caption_text=caption.text,
+            caption_type=caption.caption_type,
+            caption_number=caption.number,
+            related_context=related_context,
+            page_number=caption.page_number
+        )
+        description_requests.append(request)
+    
+    print(f"✅ 準備了 {len(description_requests)} 個描述生成請求")
+    assert description_requests, "沒有高信心度的Caption可供測試"
+    
+    # 步驟3：使用階段B生成描述（模擬提供者）
+    print("\n📋 步驟3：執行階段B - LLM描述生成")
+    generator = mock_generator
+    generator.warmup()
+    
+    reported = []
+    
+    def on_result(i, result):
+        reported.append(i)
+        request = description_requests[i]
+        print(f"\n🔄 {i + 1}/{len(description_requests)}: {request.caption_type} {request.caption_number}")
+        if result.success:
+            print(f"✅ 生成成功 (信心度: {result.confidence_score:.2f})")
+            print(f"📝 描述: {result.generated_description[:100]}...")
+        else:
+            print(f"❌ 生成失敗: {result.error_message}")
+    
+    # 生成描述（併發送出，結果順序與請求一致）
+    description_results = generator.batch_generate_descriptions(
+        description_requests, max_concurrency=5, on_result=on_result
+    )
+    
+    assert len(description_results) == len(description_requests)
+    assert sorted(reported) == list(range(len(description_requests)))
+    for request, result in zip(description_requests, description_results):
+        assert result.success, f"描述生成失敗: {result.error_message}"
+        assert result.original_caption == request.caption_text
+    
+    # 步驟4：整合結果分析
+    print("\n📋 步驟4：整合結果分析")
+    analyze_integration_results(caption_pairs, description_results)
+    
+    # 步驟5：保存整合結果
+    print("\n📋 步驟5：保存整合結果")
+    output_file = save_integration_results(caption_pairs, description_results, tmp_path)
+    assert output_file.exists()
+    
+    print("\n✅ 階段A+B整合測試完成")
 
-def analyze_integration_results(stage_a_result, description_results):
+def summarize_stage_a(caption_pairs):
+    """單次走訪彙總階段A統計"""
+    high_conf = 0
+    total_conf = 0.0
+    caption_types = {}
+    for pair in caption_pairs:
+        caption = pair.caption
+        if caption.confidence > 0.5:
+            high_conf += 1
+        total_conf += caption.confidence
+        caption_types[caption.caption_type] = caption_types.get(caption.caption_type, 0) + 1
+    
+    return {
+        "total": len(caption_pairs),
+        "high_conf": high_conf,
+        "caption_types": caption_types,
+        "average_confidence": total_conf / len(caption_pairs) if caption_pairs else 0
+    }
+
+def summarize_stage_b(description_results):
+    """單次走訪彙總階段B統計"""
+    succ = 0
+    toks_succ = 0
+    toks_all = 0
+    conf_sum = 0.0
+    for r in description_results:
+        toks = r.token_usage.get('total_tokens', 0)
+        toks_all += toks
+        if r.success:
+            succ += 1
+            toks_succ += toks
+            conf_sum += r.confidence_score
+    
+    return {
+        "total": len(description_results),
+        "success": succ,
+        "tokens_success": toks_succ,
+        "tokens_all": toks_all,
+        "average_confidence": conf_sum / succ if succ else 0
+    }
+
+def analyze_integration_results(caption_pairs, description_results):
     """分析整合結果"""
     
     print("\n📊 整合結果分析")
     print("-" * 40)
     
     # 階段A統計
-    total_captions = len(stage_a_result.caption_pairs)
-    high_conf_captions = len([p for p in stage_a_result.caption_pairs if p.caption_info.confidence > 0.5])
+    stats_a = summarize_stage_a(caption_pairs)
     
     print(f"階段A統計:")
-    print(f"  • 總Caption數: {total_captions}")
-    print(f"  • 高信心度(>0.5): {high_conf_captions}")
-    print(f"  • 成功率: {high_conf_captions/total_captions*100:.1f}%")
+    print(f"  • 總Caption數: {stats_a['total']}")
+    print(f"  • 高信心度(>0.5): {stats_a['high_conf']}")
+    print(f"  • 成功率: {stats_a['high_conf']/stats_a['total']*100:.1f}%")
     
     # 階段B統計
-    successful_descriptions = [r for r in description_results if r.success]
-    total_tokens = sum(r.token_usage.get('total_tokens', 0) for r in successful_descriptions)
-    avg_confidence = sum(r.confidence_score for r in successful_descriptions) / len(successful_descriptions) if successful_descriptions else 0
+    stats_b = summarize_stage_b(description_results)
     
     print(f"\n階段B統計:")
-    print(f"  • 處理請求數: {len(description_results)}")
-    print(f"  • 成功生成數: {len(successful_descriptions)}")
-    print(f"  • 成功率: {len(successful_descriptions)/len(description_results)*100:.1f}%")
-    print(f"  • 平均信心度: {avg_confidence:.2f}")
-    print(f"  • 總Token使用: {total_tokens}")
+    print(f"  • 處理請求數: {stats_b['total']}")
+    print(f"  • 成功生成數: {stats_b['success']}")
+    print(f"  • 成功率: {stats_b['success']/stats_b['total']*100:.1f}%")
+    print(f"  • 平均信心度: {stats_b['average_confidence']:.2f}")
+    print(f"  • 總Token使用: {stats_b['tokens_success']}")
     
     # 品質評估
     print(f"\n📈 品質評估:")
-    for i, result in enumerate(successful_descriptions):
-        print(f"  {i+1}. 信心度: {result.confidence_score:.2f}, 描述長度: {len(result.generated_description)}")
+    i = 0
+    for result in description_results:
+        if result.success:
+            i += 1
+            print(f"  {i}. 信心度: {result.confidence_score:.2f}, 描述長度: {len(result.generated_description)}")
 
-def save_integration_results(stage_a_result, description_results):
-    """保存整合結果"""
+def save_integration_results(caption_pairs, description_results, output_dir):
+    """保存整合結果，回傳輸出檔案路徑"""
     
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    output_file = f"stage_ab_integration_results_{timestamp}.json"
+    output_file = output_dir / f"stage_ab_integration_results_{timestamp}.json"
+    
+    stats_a = summarize_stage_a(caption_pairs)
+    stats_b = summarize_stage_b(description_results)
     
     # 準備保存數據
     integration_data = {
         "test_time": timestamp,
         "stage_a_summary": {
-            "total_captions": len(stage_a_result.caption_pairs),
-            "caption_types": {},
-            "average_confidence": 0
+            "total_captions": stats_a["total"],
+            "caption_types": stats_a["caption_types"],
+            "average_confidence": stats_a["average_confidence"]
         },
         "stage_b_summary": {
-            "total_requests": len(description_results),
-            "successful_generations": len([r for r in description_results if r.success]),
-            "total_tokens_used": sum(r.token_usage.get('total_tokens', 0) for r in description_results),
-            "average_confidence": 0
+            "total_requests": stats_b["total"],
+            "successful_generations": stats_b["success"],
+            "total_tokens_used": stats_b["tokens_all"],
+            "average_confidence": stats_b["average_confidence"]
         },
         "integrated_results": []
     }
     
-    # 計算階段A統計
-    caption_types = {}
-    total_conf_a = 0
-    for pair in stage_a_result.caption_pairs:
-        caption_type = pair.caption_info.caption_type
-        caption_types[caption_type] = caption_types.get(caption_type, 0) + 1
-        total_conf_a += pair.caption_info.confidence
-    
-    integration_data["stage_a_summary"]["caption_types"] = caption_types
-    integration_data["stage_a_summary"]["average_confidence"] = total_conf_a / len(stage_a_result.caption_pairs)
-    
-    # 計算階段B統計
-    successful_results = [r for r in description_results if r.success]
-    if successful_results:
-        avg_conf_b = sum(r.confidence_score for r in successful_results) / len(successful_results)
-        integration_data["stage_b_summary"]["average_confidence"] = avg_conf_b
-    
     # 整合結果詳情
     for i, result in enumerate(description_results):
         integrated_item = {
@@ -187,13 +210,7 @@ def save_integration_results(stage_a_result, description_results):
         json.dump(integration_data, f, ensure_ascii=False, indent=2)
     
     print(f"✅ 整合結果已保存到: {output_file}")
+    return output_file
 
 if __name__ == "__main__":
-    try:
-        test_stage_ab_integration()
-    except KeyboardInterrupt:
-        print("\n⚠️ 測試被使用者中斷")
-    except Exception as e:
-        print(f"\n❌ 測試過程中發生未預期錯誤: {str(e)}")
-        import traceback
-        traceback.print_exc()
\ No newline at end of file
+    sys.exit(pytest.main([__file__, "-v", "-s"]))
@@ -5,94 +5,88 @@
 """
 
 import sys
-import os
 import json
-from datetime import datetime
+import time
+from operator import attrgetter
 
-# 導入階段A和B的模組
-sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
-sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'backend'))
-from modules.pdf_Cutting_TextReplaceImage.enhanced_version.backend.caption_extractor_sA import PDFCaptionContextProcessor
-from llm_description_generator_v2_sB import LLMDescriptionGeneratorV2, DescriptionRequest
+import pytest
 
-def main():
+# orjson 為選用套件，未安裝時使用標準庫 json
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+# 階段A的配對結果與階段B的生成器由 conftest.py 的 fixture 提供
+from enhanced_version.backend.llm_description_generator_v2_sB import DescriptionRequest
+
+_success = attrgetter('success')
+
+
+@pytest.mark.pdf
+def test_stage_ab_pipeline(caption_pairs, mock_generator, tmp_path):
     print("=== 階段A+B整合測試 ===")
-    
+
     # 步驟1：階段A - Caption識別
-    print("\n步驟1：執行階段A - Caption識別")
-    processor = PDFCaptionContextProcessor()
-    pdf_file = "../../../ignore_file/test_pdf_data/sys_check_digital/計概第一章.pdf"
-    
-    if not os.path.exists(pdf_file):
-        print(f"錯誤: 測試檔案不存在 {pdf_file}")
-        return
-    
-    caption_pairs = processor.process_pdf(pdf_file)
-    print(f"完成：找到 {len(caption_pairs)} 個Caption")
-    
+    print(f"\n步驟1：階段A - 找到 {len(caption_pairs)} 個Caption")
+    assert caption_pairs, "階段A未識別到任何Caption"
+
     # 步驟2：階段B - 描述生成
     print("\n步驟2：執行階段B - 描述生成")
-    generator = LLMDescriptionGeneratorV2("mock")  # 使用模擬提供者
-    
-    # 選擇前3個高信心度Caption進行測試
-    test_pairs = [
-        pair for pair in stage_a_result.caption_pairs 
-        if pair.caption_info.confidence > 0.5
-    ][:3]
-    
+    generator = mock_generator  # 使用模擬提供者
+
+    # 選擇前3個高信心度Caption進行測試（高信心度清單同時用於步驟3的統計）
+    confident_pairs = [pair for pair in caption_pairs if pair.caption.confidence > 0.5]
+    test_pairs = confident_pairs[:3]
+
     print(f"選擇 {len(test_pairs)} 個Caption進行描述生成")
-    
+
     results = []
     for i, pair in enumerate(test_pairs, 1):
-        caption = pair.caption_info
-        context = pair.context_info
-        
+        caption = pair.caption
+
         # 準備請求
-        related_context = []
-        if context and context.related_paragraphs:
-            related_context = [para[:100] for para in context.related_paragraphs[:2]]
-        
+        related_context = [context.text[:100] for context in pair.contexts[:2]]
+
         request = DescriptionRequest(
-            caption_text=caption.title,
+            caption_text=caption.text,
             caption_type=caption.caption_type,
             caption_number=caption.number,
             related_context=related_context,
-            page_number=caption.page
+            page_number=caption.page_number
         )
-        
+
         print(f"\n處理 {i}/{len(test_pairs)}: {caption.caption_type} {caption.number}")
         result = generator.generate_description(request)
         results.append(result)
-        
-        if result.success:
-            print(f"成功 - 信心度: {result.confidence_score:.2f}")
-            print(f"描述: {result.generated_description[:80]}...")
-        else:
-            print(f"失敗: {result.error_message}")
-    
+
+        assert result.success, f"描述生成失敗: {result.error_message}"
+        print(f"信心度: {result.confidence_score:.2f}")
+        print(f"描述: {result.generated_description[:80]}...")
+
     # 步驟3：結果統計
     print("\n步驟3：結果統計")
-    successful = [r for r in results if r.success]
-    print(f"階段A成功率: {len([p for p in stage_a_result.caption_pairs if p.caption_info.confidence > 0.5])}/{len(stage_a_result.caption_pairs)}")
-    print(f"階段B成功率: {len(successful)}/{len(results)}")
-    print(f"整體流程: 階段A → 階段B → 準備進入階段C")
-    
+    successful_count = sum(map(_success, results))
+    print(f"階段A成功率: {len(confident_pairs)}/{len(caption_pairs)}")
+    print(f"階段B成功率: {successful_count}/{len(results)}")
+    assert successful_count == len(results)
+
     # 保存測試結果
-    save_test_results(stage_a_result, results)
-    
-    print("\n=== 整合測試完成 ===")
-    print("階段A+B基礎功能已驗證，可以進入階段C開發")
-
-def save_test_results(stage_a_result, stage_b_results):
-    """保存測試結果"""
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    filename = f"stage_ab_test_results_{timestamp}.json"
-    
+    saved_file = save_test_results(caption_pairs, results, tmp_path)
+    assert saved_file.exists()
+
+def save_test_results(caption_pairs, stage_b_results, output_dir):
+    """保存測試結果，回傳輸出檔案路徑"""
+    # 以奈秒時間戳命名，平行執行的測試也不會撞名
+    timestamp = time.time_ns()
+    filename = output_dir / f"stage_ab_test_results_{timestamp}.json"
+
     data = {
-        "test_time": timestamp,
-        "stage_a_captions": len(stage_a_result.caption_pairs),
+        "test_time_ns": timestamp,
+        "stage_a_captions": len(caption_pairs),
         "stage_b_processed": len(stage_b_results),
-        "stage_b_successful": len([r for r in stage_b_results if r.success]),
+        "stage_b_successful": sum(map(_success, stage_b_results)),
         "sample_results": [
             {
                 "caption": r.original_caption,
@@ -100,14 +94,18 @@ def save_test_results(stage_a_result, stage_b_results):
                 "confidence": r.confidence_score,
                 "provider": r.llm_provider
             }
-            for r in stage_b_results if r.success
+            for r in filter(_success, stage_b_results)
         ]
     }
-    
-    with open(filename, 'w', encoding='utf-8') as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
-    
+
+    if ORJSON_AVAILABLE:
+        filename.write_bytes(orjson.dumps(data, option=orjson.OPT_INDENT_2))
+    else:
+        with open(filename, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+
     print(f"測試結果已保存: {filename}")
+    return filename
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    sys.exit(pytest.main([__file__, "-v", "-s"]))
@@ -5,85 +5,67 @@
 """
 
 import sys
-import os
-from pathlib import Path
+from collections import Counter
 
-# 設定 UTF-8 編碼輸出，解決 Windows emoji 顯示問題
-if sys.platform == "win32":
-    try:
-        sys.stdout.reconfigure(encoding='utf-8')
-        sys.stderr.reconfigure(encoding='utf-8')
-    except:
-        # 如果 reconfigure 不支援，嘗試其他方法
-        import codecs
-        sys.stdout = codecs.getwriter('utf-8')(sys.stdout.buffer)
-        sys.stderr = codecs.getwriter('utf-8')(sys.stderr.buffer)
+import pytest
 
-# 添加路徑並導入本地模組
-import sys
-import os
-sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+from conftest import PDF_DIR
+
+# 測試檔案路徑
+TEST_PDF_FILES = [
+    PDF_DIR / "計概第一章.pdf",
+    PDF_DIR / "計概第二章.pdf"
+]
 
-from enhanced_version.backend.caption_extractor_sA import PDFCaptionContextProcessor
+@pytest.fixture(scope="module")
+def prefetched_pdfs(pdf_pairs):
+    """模組開始時以執行緒池同時解析所有測試 PDF，各參數化測試直接取用結果"""
+    pdf_pairs.prefetch(TEST_PDF_FILES)
 
-def test_stage_a_functionality():
-    """測試階段A的Caption識別功能"""
+@pytest.mark.pdf
+@pytest.mark.usefixtures("prefetched_pdfs")
+@pytest.mark.parametrize("pdf_file", TEST_PDF_FILES, ids=lambda p: p.name)
+def test_stage_a_functionality(pdf_file, pdf_pairs):
+    """測試階段A的Caption識別功能（每份 PDF 為獨立測試節點，可分配到不同 worker）"""
     
-    print("🧪 開始測試階段A功能：Caption識別與圖文配對")
-    print("=" * 60)
+    filename = pdf_file.name
+    print(f"\n📄 測試檔案: {filename}")
+    print("-" * 40)
     
-    # 測試檔案路徑 (動態計算相對路徑)
-    script_dir = Path(__file__).parent
-    project_root = script_dir.parent.parent.parent.parent
-    test_files = [
-        project_root / "pdfFiles" / "計概第一章.pdf",
-        project_root / "pdfFiles" / "計概第二章.pdf"
-    ]
+    # 執行Caption識別（同一份 PDF 在測試階段內只解析一次）
+    result = pdf_pairs(pdf_file)
+    assert result, f"{filename} 未識別到任何Caption"
     
-    processor = PDFCaptionContextProcessor()
+    # 顯示統計結果 (result是配對列表)，單次走訪同時統計類型與引用數
+    types = Counter(p.caption.caption_type for p in result)
+    figures = types['figure']
+    tables = types['table']
+    print(f"📊 處理統計:")
+    print(f"   • 找到圖表Caption: {len(result)}個")
+    print(f"   • 圖片相關: {figures}")
+    print(f"   • 表格相關: {tables}")
+    assert figures + tables <= len(result)
     
-    for pdf_file in test_files:
-        if pdf_file.exists():
-            filename = pdf_file.name
-            print(f"\n📄 測試檔案: {filename}")
-            print("-" * 40)
-            
-            try:
-                # 執行Caption識別
-                result = processor.process_pdf(str(pdf_file))
-                
-                # 顯示統計結果 (result是配對列表)
-                print(f"📊 處理統計:")
-                print(f"   • 找到圖表Caption: {len(result)}個")
-                print(f"   • 圖片相關: {len([p for p in result if p.caption.caption_type == 'figure'])}")
-                print(f"   • 表格相關: {len([p for p in result if p.caption.caption_type == 'table'])}")
-                
-                # 顯示前5個識別結果
-                print(f"\n🔍 識別結果預覽 (前5個):")
-                for i, pair in enumerate(result[:5]):
-                    caption = pair.caption
-                    print(f"   {i+1}. {caption.caption_type} {caption.number}: {caption.text[:50]}...")
-                    print(f"      位置: 第{caption.page_number}頁")
-                    print(f"      信心度: {pair.pairing_confidence:.2f}")
-                    print(f"      相關內文: {len(pair.contexts)}段")
-                    print()
-                
-                # 顯示內文引用統計
-                total_contexts = sum(len(pair.contexts) for pair in result)
-                if total_contexts > 0:
-                    print(f"\n📝 內文引用統計: 找到{total_contexts}個引用")
-                    with_contexts = len([p for p in result if len(p.contexts) > 0])
-                    print(f"   • 有引用的Caption: {with_contexts}個")
-                
-                print(f"\n✅ {filename} 測試完成")
-                
-            except Exception as e:
-                print(f"❌ 測試失敗: {str(e)}")
-        else:
-            print(f"⚠️  檔案不存在: {pdf_file}")
+    # 顯示前5個識別結果
+    print(f"\n🔍 識別結果預覽 (前5個):")
+    for i, pair in enumerate(result[:5]):
+        caption = pair.caption
+        print(f"   {i+1}. {caption.caption_type} {caption.number}: {caption.text_preview}...")
+        print(f"      位置: 第{caption.page_number}頁")
+        print(f"      信心度: {pair.pairing_confidence:.2f}")
+        print(f"      相關內文: {len(pair.contexts)}段")
+        print()
+        assert 0.0 <= pair.pairing_confidence <= 1.0
     
-    print("\n" + "=" * 60)
-    print("🎯 階段A功能測試完成")
+    # 顯示內文引用統計
+    ctx_lens = [len(p.contexts) for p in result]
+    total_contexts = sum(ctx_lens)
+    if total_contexts > 0:
+        print(f"\n📝 內文引用統計: 找到{total_contexts}個引用")
+        with_contexts = sum(1 for n in ctx_lens if n)
+        print(f"   • 有引用的Caption: {with_contexts}個")
+    
+    print(f"\n✅ {filename} 測試完成")
 
 def test_caption_patterns():
     """測試Caption識別模式"""
@@ -93,36 +75,26 @@ def test_caption_patterns():
     
     from enhanced_version.backend.caption_extractor_sA import CaptionPatterns
     
+    # (文字, 預期類型, 預期編號)，類型為 None 表示不應識別
     test_cases = [
-        "圖1-1 中國的算盤",
-        "ʩ 圖1-1 中國的算盤", 
-        "表2.3 統計數據",
-        "Figure 1.1 Computer Architecture",
-        "圖 3.5：資料處理流程",
-        "表一、基本資料"
+        ("圖1-1 中國的算盤", "figure", "1.1"),
+        ("ʩ 圖1-1 中國的算盤", "figure", "1.1"),
+        ("表2.3 統計數據", "table", "2.3"),
+        ("Figure 1.1 Computer Architecture", "figure", "1.1"),
+        ("圖 3.5：資料處理流程", "figure", "3.5"),
+        ("表一、基本資料", None, None)
     ]
     
     patterns = CaptionPatterns()
     
-    for test_text in test_cases:
+    for test_text, expected_type, expected_number in test_cases:
         match = patterns.find_caption_match(test_text)
         if match:
             print(f"✅ '{test_text}' → 類型:{match['type']}, 編號:{match['number']}, 標題:{match['title']}")
+            assert (match['type'], match['number']) == (expected_type, expected_number)
         else:
             print(f"❌ '{test_text}' → 未識別")
+            assert expected_type is None, f"'{test_text}' 應識別為 {expected_type}"
 
 if __name__ == "__main__":
-    # 設置編碼
-    if sys.platform == "win32":
-        import locale
-        locale.setlocale(locale.LC_ALL, 'zh_TW.UTF-8')
-    
-    print("🚀 階段A功能測試腳本")
-    print("測試範圍: Caption識別、圖文配對、內文引用搜尋")
-    print()
-    
-    print("📝 跳過模式測試，直接測試完整功能")
-    print()
-    
-    # 測試完整功能
-    test_stage_a_functionality()
\ No newline at end of file
+    sys.exit(pytest.main([__file__, "-v", "-s"]))
@@ -8,15 +8,8 @@ import sys
 import os
 from pathlib import Path
 
-# 設定 UTF-8 編碼輸出
-if sys.platform == "win32":
-    try:
-        sys.stdout.reconfigure(encoding='utf-8')
-        sys.stderr.reconfigure(encoding='utf-8')
-    except:
-        import codecs
-        sys.stdout = codecs.getwriter('utf-8')(sys.stdout.buffer)
-        sys.stderr = codecs.getwriter('utf-8')(sys.stderr.buffer)
+# 設定 UTF-8 編碼輸出（以腳本直接執行時不會載入 conftest.py）
+import _utf8_setup  # noqa: F401
 
 def extract_raw_pdf_text(pdf_path):
     """提取 PDF 原始文字，用於人工比對"""
@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+階段B單元測試：描述生成器的打包請求、批次內去重與描述快取（以計數的模擬提供者驗證實際送出的呼叫）
+"""
+
+import asyncio
+import json
+import pickle
+import threading
+from dataclasses import replace
+
+import pytest
+
+from enhanced_version.backend.llm_description_generator_v2_sB import DescriptionRequest, LLMDescriptionGeneratorV2
+from enhanced_version.backend.llm_providers_sB import LLMResponse, MockLLMProvider
+from enhanced_version.backend.description_cache_sB import SQLiteCache, make_cache_key
+
+
+class CountingMockProvider(MockLLMProvider):
+    """記錄呼叫次數的模擬提供者；指定 packed_content 時以其取代打包回應的內容，fail 為真時回傳失敗"""
+
+    __slots__ = ('calls', 'packed_calls', 'packed_content', 'fail', '_lock')
+
+    def __init__(self, packed_content=None):
+        super().__init__()
+        self.calls = 0
+        self.packed_calls = 0
+        self.packed_content = packed_content
+        self.fail = False
+        self._lock = threading.Lock()
+
+    def generate(self, request):
+        packed = request.response_format is not None
+        with self._lock:
+            if packed:
+                self.packed_calls += 1
+            else:
+                self.calls += 1
+        if self.fail:
+            return LLMResponse(content="", success=False, processing_time=0.0, token_usage={},
+                               error_message="模擬失敗", provider=self.provider_name)
+        response = super().generate(request)
+        if packed and self.packed_content is not None:
+            response = replace(response, content=self.packed_content)
+        return response
+
+
+@pytest.fixture
+def provider():
+    return CountingMockProvider()
+
+
+@pytest.fixture
+def generator(provider):
+    generator = LLMDescriptionGeneratorV2("mock")
+    generator.llm_manager.current_provider = provider
+    return generator
+
+
+def _request(n: int) -> DescriptionRequest:
+    return DescriptionRequest(
+        caption_text=f"圖{n} 示意圖",
+        caption_type="圖",
+        caption_number=str(n),
+        related_context=[f"第{n}段內文說明電腦的運作"],
+        page_number=n
+    )
+
+
+def _packed(entries) -> str:
+    return json.dumps({"descriptions": entries}, ensure_ascii=False)
+
+
+# ==================== 打包請求 ====================
+
+def test_packed_returns_one_result_per_request_in_order(generator, provider):
+    requests = [_request(n) for n in range(1, 6)]
+
+    results = generator.generate_descriptions_packed(requests, pack_size=8)
+
+    assert provider.packed_calls == 1
+    assert provider.calls == 0
+    assert len(results) == len(requests)
+    for request, result in zip(requests, results):
+        assert result.success
+        assert result.original_caption == request.caption_text
+        assert request.caption_text in result.generated_description
+
+
+def test_packed_splits_into_packs(generator, provider):
+    requests = [_request(n) for n in range(1, 6)]
+
+    results = generator.generate_descriptions_packed(requests, pack_size=2)
+
+    assert provider.packed_calls == 3
+    assert [result.original_caption for result in results] == [r.caption_text for r in requests]
+
+
+@pytest.mark.parametrize("content", ["not json", _packed("oops"), json.dumps({"other": []}), "[]"],
+                         ids=["invalid_json", "descriptions_not_list", "missing_key", "not_object"])
+def test_malformed_packed_response_falls_back_per_item(generator, provider, content):
+    provider.packed_content = content
+    requests = [_request(n) for n in range(1, 4)]
+
+    results = generator.generate_descriptions_packed(requests)
+
+    assert provider.packed_calls == 1
+    assert provider.calls == len(requests)
+    assert [result.original_caption for result in results] == [r.caption_text for r in requests]
+    assert all(result.success for result in results)
+
+
+def test_missing_ids_fall_back_per_item(generator, provider):
+    provider.packed_content = _packed([
+        {"id": 1, "description": "打包回應中的第二個描述"},
+        {"id": 2, "description": "   "},  # 空白描述視同缺漏
+    ])
+    requests = [_request(n) for n in range(1, 4)]
+
+    results = generator.generate_descriptions_packed(requests)
+
+    assert provider.calls == 2
+    assert results[1].generated_description == "打包回應中的第二個描述"
+    assert [result.original_caption for result in results] == [r.caption_text for r in requests]
+    assert all(result.success for result in results)
+
+
+def test_out_of_range_ids_are_ignored(generator, provider):
+    provider.packed_content = _packed([
+        {"id": 0, "description": "第一個描述"},
+        {"id": 3, "description": "超出範圍"},
+        {"id": -1, "description": "負數索引"},
+        {"id": 1, "description": "第二個描述"},
+    ])
+    requests = [_request(n) for n in range(1, 4)]
+
+    results = generator.generate_descriptions_packed(requests)
+
+    assert provider.calls == 1  # 只有 id 2 需要逐一生成
+    assert [result.generated_description for result in results[:2]] == ["第一個描述", "第二個描述"]
+    assert "超出範圍" not in results[2].generated_description
+    assert "負數索引" not in results[2].generated_description
+    assert results[2].success
+
+
+def test_parse_packed_response():
+    parse = LLMDescriptionGeneratorV2._parse_packed_response
+    assert parse(_packed([{"id": "2", "description": " 描述 "}, {"id": 0, "description": ""}])) == {2: "描述"}
+    assert parse("not json") == {}
+    assert parse(_packed([{"description": "缺少 id"}])) == {}
+
+
+# ==================== 批次內去重 ====================
+
+_BATCH_METHODS = {
+    "generate_descriptions": lambda generator, requests: generator.generate_descriptions(requests),
+    "abatch_generate_descriptions": lambda generator, requests: asyncio.run(
+        generator.abatch_generate_descriptions(requests)),
+    "batch_generate_descriptions_threaded": lambda generator, requests: generator.batch_generate_descriptions_threaded(
+        requests, max_workers=4),
+}
+
+
+@pytest.mark.parametrize("method", list(_BATCH_METHODS))
+def test_duplicate_requests_reach_provider_once(generator, provider, method):
+    # 內容相同但為不同物件的請求也視為重複
+    requests = [_request(1), _request(2), _request(1), _request(3), _request(2), _request(1)]
+
+    results = _BATCH_METHODS[method](generator, requests)
+
+    assert provider.calls == 3
+    assert len(results) == len(requests)
+    assert all(result is not None and result.success for result in results)
+    assert [result.original_caption for result in results] == [r.caption_text for r in requests]
+    assert results[2] == results[0] and results[5] == results[0]
+    assert results[4] == results[1]
+
+
+def test_abatch_reports_duplicates_to_on_result(generator, provider):
+    requests = [_request(1), _request(1), _request(2)]
+    reported = {}
+
+    results = asyncio.run(generator.abatch_generate_descriptions(
+        requests, on_result=lambda i, result: reported.setdefault(i, result)))
+
+    assert provider.calls == 2
+    assert reported == dict(enumerate(results))
+
+
+# ==================== 描述快取 ====================
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = SQLiteCache(str(tmp_path / "descriptions.sqlite3"))
+    yield cache
+    cache.close()
+
+
+@pytest.fixture
+def cached_generator(provider, cache):
+    generator = LLMDescriptionGeneratorV2("mock", cache=cache)
+    generator.llm_manager.current_provider = provider
+    return generator
+
+
+def test_identical_request_is_served_from_cache(cached_generator, provider):
+    first = cached_generator.generate_description(_request(1))
+    second = cached_generator.generate_description(_request(1))
+
+    assert provider.calls == 1
+    assert second.success
+    assert second.generated_description == first.generated_description
+    stats = cached_generator.get_usage_statistics()
+    assert stats["cache_hits"] == 1
+    assert stats["total_requests"] == 2
+
+    # 批次介面同樣先查快取
+    results = cached_generator.generate_descriptions([_request(1), _request(2)])
+    assert provider.calls == 2
+    assert cached_generator.cache_hits == 2
+    assert results[0].generated_description == first.generated_description
+
+
+def test_failures_are_not_cached(cached_generator, provider):
+    provider.fail = True
+    assert not cached_generator.generate_description(_request(1)).success
+
+    provider.fail = False
+    assert cached_generator.generate_description(_request(1)).success
+    assert provider.calls == 2
+    assert cached_generator.cache_hits == 0
+
+
+def test_cache_key_includes_provider():
+    assert make_cache_key(_request(1), "MockLLM") == make_cache_key(_request(1), "MockLLM")
+    assert make_cache_key(_request(1), "MockLLM") != make_cache_key(_request(1), "OpenAI")
+    assert make_cache_key(_request(1), "MockLLM") != make_cache_key(_request(2), "MockLLM")
+
+
+def test_sqlite_cache_survives_pickle(cache, cached_generator):
+    cache.set("key", {"value": "描述"})
+
+    clone = pickle.loads(pickle.dumps(cache))
+    try:
+        assert clone.get("key") == {"value": "描述"}
+        clone.set("other", {"value": "子行程寫入"})
+        assert cache.get("other") == {"value": "子行程寫入"}
+    finally:
+        clone.close()
+
+    # 生成器傳到子行程時以同一個快取檔案重建
+    cached_generator.generate_description(_request(1))
+    generator_clone = pickle.loads(pickle.dumps(cached_generator))
+    try:
+        assert isinstance(generator_clone.cache, SQLiteCache)
+        assert generator_clone.generate_description(_request(1)).success
+        assert generator_clone.cache_hits == 1
+    finally:
+        generator_clone.cache.close()
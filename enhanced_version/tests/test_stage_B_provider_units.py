@@ -0,0 +1,327 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+階段B單元測試：LLM提供者層的速率限制、重試與 Batch API
+"""
+
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from enhanced_version.backend import llm_providers_sB as providers
+
+
+class FakeClock:
+    """取代 time.monotonic 的可控時鐘；sleep 直接推進時間並記錄等待秒數"""
+
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float) -> None:
+        self.now += seconds
+
+    def sleep(self, seconds: float) -> None:
+        self.sleeps.append(seconds)
+        self.advance(seconds)
+
+    async def asleep(self, seconds: float) -> None:
+        self.sleep(seconds)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(providers.time, "monotonic", clock)
+    monkeypatch.setattr(providers.time, "sleep", clock.sleep)
+    return clock
+
+
+# ==================== 速率限制 ====================
+
+def test_rpm_exhaustion_returns_delay(clock):
+    limiter = providers.RateLimiter(requests_per_minute=60, tokens_per_minute=100000)
+
+    for _ in range(60):
+        assert limiter._try_take(10) == 0
+    # 每秒補充 1 個請求額度，用完後需等待 1 秒
+    assert limiter._try_take(10) == pytest.approx(1.0)
+
+    clock.advance(0.25)
+    assert limiter._try_take(10) == pytest.approx(0.75)
+
+
+def test_tpm_exhaustion_returns_delay(clock):
+    limiter = providers.RateLimiter(requests_per_minute=1000, tokens_per_minute=600)
+
+    assert limiter._try_take(500) == 0
+    # 剩 100 個 token，每秒補充 10 個，取得 300 個需等待 20 秒
+    assert limiter._try_take(300) == pytest.approx(20.0)
+
+
+def test_refill_restores_capacity(clock):
+    limiter = providers.RateLimiter(requests_per_minute=60, tokens_per_minute=100000)
+    for _ in range(60):
+        limiter._try_take(0)
+    assert limiter._try_take(0) > 0
+
+    clock.advance(1.0)
+    assert limiter._try_take(0) == 0
+    assert limiter._try_take(0) > 0
+
+    # 補充量不會超過容量
+    clock.advance(1000)
+    for _ in range(60):
+        assert limiter._try_take(0) == 0
+    assert limiter._try_take(0) > 0
+
+
+def test_estimate_above_capacity_is_clamped(clock):
+    """估計 token 數超過每分鐘上限時以整桶計算，不會永遠等待"""
+    limiter = providers.RateLimiter(requests_per_minute=1000, tokens_per_minute=1000)
+
+    assert limiter._try_take(5000) == 0
+    assert limiter.token_bucket.tokens == 0
+    assert limiter._try_take(5000) == pytest.approx(60.0)
+
+    limiter.acquire_sync(est_tokens=5000)
+    assert clock.sleeps == [pytest.approx(60.0)]
+
+
+def test_acquire_waits_for_refill(clock, monkeypatch):
+    monkeypatch.setattr(providers.asyncio, "sleep", clock.asleep)
+    limiter = providers.RateLimiter(requests_per_minute=2, tokens_per_minute=100000)
+
+    async def take_three():
+        for _ in range(3):
+            await limiter.acquire(est_tokens=10)
+
+    asyncio.run(take_three())
+    # 每分鐘 2 個請求，第三個請求需等待 30 秒補充 1 個額度
+    assert clock.sleeps == [pytest.approx(30.0)]
+    assert clock.now == pytest.approx(30.0)
+
+
+# ==================== 重試 ====================
+
+class StubCompletions:
+    """依序拋出 errors 中的例外，用完後回傳 result；記錄呼叫次數"""
+
+    def __init__(self, errors, result="ok"):
+        self.errors = list(errors)
+        self.result = result
+        self.calls = 0
+
+    def create(self, **kwargs):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return self.result
+
+
+class AsyncStubCompletions(StubCompletions):
+    async def create(self, **kwargs):
+        return StubCompletions.create(self, **kwargs)
+
+
+class StubClient:
+    def __init__(self, completions):
+        self.chat = type("Chat", (), {"completions": completions})()
+
+
+def _openai_errors():
+    """建立 openai 的暫時性錯誤與不可重試錯誤（需安裝 openai 與 httpx）"""
+    openai = pytest.importorskip("openai")
+    httpx = pytest.importorskip("httpx")
+    request = httpx.Request("POST", "https://api.openai.com/v1/chat/completions")
+    return {
+        "rate_limit": openai.RateLimitError("rate limited", response=httpx.Response(429, request=request), body=None),
+        "connection": openai.APIConnectionError(request=request),
+        "auth": openai.AuthenticationError("bad key", response=httpx.Response(401, request=request), body=None),
+    }
+
+
+@pytest.fixture
+def openai_provider(monkeypatch):
+    """重試間隔設為 0 的 OpenAI 提供者（判斷可否重試需要 openai 套件）"""
+    pytest.importorskip("openai")
+    monkeypatch.setattr(providers, "_retry_delay", lambda attempt: 0)
+    return providers.OpenAIProvider()
+
+
+def _use_stub(provider, completions):
+    provider._client = StubClient(completions)
+    provider._aclient = type("AsyncClientStub", (), {"get": lambda self: StubClient(completions)})()
+
+
+@pytest.mark.parametrize("kind", ["rate_limit", "connection"])
+def test_retriable_errors_are_retried(openai_provider, kind):
+    errors = _openai_errors()
+
+    completions = StubCompletions([errors[kind]] * 2)
+    _use_stub(openai_provider, completions)
+    assert openai_provider._do_call(10, model="m") == "ok"
+    assert completions.calls == 3
+
+    completions = StubCompletions([errors[kind]] * providers.RETRY_MAX_ATTEMPTS)
+    _use_stub(openai_provider, completions)
+    with pytest.raises(type(errors[kind])):
+        openai_provider._do_call(10, model="m")
+    assert completions.calls == providers.RETRY_MAX_ATTEMPTS
+
+
+@pytest.mark.parametrize("kind", ["rate_limit", "connection"])
+def test_retriable_errors_are_retried_async(openai_provider, kind):
+    errors = _openai_errors()
+
+    completions = AsyncStubCompletions([errors[kind]] * providers.RETRY_MAX_ATTEMPTS)
+    _use_stub(openai_provider, completions)
+    with pytest.raises(type(errors[kind])):
+        asyncio.run(openai_provider._ado_call(10, model="m"))
+    assert completions.calls == providers.RETRY_MAX_ATTEMPTS
+
+    completions = AsyncStubCompletions([errors[kind]])
+    _use_stub(openai_provider, completions)
+    assert asyncio.run(openai_provider._ado_call(10, model="m")) == "ok"
+    assert completions.calls == 2
+
+
+@pytest.mark.parametrize("make_error", [lambda: _openai_errors()["auth"], lambda: ValueError("bad request")],
+                         ids=["auth", "value_error"])
+def test_non_retriable_errors_are_raised_immediately(openai_provider, make_error):
+    error = make_error()
+
+    completions = StubCompletions([error])
+    _use_stub(openai_provider, completions)
+    with pytest.raises(type(error)):
+        openai_provider._do_call(10, model="m")
+    assert completions.calls == 1
+
+    completions = AsyncStubCompletions([error])
+    _use_stub(openai_provider, completions)
+    with pytest.raises(type(error)):
+        asyncio.run(openai_provider._ado_call(10, model="m"))
+    assert completions.calls == 1
+
+
+# ==================== Batch API ====================
+
+class StubBatchClient:
+    """Batch API 的替身：記錄上傳的請求，依序回傳 statuses 中的狀態（停在最後一個）"""
+
+    def __init__(self, statuses, output_lines=()):
+        self.statuses = list(statuses)
+        self.output_lines = list(output_lines)
+        self.uploaded = []
+        self.polls = 0
+        self.files = SimpleNamespace(create=self._upload, content=self._content)
+        self.batches = SimpleNamespace(create=lambda **kwargs: SimpleNamespace(id="batch-1"),
+                                       retrieve=self._retrieve)
+
+    def _upload(self, file, purpose):
+        self.uploaded = [json.loads(line) for line in file.read().decode("utf-8").splitlines()]
+        return SimpleNamespace(id="file-in")
+
+    def _content(self, file_id):
+        return SimpleNamespace(text="\n".join(self.output_lines))
+
+    def _retrieve(self, batch_id):
+        self.polls += 1
+        status = self.statuses.pop(0) if len(self.statuses) > 1 else self.statuses[0]
+        return SimpleNamespace(status=status, output_file_id="file-out" if self.output_lines else None)
+
+
+def _batch_record(custom_id, content, total_tokens=10):
+    return json.dumps({
+        "custom_id": str(custom_id),
+        "response": {"status_code": 200, "body": {
+            "choices": [{"message": {"content": f" {content} "}}],
+            "usage": {"prompt_tokens": total_tokens - 2, "completion_tokens": 2, "total_tokens": total_tokens}
+        }},
+        "error": None
+    }, ensure_ascii=False)
+
+
+def _batch_provider(client):
+    provider = providers.OpenAIProvider()
+    provider._client = client
+    return provider
+
+
+def test_submit_batch_uploads_one_line_per_request():
+    client = StubBatchClient(["validating"])
+    provider = _batch_provider(client)
+    requests = [providers.LLMRequest(prompt=f"提示 {i}", system_message="系統") for i in range(3)]
+
+    assert provider.submit_batch(requests) == "batch-1"
+    assert [line["custom_id"] for line in client.uploaded] == ["0", "1", "2"]
+    assert client.uploaded[2]["body"]["messages"][-1] == {"role": "user", "content": "提示 2"}
+    assert client.uploaded[0]["url"] == "/v1/chat/completions"
+
+
+def test_fetch_batch_results_orders_by_custom_id():
+    client = StubBatchClient(["completed"], [_batch_record(2, "二"), _batch_record(0, "零", 12), "", _batch_record(1, "一")])
+    provider = _batch_provider(client)
+
+    responses = provider.fetch_batch_results("batch-1", 3)
+
+    assert [response.content for response in responses] == ["零", "一", "二"]
+    assert all(response.success for response in responses)
+    assert responses[0].token_usage == {"prompt_tokens": 10, "completion_tokens": 2, "total_tokens": 12}
+
+
+def test_fetch_batch_results_marks_errors_and_missing_records():
+    errored = json.dumps({"custom_id": "1", "response": None, "error": {"code": "server_error", "message": "boom"}})
+    no_choices = json.dumps({"custom_id": "3", "response": {"status_code": 400, "body": {"error": {"message": "bad"}}}})
+    client = StubBatchClient(["completed"], [_batch_record(0, "零"), errored, no_choices])
+    provider = _batch_provider(client)
+
+    responses = provider.fetch_batch_results("batch-1", 4)
+
+    assert [response.success for response in responses] == [True, False, False, False]
+    for response in responses[1:]:
+        assert response.content == ""
+        assert "batch-1" in response.error_message
+
+
+def _batch_generator(client):
+    from enhanced_version.backend.llm_description_generator_v2_sB import DescriptionRequest, LLMDescriptionGeneratorV2
+
+    generator = LLMDescriptionGeneratorV2("mock")
+    generator.llm_manager.current_provider = _batch_provider(client)
+    requests = [
+        DescriptionRequest(caption_text=f"圖{n} 說明", caption_type="圖", caption_number=str(n),
+                           related_context=[], page_number=1)
+        for n in range(1, 4)
+    ]
+    return generator, requests
+
+
+def test_batch_api_polls_until_terminal_status():
+    client = StubBatchClient(["validating", "in_progress", "finalizing", "completed"],
+                             [_batch_record(1, "描述二"), _batch_record(0, "描述一"), _batch_record(2, "描述三")])
+    generator, requests = _batch_generator(client)
+
+    results = generator.batch_generate_descriptions(requests, mode="batch_api", poll_interval=0)
+
+    assert client.polls == 5  # 4 次輪詢 + 下載結果時取得一次
+    assert [result.generated_description for result in results] == ["描述一", "描述二", "描述三"]
+    assert [result.original_caption for result in results] == [r.caption_text for r in requests]
+    assert all(result.success for result in results)
+
+
+def test_batch_api_failed_job_returns_failed_results():
+    client = StubBatchClient(["in_progress", "failed"])
+    generator, requests = _batch_generator(client)
+
+    results = generator.batch_generate_descriptions(requests, mode="batch_api", poll_interval=0)
+
+    assert client.polls == 3
+    assert len(results) == len(requests)
+    assert not any(result.success for result in results)
+    assert all("failed" in result.error_message for result in results)
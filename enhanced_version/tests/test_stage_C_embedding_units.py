@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+階段C單元測試：OpenAI 嵌入用戶端的分批、順序與快取（以替身用戶端取代 API）
+"""
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from enhanced_version.backend.embedding_client_sC import OpenAIEmbeddingClient, _batched, _estimate_tokens
+from enhanced_version.backend.result_cache_sC import DiskCacheManager
+
+
+class StubEmbeddings:
+    """embeddings.create 的替身：向量為 [文字長度]，回應項目以反向順序回傳"""
+
+    def __init__(self):
+        self.inputs = []
+
+    async def create(self, model, input):
+        self.inputs.append(list(input))
+        data = [SimpleNamespace(index=i, embedding=[float(len(text))]) for i, text in enumerate(input)]
+        return SimpleNamespace(data=data[::-1])
+
+
+@pytest.fixture
+def stub_embeddings():
+    return StubEmbeddings()
+
+
+def _client(stub_embeddings, **kwargs) -> OpenAIEmbeddingClient:
+    client = OpenAIEmbeddingClient(**kwargs)
+    client._async_client = lambda: SimpleNamespace(embeddings=stub_embeddings)
+    return client
+
+
+# ==================== 分批 ====================
+
+def test_batched_respects_count():
+    texts = [f"t{i}" for i in range(10)]
+    batches = _batched(texts, batch_size=4, token_budget=10000)
+    assert [len(batch) for batch in batches] == [4, 4, 2]
+    assert [text for batch in batches for text in batch] == texts
+
+
+def test_batched_respects_token_budget():
+    texts = ["a" * 40, "b" * 40, "c" * 40, "d"]  # 估計 11, 11, 11, 1 個 token
+    budget = _estimate_tokens(texts[0]) * 2
+    batches = _batched(texts, batch_size=100, token_budget=budget)
+    assert batches == [texts[:2], texts[2:]]
+    for batch in batches:
+        assert sum(map(_estimate_tokens, batch)) <= budget
+
+
+def test_batched_keeps_oversized_text_alone():
+    """單一文字超過 token 預算時自成一批，不會被丟棄或造成空批次"""
+    texts = ["x" * 400, "y"]
+    assert _batched(texts, batch_size=100, token_budget=10) == [["x" * 400], ["y"]]
+
+
+# ==================== 嵌入 ====================
+
+def test_create_embeddings_keeps_input_order(stub_embeddings):
+    client = _client(stub_embeddings, batch_size=2)
+    texts = ["ccc", "a", "ccc", "bb", "a", "dddd"]
+
+    vectors = asyncio.run(client.create_embeddings(texts))
+
+    assert vectors == [[float(len(text))] for text in texts]
+    # 重複的文字只送出一次，分批不跨越 batch_size
+    sent = [text for batch in stub_embeddings.inputs for text in batch]
+    assert sorted(sent) == sorted(set(texts))
+    assert all(len(batch) <= 2 for batch in stub_embeddings.inputs)
+
+
+def test_cached_texts_are_not_resent(stub_embeddings, tmp_path):
+    cache = DiskCacheManager(directory=str(tmp_path))
+    client = _client(stub_embeddings, cache=cache)
+
+    asyncio.run(client.create_embeddings(["a", "bb"]))
+    assert stub_embeddings.inputs == [["a", "bb"]]
+
+    vectors = asyncio.run(client.create_embeddings(["bb", "ccc", "a"]))
+    assert vectors == [[2.0], [3.0], [1.0]]
+    assert stub_embeddings.inputs[1:] == [["ccc"]]
+
+    # 全部命中快取時不送出任何請求
+    asyncio.run(client.create_embeddings(["ccc", "a"]))
+    assert len(stub_embeddings.inputs) == 2
+    cache.close()
+
+
+def test_cache_key_depends_on_model(stub_embeddings):
+    small = _client(stub_embeddings, model="text-embedding-3-small")
+    large = _client(stub_embeddings, model="text-embedding-3-large")
+    assert small._cache_key("a") != large._cache_key("a")
@@ -6,18 +6,12 @@
 """
 
 import sys
+import asyncio
 import os
 from pathlib import Path
 
-# 設定 UTF-8 編碼輸出
-if sys.platform == "win32":
-    try:
-        sys.stdout.reconfigure(encoding='utf-8')
-        sys.stderr.reconfigure(encoding='utf-8')
-    except:
-        import codecs
-        sys.stdout = codecs.getwriter('utf-8')(sys.stdout.buffer)
-        sys.stderr = codecs.getwriter('utf-8')(sys.stderr.buffer)
+# 設定 UTF-8 編碼輸出（以腳本直接執行時不會載入 conftest.py）
+import _utf8_setup  # noqa: F401
 
 # 添加路徑
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
@@ -98,7 +92,7 @@ def test_enhanced_rag_helper():
             print(f"\n🔄 測試向量化準備...")
             try:
                 # 注意：這裡會嘗試建立向量資料庫，需要OpenAI API
-                helper.load_and_prepare_enhanced(rebuild_index=True)
+                asyncio.run(helper.load_and_prepare_enhanced(rebuild_index=True))
                 print("✅ 向量資料庫建立成功")
             except Exception as e:
                 print(f"⚠️ 向量化跳過 (需要OpenAI API): {str(e)[:100]}...")
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+階段C單元測試：增強型RAG的向量索引建立（以固定向量的替身嵌入取代 API）
+
+需要 faiss、numpy 與 LangChain；未安裝時整個檔案略過。
+"""
+
+import pytest
+
+np = pytest.importorskip("numpy")
+faiss = pytest.importorskip("faiss")
+pytest.importorskip("langchain_community")
+pytest.importorskip("langchain_text_splitters")
+rag_module = pytest.importorskip("enhanced_version.backend.enhanced_rag_helper_sC")
+
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+DIMENSION = 8
+
+
+class FakeEmbeddings(Embeddings):
+    """文字 "doc-<n>" 對應以 n 為種子的固定隨機向量；查詢與文件使用同一對應"""
+
+    @staticmethod
+    def _vector(text: str):
+        return np.random.default_rng(int(text.rsplit("-", 1)[1])).standard_normal(DIMENSION).tolist()
+
+    def embed_documents(self, texts):
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text):
+        return self._vector(text)
+
+
+def _helper():
+    """只設定建立向量索引所需屬性的 EnhancedRAGHelper（不初始化 RAG Helper 與處理器）"""
+    helper = rag_module.EnhancedRAGHelper.__new__(rag_module.EnhancedRAGHelper)
+    helper.chunk_size = 300
+    helper.chunk_overlap = 50
+    helper.embedding_client = FakeEmbeddings()
+    helper.rag_helper = None
+    helper.logger = rag_module.logger
+    return helper
+
+
+def _documents(count: int):
+    return [Document(page_content=f"doc-{n}", metadata={"page": n}) for n in range(count)]
+
+
+@pytest.fixture
+def low_ivf_threshold(monkeypatch):
+    monkeypatch.setattr(rag_module, "IVF_MIN_VECTORS", 256)
+
+
+@pytest.mark.usefixtures("low_ivf_threshold")
+def test_small_corpus_uses_flat_index():
+    vectorstore = _helper()._build_vectorstore(_documents(200))
+    assert isinstance(vectorstore.index, faiss.IndexFlatL2)
+    assert vectorstore.index.ntotal == 200
+
+
+@pytest.mark.usefixtures("low_ivf_threshold")
+def test_large_corpus_uses_trained_ivf_index(tmp_path):
+    count = 1089  # nlist = √1089 = 33，nprobe = 33 // 16 = 2
+    vectorstore = _helper()._build_vectorstore(_documents(count))
+
+    index = vectorstore.index
+    assert isinstance(index, faiss.IndexIVFFlat)
+    assert index.is_trained
+    assert index.ntotal == count
+    assert index.nlist == 33
+    assert index.nprobe == 2
+
+    for n in (0, 123, count - 1):
+        [found] = vectorstore.similarity_search(f"doc-{n}", k=1)
+        assert found.page_content == f"doc-{n}"
+        assert found.metadata == {"page": n}
+
+    # nprobe 隨索引一起保存與載入
+    from langchain_community.vectorstores import FAISS
+    vectorstore.save_local(str(tmp_path))
+    loaded = FAISS.load_local(str(tmp_path), FakeEmbeddings(), allow_dangerous_deserialization=True)
+    assert faiss.extract_index_ivf(loaded.index).nprobe == 2
+    assert loaded.similarity_search("doc-123", k=1)[0].page_content == "doc-123"
@@ -0,0 +1,342 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+階段D單元測試：Web API 的密碼雜湊、登入升級流程、問題批次、JWT 驗證快取與生命週期
+
+需要 fastapi、PyJWT 與 python-dotenv；未安裝時整個檔案略過。
+"""
+
+import asyncio
+import hashlib
+import os
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import pytest
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+
+
+@pytest.fixture(scope="module")
+def web():
+    """匯入 Web API 模組（前端靜態檔以相對路徑 ../frontend 掛載，需在 backend 目錄下匯入）"""
+    for name in ("fastapi", "jwt", "dotenv"):
+        pytest.importorskip(name)
+    cwd = os.getcwd()
+    os.chdir(BACKEND_DIR)
+    try:
+        return pytest.importorskip("enhanced_version.backend.enhanced_main_web_sD")
+    finally:
+        os.chdir(cwd)
+
+
+@pytest.fixture
+def fast_hashing(web, monkeypatch):
+    """降低 KDF 成本並清空驗證快取，讓每個測試獨立且快速"""
+    monkeypatch.setattr(web, "BCRYPT_ROUNDS", 4)
+    monkeypatch.setattr(web, "PBKDF2_ITERATIONS", 1000)
+    monkeypatch.setattr(web, "_password_cache", {})
+    return web
+
+
+@pytest.fixture
+def user_db(fast_hashing, tmp_path, monkeypatch):
+    """以暫存資料庫取代 lifespan 建立的連線池"""
+    web = fast_hashing
+    monkeypatch.setattr(web, "DATABASE_PATH", str(tmp_path / "users.db"))
+    web.init_database()
+    pool = web.SQLiteConnectionPool(web.DATABASE_PATH, size=2)
+    monkeypatch.setattr(web, "db_pool", pool)
+    yield web
+    pool.close()
+
+
+def _stored_hash(web, username: str) -> str:
+    with web.get_conn() as conn:
+        return conn.execute("SELECT password_hash FROM users WHERE username = ?", (username,)).fetchone()[0]
+
+
+# ==================== 密碼雜湊 ====================
+
+def test_bcrypt_round_trip(fast_hashing, monkeypatch):
+    web = fast_hashing
+    pytest.importorskip("bcrypt")
+    monkeypatch.setattr(web, "BCRYPT_AVAILABLE", True)
+
+    hashed = web.hash_password("正確的密碼")
+    assert hashed.startswith("$2")
+    assert not web.is_legacy_password_hash(hashed)
+    assert web._check_password_hash("正確的密碼", hashed)
+    assert not web._check_password_hash("錯誤的密碼", hashed)
+
+
+def test_pbkdf2_round_trip(fast_hashing, monkeypatch):
+    web = fast_hashing
+    monkeypatch.setattr(web, "BCRYPT_AVAILABLE", False)
+
+    hashed = web.hash_password("正確的密碼")
+    assert hashed.startswith("pbkdf2_sha256$1000$")
+    assert not web.is_legacy_password_hash(hashed)
+    assert web._check_password_hash("正確的密碼", hashed)
+    assert not web._check_password_hash("錯誤的密碼", hashed)
+    # 每次雜湊使用不同的鹽
+    assert web.hash_password("正確的密碼") != hashed
+
+
+def test_bcrypt_rejects_password_over_limit(fast_hashing, monkeypatch):
+    """超過 72 位元組的密碼對 bcrypt 雜湊一律視為不符（不截斷比對、也不拋出例外）"""
+    web = fast_hashing
+    pytest.importorskip("bcrypt")
+    monkeypatch.setattr(web, "BCRYPT_AVAILABLE", True)
+
+    password = "a" * web.MAX_PASSWORD_BYTES
+    hashed = web.hash_password(password)
+    assert web._check_password_hash(password, hashed)
+    assert not web._check_password_hash(password + "a", hashed)
+    assert not web.verify_password(password + "a", hashed, "alice")
+
+
+# ==================== 驗證快取 ====================
+
+def test_failed_verification_is_not_cached(fast_hashing, monkeypatch):
+    web = fast_hashing
+    calls = []
+
+    def check(password, hashed):
+        calls.append(password)
+        return password == "right"
+
+    monkeypatch.setattr(web, "_check_password_hash", check)
+
+    assert not web.verify_password("wrong", "stored", "alice")
+    assert not web.verify_password("wrong", "stored", "alice")
+    assert len(calls) == 2
+    assert web._password_cache == {}
+
+    # 成功的結果才會快取，短時間內重試不再執行 KDF
+    assert web.verify_password("right", "stored", "alice")
+    assert web.verify_password("right", "stored", "alice")
+    assert len(calls) == 3
+
+
+# ==================== 註冊與登入 ====================
+
+def test_register_rejects_password_over_limit(user_db):
+    web = user_db
+    user = web.UserCreate(username="alice", password="密" * 25)  # 75 位元組
+
+    with pytest.raises(web.HTTPException) as excinfo:
+        asyncio.run(web.register(user))
+    assert excinfo.value.status_code == 400
+    with web.get_conn() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM users").fetchone()[0] == 0
+
+
+def test_register_then_login(user_db):
+    web = user_db
+    asyncio.run(web.register(web.UserCreate(username="alice", password="secret")))
+    assert not web.is_legacy_password_hash(_stored_hash(web, "alice"))
+
+    response = asyncio.run(web.login(web.UserLogin(username="alice", password="secret")))
+    assert response["token_type"] == "bearer"
+
+    with pytest.raises(web.HTTPException) as excinfo:
+        asyncio.run(web.login(web.UserLogin(username="alice", password="wrong")))
+    assert excinfo.value.status_code == 401
+
+
+def test_legacy_hash_is_upgraded_on_login(user_db):
+    web = user_db
+    legacy_hash = hashlib.sha256("secret".encode()).hexdigest()
+    with web.get_writer_conn() as conn:
+        conn.execute(
+            "INSERT INTO users (user_id, username, password_hash) VALUES (?, ?, ?)",
+            ("user-1", "bob", legacy_hash)
+        )
+        conn.commit()
+    assert web.is_legacy_password_hash(legacy_hash)
+    assert web.verify_password("secret", legacy_hash, "bob")
+
+    # 錯誤密碼不會觸發升級
+    with pytest.raises(web.HTTPException):
+        asyncio.run(web.login(web.UserLogin(username="bob", password="wrong")))
+    assert _stored_hash(web, "bob") == legacy_hash
+
+    asyncio.run(web.login(web.UserLogin(username="bob", password="secret")))
+    upgraded_hash = _stored_hash(web, "bob")
+    assert upgraded_hash != legacy_hash
+    assert not web.is_legacy_password_hash(upgraded_hash)
+    assert web._check_password_hash("secret", upgraded_hash)
+
+    # 升級後以新雜湊登入
+    asyncio.run(web.login(web.UserLogin(username="bob", password="secret")))
+    assert _stored_hash(web, "bob") == upgraded_hash
+
+
+# ==================== 問題批次 ====================
+
+class RecordingHandler:
+    """QueryBatcher 的處理函式替身：記錄每個批次，回答為問題的大寫；error 不為 None 時整批拋出"""
+
+    def __init__(self, error=None):
+        self.batches = []
+        self.error = error
+
+    async def __call__(self, questions):
+        self.batches.append(list(questions))
+        if self.error is not None:
+            raise self.error
+        return [ValueError(question) if question.startswith("bad") else question.upper() for question in questions]
+
+
+def _run_batcher(web, handler, questions, **kwargs):
+    """啟動批次器、同時送出所有問題，回傳各問題的結果或例外"""
+    async def scenario():
+        batcher = web.QueryBatcher(handler, **kwargs)
+        batcher.start()
+        try:
+            return await asyncio.wait_for(
+                asyncio.gather(*(batcher.submit(question) for question in questions), return_exceptions=True),
+                timeout=5)
+        finally:
+            await batcher.stop()
+
+    return asyncio.run(scenario())
+
+
+def test_batcher_flushes_when_batch_is_full(web):
+    handler = RecordingHandler()
+    questions = [f"q{i}" for i in range(web.QUERY_BATCH_SIZE + 1)]
+
+    # 等待時間設得很長：前 16 個問題必須因批次已滿而立即送出
+    results = _run_batcher(web, handler, questions, max_wait=3)
+
+    assert [len(batch) for batch in handler.batches] == [web.QUERY_BATCH_SIZE, 1]
+    assert results == [question.upper() for question in questions]
+
+
+def test_batcher_flushes_after_max_wait(web):
+    handler = RecordingHandler()
+    loop_time = []
+
+    async def timed(questions):
+        loop_time.append(asyncio.get_running_loop().time())
+        return await handler(questions)
+
+    async def scenario():
+        batcher = web.QueryBatcher(timed)
+        batcher.start()
+        try:
+            start = asyncio.get_running_loop().time()
+            results = await asyncio.wait_for(asyncio.gather(batcher.submit("a"), batcher.submit("b")), timeout=5)
+            return start, results
+        finally:
+            await batcher.stop()
+
+    start, results = asyncio.run(scenario())
+
+    assert handler.batches == [["a", "b"]]
+    assert results == ["A", "B"]
+    assert loop_time[0] - start >= web.QUERY_BATCH_MAX_WAIT * 0.9
+
+
+def test_batcher_delivers_each_result_to_its_own_waiter(web):
+    results = _run_batcher(web, RecordingHandler(), ["x", "bad-y", "z"])
+
+    assert results[0] == "X" and results[2] == "Z"
+    assert isinstance(results[1], ValueError) and str(results[1]) == "bad-y"
+
+
+def test_batch_exception_reaches_every_waiter(web):
+    error = RuntimeError("RAG 引擎錯誤")
+    handler = RecordingHandler(error=error)
+
+    results = _run_batcher(web, handler, ["a", "b", "c"])
+
+    assert handler.batches == [["a", "b", "c"]]
+    assert all(result is error for result in results)
+
+
+# ==================== JWT 驗證快取 ====================
+
+@pytest.fixture
+def token_cache(web, monkeypatch):
+    """清空 token 快取並計算實際執行 jwt.decode 的次數"""
+    monkeypatch.setattr(web, "_token_cache", {})
+    decode = web.jwt.decode
+    calls = []
+
+    def counting_decode(*args, **kwargs):
+        calls.append(args[0])
+        return decode(*args, **kwargs)
+
+    monkeypatch.setattr(web.jwt, "decode", counting_decode)
+    return calls
+
+
+def _credentials(web, token: str):
+    return web.HTTPAuthorizationCredentials(scheme="Bearer", credentials=token)
+
+
+def _verify_fails(web, token: str) -> bool:
+    with pytest.raises(web.HTTPException) as excinfo:
+        web.verify_token(_credentials(web, token))
+    return excinfo.value.status_code == 401
+
+
+def test_valid_token_is_served_from_cache(web, token_cache):
+    token = web.create_access_token({"sub": "user-1"}, timedelta(minutes=5))
+
+    assert web.verify_token(_credentials(web, token)) == "user-1"
+    assert web.verify_token(_credentials(web, token)) == "user-1"
+    assert len(token_cache) == 1
+    # 快取鍵為 token 的雜湊，不保存原始 token
+    assert token.encode() not in web._token_cache
+    assert token not in web._token_cache
+
+
+@pytest.mark.parametrize("make_token", [
+    lambda web: web.create_access_token({"sub": "user-1"}, timedelta(seconds=-10)),
+    lambda web: web.jwt.encode({"sub": "user-1"}, "another-secret-key-of-sufficient-size", algorithm=web.ALGORITHM),
+    lambda web: web.create_access_token({"name": "no-subject"}, timedelta(minutes=5)),
+    lambda web: "not-a-jwt",
+], ids=["expired", "bad_signature", "missing_sub", "malformed"])
+def test_rejected_token_is_never_cached(web, token_cache, make_token):
+    token = make_token(web)
+
+    assert _verify_fails(web, token)
+    assert _verify_fails(web, token)
+    assert len(token_cache) == 2
+    assert web._token_cache == {}
+
+
+def test_cached_token_is_not_served_after_it_expires(web, token_cache, monkeypatch):
+    expire = datetime.now(timezone.utc) + timedelta(seconds=5)
+    token = web.jwt.encode({"sub": "user-1", "exp": expire}, web.SECRET_KEY, algorithm=web.ALGORITHM)
+    exp = int(expire.timestamp())
+
+    assert web.verify_token(_credentials(web, token)) == "user-1"
+    [(_, cached_until)] = web._token_cache.values()
+    assert cached_until <= exp  # 快取存活時間不超過 token 的到期時間
+
+    # token 到期後快取不再命中，改為重新驗證 jwt；已過期的結果也不會再寫入快取
+    monkeypatch.setattr(web.time, "time", lambda: exp + 1)
+    web.verify_token(_credentials(web, token))
+    assert len(token_cache) == 2
+    assert web._token_cache == {}
+
+
+# ==================== 生命週期 ====================
+
+def test_lifespan_creates_and_shuts_down_rag_executor(web, tmp_path, monkeypatch):
+    """執行緒池隨 lifespan 建立與關閉，應用程式可重新啟動（例如測試中多次建立 TestClient）"""
+    monkeypatch.setattr(web, "DATABASE_PATH", str(tmp_path / "users.db"))
+
+    async def serve_once():
+        async with web.lifespan(web.app):
+            assert web.rag_executor is not None
+            assert await web.run_rag_call(sum, [1, 2, 3]) == 6
+        assert web.rag_executor is None
+
+    asyncio.run(serve_once())
+    asyncio.run(serve_once())
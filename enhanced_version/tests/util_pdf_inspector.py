@@ -7,13 +7,8 @@ import fitz  # PyMuPDF
 import re
 from pathlib import Path
 
-# 設定 UTF-8 編碼
-if sys.platform == "win32":
-    try:
-        sys.stdout.reconfigure(encoding='utf-8')
-    except:
-        import codecs
-        sys.stdout = codecs.getwriter('utf-8')(sys.stdout.buffer)
+# 設定 UTF-8 編碼輸出（以腳本直接執行時不會載入 conftest.py）
+import _utf8_setup  # noqa: F401
 
 def get_block_font_info(block):
     """取得區塊的字體資訊"""
@@ -14,15 +14,22 @@ class DocumentProcessor:
         try:
             # 1. 先判斷PDF類型
             pdf_info = classify_pdf_type(file_path)
-            
-            # 2. 根據類型選擇處理策略
+        except Exception as e:
+            self.stats["errors"] += 1
+            return {"error": str(e), "file": file_path}
+        
+        # 2. 根據類型選擇處理策略
+        return self._process_classified(file_path, pdf_info)
+    
+    def _process_classified(self, file_path, pdf_info):
+        """依已知的分類結果選擇處理策略並更新統計"""
+        try:
             if pdf_info['type'] == 'digital':
                 self.stats["digital"] += 1
                 return self._process_digital_pdf(file_path, pdf_info)
             else:
                 self.stats["scanned"] += 1
                 return self._process_scanned_pdf(file_path, pdf_info)
-                
         except Exception as e:
             self.stats["errors"] += 1
             return {"error": str(e), "file": file_path}
@@ -53,14 +60,13 @@ class DocumentProcessor:
         """批量處理 - 適合處理大量文件"""
         print(f"批量處理目錄: {directory}")
         
-        # 先批量分類所有PDF
+        # 先批量分類所有PDF（多行程平行分析）
         classifications = batch_classify_pdfs(directory)
         
-        # 再根據分類結果進行處理
+        # 再直接依分類結果進行處理，不再逐檔重新分類；統計只在主行程更新
         for file_path, classification in classifications.items():
             if "error" not in classification:
-                processed = self.process_document(file_path)
-                self.processed_files[file_path] = processed
+                self.processed_files[file_path] = self._process_classified(file_path, classification)
         
         return self.processed_files
     
@@ -6,21 +6,25 @@
 1. 抽象介面定義，不包含具體實作
 2. 支援依賴注入和測試
 3. 提供清楚的錯誤處理機制
-4. 支援非同步操作
+4. 只有真正等待網路 I/O 的操作（LLM、嵌入 API）使用 async；
+   本機磁碟與 CPU 工作維持同步介面，避免協程與事件迴圈的額外成本
 """
 
+from __future__ import annotations
+
 from abc import ABC, abstractmethod
-from typing import Dict, List, Optional, Any, Union, Protocol
+from typing import TYPE_CHECKING, Dict, List, Optional, Any, Union, Protocol
 from pathlib import Path
 import asyncio
 from datetime import datetime
 
-from .dto import (
-    ProcessingRequest, ProcessingResult, BatchProcessingResult,
-    ServiceInfo, HealthCheckResult, CaptionContextPair,
-    LoggingConfig, CacheConfig
-)
-
+# DTO 只用於型別標註，執行期不載入；需要建立 DTO 的函式自行匯入
+if TYPE_CHECKING:
+    from dto import (
+        ProcessingRequest, ProcessingResult, BatchProcessingResult,
+        ServiceInfo, HealthCheckResult, CaptionContextPair,
+        LoggingConfig, CacheConfig
+    )
 
 # =============================================================================
 # 核心處理介面
@@ -129,31 +133,35 @@ class IRAGIntegrationManager(ABC):
         pass
 
 
-class IVectorStoreManager(ABC):
-    """向量資料庫管理器介面"""
+class IAsyncEmbeddingClient(ABC):
+    """嵌入服務用戶端介面 - 呼叫遠端嵌入 API，是向量化流程中唯一需要非同步的部分"""
     
     @abstractmethod
     async def create_embeddings(self, texts: List[str]) -> List[List[float]]:
-        """建立文字向量"""
+        """建立文字向量（回傳順序與 texts 相同）"""
         pass
+
+
+class IVectorStoreManager(ABC):
+    """向量資料庫管理器介面（本機索引操作，同步執行）"""
     
     @abstractmethod
-    async def add_documents(self, 
-                          texts: List[str], 
-                          metadatas: List[Dict[str, Any]]) -> List[str]:
+    def add_documents(self, 
+                      texts: List[str], 
+                      metadatas: List[Dict[str, Any]]) -> List[str]:
         """添加文件到向量資料庫"""
         pass
     
     @abstractmethod
-    async def search_similar(self, 
-                           query: str, 
-                           k: int = 5,
-                           filter_dict: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+    def search_similar(self, 
+                       query: str, 
+                       k: int = 5,
+                       filter_dict: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
         """相似度搜尋"""
         pass
     
     @abstractmethod
-    async def delete_documents(self, document_ids: List[str]) -> int:
+    def delete_documents(self, document_ids: List[str]) -> int:
         """刪除文件"""
         pass
 
@@ -163,20 +171,20 @@ class IVectorStoreManager(ABC):
 # =============================================================================
 
 class ICacheManager(ABC):
-    """快取管理器介面"""
+    """快取管理器介面（本機快取，同步執行）"""
     
     @abstractmethod
-    async def get_cached_result(self, file_hash: str) -> Optional[ProcessingResult]:
+    def get_cached_result(self, file_hash: str) -> Optional[ProcessingResult]:
         """取得快取的處理結果"""
         pass
     
     @abstractmethod
-    async def cache_result(self, file_hash: str, result: ProcessingResult) -> bool:
+    def cache_result(self, file_hash: str, result: ProcessingResult) -> bool:
         """快取處理結果"""
         pass
     
     @abstractmethod
-    async def clear_expired_cache(self) -> int:
+    def clear_expired_cache(self) -> int:
         """清理過期快取"""
         pass
     
@@ -187,25 +195,25 @@ class ICacheManager(ABC):
 
 
 class IFileManager(ABC):
-    """檔案管理器介面"""
+    """檔案管理器介面（本機檔案操作，同步執行）"""
     
     @abstractmethod
-    async def validate_file(self, file_path: str) -> bool:
+    def validate_file(self, file_path: str) -> bool:
         """驗證檔案有效性"""
         pass
     
     @abstractmethod
-    async def calculate_file_hash(self, file_path: str) -> str:
+    def calculate_file_hash(self, file_path: str) -> str:
         """計算檔案雜湊值"""
         pass
     
     @abstractmethod
-    async def create_backup(self, file_path: str) -> str:
+    def create_backup(self, file_path: str) -> str:
         """建立檔案備份"""
         pass
     
     @abstractmethod
-    async def cleanup_temp_files(self, older_than_hours: int = 24) -> int:
+    def cleanup_temp_files(self, older_than_hours: int = 24) -> int:
         """清理暫存檔案"""
         pass
 
@@ -293,7 +301,8 @@ class IPDFCaptionService(ABC):
                  file_manager: IFileManager,
                  logger: ILogger,
                  metrics: IMetricsCollector,
-                 config_manager: IConfigManager):
+                 config_manager: IConfigManager,
+                 embedding_client: Optional[IAsyncEmbeddingClient] = None):
         """依賴注入建構子"""
         self.rag_manager = rag_manager
         self.vector_store = vector_store
@@ -302,6 +311,7 @@ class IPDFCaptionService(ABC):
         self.logger = logger
         self.metrics = metrics
         self.config = config_manager
+        self.embedding_client = embedding_client
     
     @abstractmethod
     async def initialize(self) -> bool:
@@ -414,7 +424,11 @@ async def validate_service_dependencies(service: IPDFCaptionService) -> List[str
 
 def create_processing_request_from_dict(data: Dict[str, Any]) -> ProcessingRequest:
     """從字典建立處理請求的便利函式"""
-    from .dto import ProcessingRequest, FileInfo, ProcessingConfig
+    # 作為主專案的子套件時使用相對匯入；單獨執行（模組根目錄在 sys.path 上）時直接匯入
+    try:
+        from .dto import ProcessingRequest, FileInfo, ProcessingConfig
+    except ImportError:
+        from dto import ProcessingRequest, FileInfo, ProcessingConfig
     
     file_info = FileInfo(**data.get('file_info', {}))
     config = ProcessingConfig(**data.get('config', {}))
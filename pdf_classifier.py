@@ -1,8 +1,8 @@
 # -*- coding: utf-8 -*-
-import fitz  # PyMuPDF
 import os
 import sys
-from typing import Dict, List
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional
 
 # 設置控制台編碼支援Unicode
 if sys.platform == "win32":
@@ -27,8 +27,10 @@ def classify_pdf_type(pdf_path: str) -> Dict[str, any]:
     if not os.path.exists(pdf_path):
         raise FileNotFoundError(f"PDF 檔案不存在: {pdf_path}")
     
+    import pymupdf  # PyMuPDF（延遲匯入；1.24 起的正式模組名稱，舊名 fitz 已棄用）
+    
     try:
-        doc = fitz.open(pdf_path)
+        doc = pymupdf.open(pdf_path)
     except Exception as e:
         raise ValueError(f"無法開啟 PDF 檔案: {e}")
     
@@ -95,16 +97,28 @@ def classify_pdf_type(pdf_path: str) -> Dict[str, any]:
     }
 
 
-def batch_classify_pdfs(directory_path: str, recursive: bool = True) -> Dict[str, Dict]:
+def _classify_or_error(pdf_path: str) -> Dict[str, any]:
+    """行程池工作函式：分析單一檔案，失敗時回傳 {"error": 訊息} 而非拋出例外"""
+    try:
+        return classify_pdf_type(pdf_path)
+    except Exception as e:
+        return {"error": str(e)}
+
+
+def batch_classify_pdfs(directory_path: str, recursive: bool = True,
+                        max_workers: Optional[int] = None) -> Dict[str, Dict]:
     """
     批量分析目錄中的所有PDF檔案
     
+    各檔案的分析互相獨立，多於一個檔案時以多行程平行分析。
+    
     Args:
         directory_path (str): 目錄路徑
         recursive (bool): 是否遞迴搜尋子目錄
+        max_workers (int): 行程數上限 (可選，預設為 CPU 核心數)
         
     Returns:
-        Dict: {檔案路徑: 分析結果}
+        Dict: {檔案路徑: 分析結果}，順序與搜尋到的檔案順序相同
     """
     import glob
     
@@ -120,14 +134,19 @@ def batch_classify_pdfs(directory_path: str, recursive: bool = True) -> Dict[str
     
     print(f"找到 {len(pdf_files)} 個PDF檔案")
     
-    for pdf_file in pdf_files:
-        try:
-            result = classify_pdf_type(pdf_file)
-            results[pdf_file] = result
+    if len(pdf_files) > 1:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            classified = list(executor.map(_classify_or_error, pdf_files, chunksize=4))
+    else:
+        classified = [_classify_or_error(pdf_file) for pdf_file in pdf_files]
+    
+    # 結果與輸出都在主行程依檔案順序處理
+    for pdf_file, result in zip(pdf_files, classified):
+        results[pdf_file] = result
+        if "error" in result:
+            print(f"❌ {os.path.basename(pdf_file)}: {result['error']}")
+        else:
             print(f"✅ {os.path.basename(pdf_file)}: {result['type']}")
-        except Exception as e:
-            results[pdf_file] = {"error": str(e)}
-            print(f"❌ {os.path.basename(pdf_file)}: {e}")
     
     return results
 